@@ -1,11 +1,42 @@
 from attr import s
 import streamlit as st
-import fitz  # PyMuPDF for PDF
-from openai import OpenAI
-import json
-import re
+from openai import APIError
 import datetime
-
+import functools
+import logging
+import time
+import uuid
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+
+from compare import ClauseIndex, clause_diff, comparison_table
+from doc_cache import DocumentCache, document_hash
+from llm import COMPLETION_TOKENS_ESTIMATE
+from llm_cache import ResponseCache
+from metrics import MetricsRecorder, percentile
+from openai_client import create_client
+from patching import render_diff
+from pipeline import (
+    QUICK_ACTIONS,
+    ContractPipeline,
+    answer_validator,
+    build_retrieval_index,
+    format_parties,
+    validate_metadata_field,
+)
+from prefetch import PrefetchScheduler
+from question_cache import QuestionCache
+from ratelimit import RateLimiter
+from routing import ModelRouter
+from tokens import count_tokens
+
+
+# Surface time-to-first-token and other call timings in the server log
+logging.basicConfig(format="%(asctime)s %(name)s %(levelname)s %(message)s")
+logging.getLogger("llm").setLevel(logging.INFO)
+logger = logging.getLogger("app")
+logger.setLevel(logging.INFO)
 
 # Define password for testing
 # Retrieve the correct password securely from Streamlit secrets
@@ -37,107 +68,495 @@ def check_password():
 
 # Call the function to check authentication
 if check_password():
-    client = OpenAI(api_key=st.secrets["openai_api_key"])
-
-    # Helper function to extract text from PDF
-    def extract_text_from_pdf(pdf_file):
-        pdf_reader = fitz.open(stream=pdf_file.read(), filetype="pdf")
-        return "".join(page.get_text() for page in pdf_reader)
-
-    # Helper function to call OpenAI and return metadata
-    def call_openai_for_metadata(text):
-        metadata_prompt = f"""
-        You are a friendly legal assistant. From the following contract, please extract:
-        - Contract Type
-        - Parties Involved (as a comma-separated string, not a list)
-        - Effective Date
-        - Expiration Date
-        - Brief Summary
-
-        Contract Text:
-        {text}
-
-        Format the output strictly as JSON with these keys:
-        {{
-            "Contract Type": "",
-            "Parties Involved": "",
-            "Effective Date": "",
-            "Expiration Date": "",
-            "Summary Text": ""
-        }}
-        """
-        response = client.chat.completions.create(
-                model="gpt-4o",
-                messages=[{"role": "user", "content": metadata_prompt}]
-            )
-        
-        metadata_text = re.sub(r"```(?:json)?\s*(.*?)```", r"\1", response.choices[0].message.content.strip(), flags=re.DOTALL).strip() 
+    script_started = time.perf_counter()
+
+    # One client and connection pool for every session, so calls reuse kept-alive connections.
+    # Retries are left to the shared rate limiter, which backs off for every session at once.
+    @st.cache_resource
+    def get_openai_client():
+        return create_client(
+            api_key=st.secrets["openai_api_key"],
+            max_connections=st.secrets.get("openai_max_connections", 20),
+            http2=st.secrets.get("openai_http2", False),
+        )
+
+    client = get_openai_client()
+
+    # Shared across sessions so a document is parsed and analysed once per upload
+    @st.cache_resource
+    def get_document_cache():
+        return DocumentCache(
+            max_items=st.secrets.get("doc_cache_size", 32),
+            disk_dir=st.secrets.get("doc_cache_dir"),
+            max_bytes=st.secrets.get("doc_cache_max_mb", 256) * 1024 * 1024,
+        )
+
+    # Clauses of every contract in any workspace, so each is split up once and compared locally
+    @st.cache_resource
+    def get_clause_index():
+        return ClauseIndex(
+            max_documents=st.secrets.get("clause_index_size", 64),
+            max_bytes=st.secrets.get("clause_index_max_mb", 64) * 1024 * 1024,
+        )
+
+    # One SQLite-backed response cache for every session, so identical prompts are paid for once
+    @st.cache_resource
+    def get_response_cache():
+        return ResponseCache(
+            st.secrets.get("llm_cache_path", ".cache/llm_responses.sqlite3"),
+            ttl_seconds=st.secrets.get("llm_cache_ttl_hours", 168) * 3600,
+            max_bytes=st.secrets.get("llm_cache_max_mb", 256) * 1024 * 1024,
+        )
+
+    # Latency, token and cost records for every OpenAI call, shared across sessions
+    @st.cache_resource
+    def get_metrics():
+        return MetricsRecorder(jsonl_path=st.secrets.get("metrics_jsonl_path"))
+
+    # One RPM/TPM budget for the whole process, so concurrent sessions queue instead of hitting 429s
+    @st.cache_resource
+    def get_rate_limiter():
+        return RateLimiter(
+            rpm=st.secrets.get("openai_rpm", 500),
+            tpm=st.secrets.get("openai_tpm", 30000),
+            max_retries=st.secrets.get("openai_max_retries", 6),
+        )
+
+    # Background runs of the Quick Actions most users click next, shared across sessions
+    @st.cache_resource
+    def get_prefetcher():
+        return PrefetchScheduler(
+            max_workers=st.secrets.get("prefetch_workers", 2),
+            token_budget_per_hour=st.secrets.get("prefetch_token_budget_per_hour", 500000),
+        )
+
+    # Seconds taken by recent runs of the whole script and of each section, for the admin panel
+    @st.cache_resource
+    def get_run_timings():
+        return defaultdict(lambda: deque(maxlen=500))
+
+    # Answers to Q&A questions, matched by similarity so rewordings are answered locally
+    @st.cache_resource
+    def get_question_cache():
+        return QuestionCache(
+            threshold=st.secrets.get("qa_cache_threshold", 0.8),
+            max_entries=st.secrets.get("qa_cache_size", 512),
+        )
+
+    doc_cache = get_document_cache()
+    question_cache = get_question_cache()
+    clause_index = get_clause_index()
+    run_timings = get_run_timings()
+    response_cache = get_response_cache()
+    metrics = get_metrics()
+    rate_limiter = get_rate_limiter()
+    prefetcher = get_prefetcher()
+    session_id = st.session_state.setdefault("session_id", uuid.uuid4().hex)
+
+    refresh_responses = st.sidebar.checkbox(
+        "Refresh cached AI responses",
+        help="Ignore stored answers and ask the model again. New answers replace the stored ones.",
+    )
+
+    stream_responses = st.sidebar.checkbox(
+        "Stream responses",
+        value=True,
+        help="Show answers word by word as they are generated.",
+    )
+
+    pipeline = ContractPipeline(
+        client,
+        cache=response_cache,
+        doc_cache=doc_cache,
+        metrics=metrics,
+        refresh=refresh_responses,
+        # Contracts with more tokens than this are processed in parts and merged
+        context_budget=st.secrets.get("context_token_budget", 100000),
+        map_workers=st.secrets.get("map_workers", 4),
+        pdf_workers=st.secrets.get("pdf_workers"),
+        qa_top_k=st.secrets.get("qa_top_k", 5),
+        modify_top_k=st.secrets.get("modify_top_k", 4),
+        limiter=rate_limiter,
+        # Strip running headers/footers, page numbers and hyphenation before prompting
+        normalize=st.secrets.get("normalize_text", True),
+        # Light actions go to a smaller, faster model; failed answers are asked again on a larger one
+        router=ModelRouter(
+            routes=st.secrets.get("model_routes"),
+            tier_models=st.secrets.get("model_tiers"),
+            fallback=st.secrets.get("model_fallback", True),
+        ),
+    )
+
+    AI_UNAVAILABLE = "The AI service is unavailable or over its rate limit right now. Please try again in a minute."
+
+    # Helper function to render an answer in the white result box
+    def render_answer(placeholder, content):
+        placeholder.markdown(
+            f"""
+            <div style="
+                background-color: white;
+                color: black;
+                padding: 15px;
+                border-radius: 8px;
+                border: 1px solid black !important;">
+                {content}
+            </div>
+            """,
+            unsafe_allow_html=True
+        )
+
+    # Helper function to show an answer, streaming tokens into the page as they arrive.
+    # An answer that fails `validate` is replaced by one from a larger model.
+    def show_answer(prompt, placeholder, action, validate=None):
         try:
-            return json.loads(metadata_text)
-        except Exception:
-            return {}
-
-    # Helper function to format parties nicely
-    def format_parties(parties):
-        if isinstance(parties, list):
-            if len(parties) == 2:
-                return " and ".join(parties)
-            elif len(parties) > 2:
-                return ", ".join(parties[:-1]) + ", and " + parties[-1]
-            elif len(parties) == 1:
-                return "Not specified"
-        return parties
-
-
-    # Helper function to validate metafields
-    def validate_metadata_field(field_value, default="Not specified"):
-        if not field_value or field_value.strip().lower() in ["", "not specified", "n/a", "none"]:
-            return default, False
-        return field_value.strip(), True
-
-
-    # Helper function to build display metadata summary for prompts
-    def build_metadata_summary(meta):
-        summary_lines = []
-
-        # Contract Type
-        contract_type, ct_valid = validate_metadata_field(meta.get("Contract Type"))
-        if ct_valid:
-            summary_lines.append(f"Contract Type: {contract_type}")
-
-        # Parties Involved (formatted)
-        parties_raw, pi_valid = validate_metadata_field(meta.get("Parties Involved"))
-        if pi_valid:
-            # Convert to list if comma-separated string
-            if isinstance(parties_raw, str):
-                parties_list = [p.strip() for p in parties_raw.split(",") if p.strip()]
-            elif isinstance(parties_raw, list):
-                parties_list = parties_raw
+            if not stream_responses:
+                content = pipeline.ask(prompt, action, validate=validate)
             else:
-                parties_list = []
+                content = ""
+                last_render = 0.0
+
+                def restart():
+                    nonlocal content
+                    content = ""
+                    placeholder.info("Checking the answer with a larger model...")
+
+                for chunk in pipeline.stream(prompt, action, validate=validate, on_fallback=restart):
+                    content += chunk
+                    # Re-rendering on every token makes long rewrites quadratic; ten frames a second is plenty
+                    if time.perf_counter() - last_render > 0.1:
+                        render_answer(placeholder, content)
+                        last_render = time.perf_counter()
+        except APIError:
+            logger.exception("%s call failed after retries", action)
+            placeholder.error(AI_UNAVAILABLE)
+            return None
+        render_answer(placeholder, content)
+        return content
+
+    # Helper function to fill the metadata panels. While streaming, `done` holds the fields
+    # received so far and the others show as still being extracted.
+    def show_metadata(panels, meta, done=None):
+        def default(key):
+            return "Not specified" if done is None or key in done else "Extracting..."
+
+        contract_type, _ = validate_metadata_field(meta.contract_type, default("contract_type"))
+        parties_involved = format_parties(meta.parties) if meta.parties else default("parties")
+        effective_date, _ = validate_metadata_field(meta.effective_date, default("effective_date"))
+        expiration_date, _ = validate_metadata_field(meta.expiration_date, default("expiration_date"))
+        summary_text, _ = validate_metadata_field(meta.summary, default("summary"))
+
+        panels["Contract Type"].markdown(f"{contract_type}", unsafe_allow_html=True)
+        panels["Parties Involved"].markdown(f"{parties_involved}", unsafe_allow_html=True)
+        dates = f"Effective: {effective_date}\nExpiration: {expiration_date}"
+        panels["Effective and Expiration Dates"].markdown(f"{dates}", unsafe_allow_html=True)
+        panels["Summary"].markdown(f"{summary_text}", unsafe_allow_html=True)
+
+    # Clause index for Q&A, built once per document and shared across sessions
+    @st.cache_resource(max_entries=32)
+    def get_retrieval_index(doc_hash, _pages):
+        return build_retrieval_index(_pages)
+
+    # Helper function to record how long each run of the script or of a section takes
+    def timed(section):
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    run_timings[section].append(time.perf_counter() - started)
+            return wrapper
+        return decorator
+
+    # Helper function to get this session's stored results for a document
+    def document_results(doc_hash):
+        return st.session_state.setdefault("results", {}).setdefault(doc_hash, {})
+
+    # Quick Actions section. The last answer (or full analysis) is stored per document and
+    # shown again on later reruns instead of being cleared.
+    @st.fragment
+    @timed("quick_actions")
+    def quick_actions_section(doc_hash, metadata_summary, text, pages):
+        results = document_results(doc_hash)
+        st.markdown("### Quick Actions")
+        columns = st.columns(len(QUICK_ACTIONS))
+        clicked_action = None
+        for column, action in zip(columns, QUICK_ACTIONS):
+            with column:
+                if st.button(action["label"], key=action["key"]):
+                    clicked_action = action
 
-            formatted_parties = format_parties(parties_list)
-            summary_lines.append(f"Parties Involved: {formatted_parties}")
+        run_full_analysis = st.button("Run Full Analysis", key="btn_full", use_container_width=True)
 
-        # Dates
-        effective_date, ed_valid = validate_metadata_field(meta.get("Effective Date"))
-        if ed_valid:
-            summary_lines.append(f"Effective Date: {effective_date}")
+        answer2_box = st.empty()
 
-        expiration_date, exd_valid = validate_metadata_field(meta.get("Expiration Date"))
-        if exd_valid:
-            summary_lines.append(f"Expiration Date: {expiration_date}")
+        # Quick actions code
+        if clicked_action:
+            with st.spinner(clicked_action["spinner"]):
+                if clicked_action.get("local"):
+                    try:
+                        # Sections the headings don't classify are labelled by the model
+                        answer2 = pipeline.extract_clause_table(doc_hash, text, pages)
+                    except APIError:
+                        logger.exception("Clause classification failed after retries")
+                        answer2_box.error(AI_UNAVAILABLE)
+                        answer2 = None
+                    else:
+                        render_answer(answer2_box, answer2)
+                else:
+                    # A prefetched answer is shown at once; one still running is waited for
+                    prefetched = None if refresh_responses else prefetcher.claim(doc_hash, clicked_action["name"])
+                    answer2 = None
+                    if prefetched is not None:
+                        try:
+                            answer2 = prefetched.result()
+                            render_answer(answer2_box, answer2)
+                        except Exception:
+                            logger.exception("Prefetched %s failed; asking again", clicked_action["name"])
+                    if answer2 is None:
+                        try:
+                            # Contracts over the context budget are condensed part by part first
+                            prompt = pipeline.prepare_quick_action_prompt(
+                                clicked_action, metadata_summary, text, pages
+                            )
+                        except APIError:
+                            logger.exception("%s map calls failed after retries", clicked_action["name"])
+                            answer2_box.error(AI_UNAVAILABLE)
+                        else:
+                            answer2 = show_answer(
+                                prompt, answer2_box, clicked_action["name"], answer_validator(clicked_action)
+                            )
+            if answer2 is not None:
+                results["quick_action"] = answer2
+        elif results.get("quick_action"):
+            render_answer(answer2_box, results["quick_action"])
+
+        # Run every Quick Action at once; each tab fills in as its call finishes
+        if run_full_analysis:
+            tabs = st.tabs([action["label"] for action in QUICK_ACTIONS])
+            placeholders = {}
+            for tab, action in zip(tabs, QUICK_ACTIONS):
+                with tab:
+                    placeholders[action["key"]] = st.empty()
+                    placeholders[action["key"]].info(action["spinner"])
+
+            # Worker threads have no Streamlit context, so they only talk to OpenAI; rendering stays here
+            analysis = {}
+            with ThreadPoolExecutor(max_workers=st.secrets.get("analysis_workers", len(QUICK_ACTIONS))) as pool:
+                # Prefetched actions are reused rather than asked again
+                futures = {
+                    (None if refresh_responses else prefetcher.claim(doc_hash, action["name"]))
+                    or pool.submit(pipeline.run_quick_action, action, doc_hash, metadata_summary, text, pages): action
+                    for action in QUICK_ACTIONS
+                }
+                for future in as_completed(futures):
+                    action = futures[future]
+                    try:
+                        analysis[action["key"]] = future.result()
+                        render_answer(placeholders[action["key"]], analysis[action["key"]])
+                    except APIError:
+                        logger.exception("%s call failed after retries", action["name"])
+                        placeholders[action["key"]].error(AI_UNAVAILABLE)
+            results["full_analysis"] = analysis
+        elif results.get("full_analysis"):
+            tabs = st.tabs([action["label"] for action in QUICK_ACTIONS])
+            for tab, action in zip(tabs, QUICK_ACTIONS):
+                with tab:
+                    if action["key"] in results["full_analysis"]:
+                        render_answer(st.empty(), results["full_analysis"][action["key"]])
+                    else:
+                        st.error(f"{action['label']} failed. Run the analysis again to retry.")
+
+    # Question and Answer section
+    @st.fragment
+    @timed("qa")
+    def qa_section(doc_hash, metadata_summary, text, pages):
+        results = document_results(doc_hash)
 
-        # Summary
-        summary_text, st_valid = validate_metadata_field(meta.get("Summary Text"))
-        if st_valid:
-            summary_lines.append(f"Summary: {summary_text}")
+        # Question input
+        question = st.text_area(
+            "",
+            placeholder="Please type here to ask a general question about the contract"
+        )
 
-        if not summary_lines:
-            return "Metadata could not be reliably extracted from the contract."
+        # Button to get answer
+        if st.button("Get Answer") and question:
+            st.markdown("### Answer:")
+            index = get_retrieval_index(doc_hash, pages)
+            # A question worded like one already answered for this document reuses that answer
+            top = index.search(question, k=1)
+            top_section = top[0][0]["id"] if top else None
+            similar = None if refresh_responses else question_cache.lookup(doc_hash, question, index.idf, top_section)
+            if similar is not None:
+                answer = similar["answer"]
+                render_answer(st.empty(), answer)
+                caption = (f"Answered from the question cache: similar to \"{similar['question']}\" "
+                           f"(similarity {similar['similarity']:.2f}).")
+                st.caption(caption)
+                results["answer"] = (answer, caption)
+            else:
+                with st.spinner("Generating answer..."):
+                    started = time.perf_counter()
+                    # Only the sections that match the question are sent, with their page numbers
+                    prompt, sent_tokens = pipeline.prepare_qa_prompt(index, metadata_summary, question)
+                    answer = show_answer(prompt, st.empty(), "qa")
+                    if answer is not None:
+                        question_cache.put(doc_hash, question, answer, time.perf_counter() - started,
+                                           index.idf, top_section)
+                        full_tokens = count_tokens(text)
+                        logger.info("Q&A context: %d of %d contract tokens", sent_tokens, full_tokens)
+                        caption = f"Answered from {sent_tokens:,} of {full_tokens:,} contract tokens."
+                        st.caption(caption)
+                        results["answer"] = (answer, caption)
+        elif results.get("answer"):
+            answer, caption = results["answer"]
+            st.markdown("### Answer:")
+            render_answer(st.empty(), answer)
+            st.caption(caption)
+
+    # Modify section
+    @st.fragment
+    @timed("modify")
+    def modify_section(doc_hash, text):
+        results = document_results(doc_hash)
+        st.markdown("<hr>", unsafe_allow_html=True)
+        st.markdown("### Modify Contract")
+        edit_instruction = st.text_area(
+            "",
+            placeholder="Please type here to make changes to the contract"
+        )
     
-        return "\n".join(summary_lines)
+        # Edits accumulate on a per-document working copy, so each request only sends the sections it touches
+        working_copies = st.session_state.setdefault("working_copies", {})
+        working_copy = working_copies.get(doc_hash, text)
 
+        if st.button("Modify Contract") and edit_instruction:
+            st.markdown("### Modified Contract:")
+            with st.spinner("Applying modifications..."):
+                try:
+                    result = pipeline.modify(working_copy, edit_instruction)
+                except APIError:
+                    logger.exception("Modify call failed after retries")
+                    st.error(AI_UNAVAILABLE)
+                    result = False
+                if result is None:
+                    st.error("The modification could not be applied. Please try rephrasing the instruction.")
+                elif result:
+                    new_copy, answer3, failed = result
+                    working_copies[doc_hash] = working_copy = new_copy
+                    results["modify"] = (answer3, len(failed))
+                    if answer3:
+                        st.code(answer3, language="diff")
+                    else:
+                        st.info("No changes were needed for this instruction.")
+                    if failed:
+                        st.warning(f"{len(failed)} edit(s) could not be matched to the contract text and were skipped.")
+        elif results.get("modify") and working_copy != text:
+            answer3, failed = results["modify"]
+            st.markdown("### Modified Contract:")
+            if answer3:
+                st.code(answer3, language="diff")
+            if failed:
+                st.warning(f"{failed} edit(s) could not be matched to the contract text and were skipped.")
+
+        if working_copy != text:
+            with st.expander("All changes since the original"):
+                st.code(render_diff(text, working_copy), language="diff")
+            st.download_button("Download modified contract", working_copy, file_name="modified_contract.txt")
+            if st.button("Discard modifications"):
+                working_copies.pop(doc_hash, None)
+                results.pop("modify", None)
+                st.rerun()
+
+    # Compare section: contracts in the workspace compared clause by clause. Only the clauses
+    # that differ are sent to the model; the last comparison is kept for the session.
+    @st.fragment
+    @timed("compare")
+    def compare_section(files):
+        st.markdown("<hr>", unsafe_allow_html=True)
+        st.markdown("### Compare Contracts")
+        names = {doc_hash: file.name for doc_hash, file in files.items()}
+        selected = st.multiselect(
+            "Contracts to compare",
+            list(files),
+            default=list(files)[:3],
+            format_func=names.get,
+        )
+        comparison = st.session_state.get("comparison")
+
+        if st.button("Compare Contracts") and len(selected) >= 2:
+            documents = []
+            with st.spinner("Comparing contracts..."):
+                # Text evicted from the document cache is extracted again from the upload
+                for doc_hash in selected:
+                    documents.append((doc_hash, "".join(pipeline.load_pages(doc_hash, files[doc_hash]))))
+                try:
+                    rows, answer, sent_tokens = pipeline.compare_contracts(
+                        clause_index, documents, [names[doc_hash] for doc_hash in selected]
+                    )
+                except APIError:
+                    logger.exception("Compare call failed after retries")
+                    st.error(AI_UNAVAILABLE)
+                except ValueError as e:
+                    # The contracts have no text to compare
+                    st.error(str(e))
+                else:
+                    comparison = st.session_state["comparison"] = {
+                        "documents": selected,
+                        "rows": rows,
+                        "answer": answer,
+                        "sent_tokens": sent_tokens,
+                        "total_tokens": sum(count_tokens(text) for _, text in documents),
+                    }
+
+        if comparison and all(doc_hash in files for doc_hash in comparison["documents"]):
+            compared = [names[doc_hash] for doc_hash in comparison["documents"]]
+            st.markdown(comparison_table(comparison["rows"], compared))
+            diff = clause_diff(comparison["rows"], compared)
+            if diff:
+                with st.expander("Clause differences"):
+                    st.code(diff, language="diff")
+            if comparison["answer"]:
+                st.markdown(comparison["answer"])
+            st.caption(
+                f"Compared from {comparison['sent_tokens']:,} of {comparison['total_tokens']:,} contract tokens"
+            )
+
+    # Feedback section
+    @st.fragment
+    @timed("feedback")
+    def feedback_section():
+        st.markdown("<hr>", unsafe_allow_html=True)  
+        st.markdown("### Feedback")
+        feedback = st.text_area(
+            "",
+            placeholder="Please type here to share your feedback or report issues", 
+            key="feedback_input"
+        )
+
+        if st.button("Submit Feedback"):
+            if feedback.strip():
+                with open("feedback_log.txt", "a", encoding="utf-8") as f:
+                    f.write(f"\n---\nTimestamp: {datetime.datetime.now()}\nFeedback: {feedback.strip()}\n")
+
+                st.markdown(
+                    """
+                    <div style="
+                        background-color: #004d00;
+                        color: white;
+                        padding: 10px;
+                        border-radius: 5px;
+                        margin-top: 10px;
+                        font-weight: bold;
+                    ">
+                    Thank you for your feedback!
+                    </div>
+                    """,
+                    unsafe_allow_html=True
+                )
+            else:
+                st.warning("Please enter some feedback before submitting.")
 
 
     st.set_page_config(layout="wide")
@@ -279,302 +698,134 @@ if check_password():
 
     st.title("Contract Insights Assistant")
 
-    uploaded_file = st.file_uploader("Please upload a PDF document", type="pdf")
-
-    if uploaded_file is not None:
-        text = extract_text_from_pdf(uploaded_file)
-        metadata = call_openai_for_metadata(text)
-        metadata_summary = build_metadata_summary(metadata)
-
-        contract_type, _ = validate_metadata_field(metadata.get("Contract Type", "Not specified"))
-        # Handle and format parties involved
-        parties_raw = metadata.get("Parties Involved", "Not specified")
-        if isinstance(parties_raw, str):
-            parties_list = [p.strip() for p in parties_raw.split(",") if p.strip()]
+    # Workspace: every uploaded contract stays available to switch to and compare. Extracted text
+    # lives in the shared document cache, which drops the least recently used contracts when full.
+    uploaded_files = st.file_uploader("Please upload PDF documents", type="pdf", accept_multiple_files=True)
+    files = {document_hash(file.getvalue()): file for file in uploaded_files or []}
+
+    if files:
+        if len(files) > 1:
+            doc_hash = st.selectbox(
+                "Contract",
+                list(files),
+                format_func=lambda doc_hash: files[doc_hash].name,
+                key="active_document",
+            )
         else:
-            parties_list = parties_raw
-        parties_involved = format_parties(parties_list)
-        effective_date, _ = validate_metadata_field(metadata.get("Effective Date", "Not specified"))
-        expiration_date, _ = validate_metadata_field(metadata.get("Expiration Date", "Not specified"))
-        summary_text, _ = validate_metadata_field(metadata.get("Summary Text", "Not specified"))
-
-        # Metadata fields display
-        st.markdown(f"<div class='field-a'><h3>Contract Type</h3></div>", unsafe_allow_html=True)
-        st.markdown(f"{contract_type}", unsafe_allow_html=True)
-
-        st.markdown(f"<div class='field-a'><h3>Parties Involved</h3></div>", unsafe_allow_html=True)
-        st.markdown(f"{parties_involved}", unsafe_allow_html=True)
-
-        st.markdown(f"<div class='field-a'><h3>Effective and Expiration Dates</h3></div>", unsafe_allow_html=True)
-        dates = f"Effective: {effective_date}\nExpiration: {expiration_date}"
-        st.markdown(f"{dates}", unsafe_allow_html=True)
-
-        st.markdown(f"<div class='field-a'><h3>Summary</h3></div>", unsafe_allow_html=True)
-        st.markdown(f"{summary_text}", unsafe_allow_html=True)
-
-        st.markdown("<hr>", unsafe_allow_html=True)
-
-        answer = ""
-        answer2 = ""
-        answer3 = ""
-    
-        # Quick Actions section
-        st.markdown("### Quick Actions")
-        col1, col2, col3, col4, col5 = st.columns(5)
-
-        # Button 1
-        with col1:
-            clicked1 = st.button("Generate Executive Summary", key="btn1")
-
-        # Button 2
-        with col2:
-            clicked2 = st.button("Extract Clauses", key="btn2")
+            doc_hash = next(iter(files))
+        uploaded_file = files[doc_hash]
 
-        # Button 3
-        with col3:
-            clicked3 = st.button("Simplify Jargon", key="btn3")
+        # Extracted and normalized once per document, shared across sessions
+        pages = pipeline.load_pages(doc_hash, uploaded_file)
+        text = "".join(pages)
 
-        # Button 4
-        with col4:
-            clicked4 = st.button("Detect Problematic Clauses", key="btn4")
-
-        # Button 5
-        with col5:
-            clicked5 = st.button("Glossary of Terms", key="btn5")
-
-        # Quick actions code
-        if clicked1:
-            with st.spinner("Generating executive summary..."):
-                prompt = f"""
-                Contract Metadata:
-                {metadata_summary}
-                Full Contract Text:
-                {text}
-                Task: Provide an executive summary with main purpose, parties involved, key obligations and timelines, termination conditions.
-                """
-                response = client.chat.completions.create(
-                    model="gpt-4o",
-                    messages=[{"role": "user", "content": prompt}]
-                )
-                answer2 = response.choices[0].message.content
-
-        if clicked2:
-            with st.spinner("Extracting clauses..."):
-                prompt = f"""
-                Contract Metadata:
-                {metadata_summary}
-                Full Contract Text:
-                {text}
-                Task: Extract main clauses like Termination, Confidentiality, Payment Terms, etc.
-                """
-                response = client.chat.completions.create(
-                    model="gpt-4o",
-                    messages=[{"role": "user", "content": prompt}]
-                )
-                answer2 = response.choices[0].message.content
-                
-
-        if clicked3:
-            with st.spinner("Simplifying legal jargon..."):
-                    prompt = f"""
-                    Contract Metadata:
-                    {metadata_summary}
-                    Full Contract Text:
-                    {text}
-                    Task: Identify complex legal terms, jargon, or phrases in the contract that a small business user or someone not well-versed in legal terminology may not readily understand.
-                    For each one, please explain it clearly and concisely in plain English.
-                    
-                    Please format the output as a bullet-point list such as this:
-                    - **Term**: Explanation
-                    
-                    Also, please title the list as "Jargon Explanations"
-                    """
-                    response = client.chat.completions.create(
-                        model="gpt-4o",
-                        messages=[{"role":"user", "content": prompt}]
-                    )
-                    answer2 = response.choices[0].message.content
-    
+        # Metadata fields display; each panel fills in as its field arrives from the model
+        panels = {}
+        for title in ("Contract Type", "Parties Involved", "Effective and Expiration Dates", "Summary"):
+            st.markdown(f"<div class='field-a'><h3>{title}</h3></div>", unsafe_allow_html=True)
+            panels[title] = st.empty()
 
-        if clicked4:
-            with st.spinner("Scanning for problematic clauses..."):
-                prompt = f"""
-                Contract Metadata:
-                {metadata_summary}
-                Full Contract Text:
-                {text}
-                Task: Identify any clauses or sections that may pose potential risks, unusual obligations, unclear responsibilities, or any concerning legal implications - especially from the perspective of a small business user or someone not well-versed in legal terminology.
-
-                For each one, provide a simple explanation of why it could be a problematic clause.
-
-                Please format the output as a bullet-point list like this:
-                - **Clause Name or Description**: Explanation of concern
-
-                Also, please title the list as "Red Flag Clauses"
-                """
-                response = client.chat.completions.create(
-                    model="gpt-4o",
-                    messages=[{"role":"user", "content": prompt}]
-                )
-                answer2 = response.choices[0].message.content
-
-
-        if clicked5:
-            with st.spinner("Generating glossary..."):
-                prompt = f"""
-                Contract Metadata:
-                {metadata_summary}
-                Full Contract Text:
-                {text}
-                Task: Create a glossary of important terms or key concepts used in the contract. For each term, provide a brief and simple definition or explanation that a small business user or someone not well-versed in legal terminology can understand.
-
-                Please format the output as a bullet-point list like this:
-                - **Term**: Definition
-
-                Also, please title the list as "Glossary of Terms"
-                """
-                response = client.chat.completions.create(
-                    model="gpt-4o",
-                    messages=[{"role":"user", "content": prompt}]
-                )
-                answer2 = response.choices[0].message.content
-    
-        # Display the answer if available
-        if answer2:
-            st.markdown(
-                f"""
-                <div style="
-                    background-color: white;
-                    color: black;
-                    padding: 15px;
-                    border-radius: 8px;
-                    border: 1px solid black !important;">
-                    {answer2}
-                </div>
-                """,
-                unsafe_allow_html=True
-            )
-
-    
-        # Question and Answer section
-    
-        # Question input
-        question = st.text_area(
-            "",
-            placeholder="Please type here to ask a general question about the contract"
-        )
-
-        # Button to get answer
-        if st.button("Get Answer") and question:
-            with st.spinner("Generating answer..."):
-                prompt = f"""
-                Contract Metadata:
-                {metadata_summary}
-                Full Contract Text:
-                {text}
-                Question:
-                {question}
-                Provide a clear and concise answer.
-                """
-                response = client.chat.completions.create(
-                    model="gpt-4o",
-                    messages=[{"role": "user", "content": prompt}]
-                )
-                answer = response.choices[0].message.content
-    
-        # Display the answer if available
-        if answer:
-            st.markdown("### Answer:")
-            st.markdown(
-                f"""
-                <div style="
-                    background-color: white;
-                    color: black;
-                    padding: 15px;
-                    border-radius: 8px;
-                    border: 1px solid black !important;">
-                    {answer}
-                </div>
-                """,
-                unsafe_allow_html=True
+        try:
+            metadata, metadata_summary = pipeline.load_metadata(
+                doc_hash,
+                text,
+                pages,
+                on_field=(lambda partial, done: show_metadata(panels, partial, done)) if stream_responses else None,
             )
+        except APIError:
+            # Without metadata there is nothing to show; don't render it as an empty contract
+            logger.exception("Metadata extraction failed after retries")
+            st.error(AI_UNAVAILABLE)
+            st.stop()
+        if not metadata:
+            # A failed extraction is not cached; the next rerun gets another try
+            st.warning("The contract details could not be extracted. They will be retried on the next interaction.")
+        show_metadata(panels, metadata)
+
+        # Start the Quick Actions users usually click next while they read the metadata (opt-in).
+        # Uploading another file cancels whatever has not started yet for this one.
+        prefetch_actions = st.secrets.get("prefetch_actions", [])
+        if prefetch_actions and metadata and not refresh_responses and st.session_state.get("prefetched_doc") != doc_hash:
+            text_report = doc_cache.get(doc_hash, "text_report")
+            estimate = (text_report["tokens_after"] if text_report else count_tokens(text)) + COMPLETION_TOKENS_ESTIMATE
+            background = pipeline.with_priority("background")
+            prefetcher.prefetch(session_id, doc_hash, [
+                (action["name"], partial(background.run_quick_action, action, doc_hash, metadata_summary, text, pages),
+                 estimate)
+                for action in QUICK_ACTIONS
+                if action["name"] in prefetch_actions and not action.get("local")
+            ])
+            st.session_state["prefetched_doc"] = doc_hash
+
+        with st.sidebar.expander("Cache statistics"):
+            st.caption("Documents")
+            st.json(doc_cache.stats())
+            st.caption("AI responses")
+            st.json(response_cache.stats())
+            st.caption("Similar Q&A questions")
+            st.json(question_cache.stats())
+            st.caption("Clause index")
+            st.json(clause_index.stats())
+            text_report = doc_cache.get(doc_hash, "text_report")
+            if text_report:
+                st.caption("Contract text")
+                st.json(text_report)
 
-
-        # Modify section
         st.markdown("<hr>", unsafe_allow_html=True)
-        st.markdown("### Modify Contract")
-        edit_instruction = st.text_area(
-            "",
-            placeholder="Please type here to make changes to the contract"
-        )
-    
-        if st.button("Modify Contract"):
-            with st.spinner("Applying modifications..."):
-                prompt = f"""
-                Original Contract:
-                {text}
-
-                Instruction:
-                {edit_instruction}
-
-                Task: Apply the requested changes directly to the contract text.
-                Return only the modified contract.
-                """
-                response = client.chat.completions.create(
-                    model="gpt-4o",
-                    messages=[{"role": "user", "content": prompt}]
-                )
-                answer3 = response.choices[0].message.content  
-    
-        if answer3:
-            st.markdown("### Modified Contract:")
-            st.markdown(
-                f"""
-                <div style="
-                    background-color: white;
-                    color: black;
-                    padding: 15px;
-                    border-radius: 8px;
-                    border: 1px solid black !important;">
-                    {answer3}
-                </div>
-                """,
-                unsafe_allow_html=True
-            )
-        
 
-        # Feedback section
-        st.markdown("<hr>", unsafe_allow_html=True)  
-        st.markdown("### Feedback")
-        feedback = st.text_area(
-            "",
-            placeholder="Please type here to share your feedback or report issues", 
-            key="feedback_input"
+        # Each section is a fragment: its buttons rerun only that section, and its last result is
+        # kept in session_state, so the rest of the page stays as it was without being recomputed
+        quick_actions_section(doc_hash, metadata_summary, text, pages)
+        qa_section(doc_hash, metadata_summary, text, pages)
+        modify_section(doc_hash, text)
+        if len(files) > 1:
+            compare_section(files)
+        feedback_section()
+
+    elif st.session_state.pop("prefetched_doc", None) is not None:
+        # The files were removed; stop prefetching for it unless another session has it open
+        prefetcher.release(session_id)
+
+    run_timings["full run"].append(time.perf_counter() - script_started)
+
+    # Admin panel: per-action latency, tokens and cost for this server process.
+    # Rendered last so it includes the calls made during this run.
+    with st.sidebar.expander("Admin: AI usage"):
+        usage_rows = metrics.summary()
+        if usage_rows:
+            st.dataframe(usage_rows, hide_index=True)
+        else:
+            st.caption("No AI calls recorded yet.")
+        tier_rows = metrics.tier_summary()
+        if tier_rows:
+            # Invalid answers were asked again on the next larger tier
+            st.caption("Model tiers")
+            st.dataframe(tier_rows, hide_index=True)
+        st.caption("Rate limiter")
+        st.json(rate_limiter.stats())
+        if st.secrets.get("prefetch_actions"):
+            st.caption("Prefetch")
+            st.json(prefetcher.stats())
+        # A click inside a section reruns only that section, so its time is what the user waits for
+        st.caption("Script run time (ms)")
+        st.dataframe(
+            [
+                {
+                    "section": section,
+                    "runs": len(times),
+                    "p50": round(percentile(list(times), 50) * 1000, 1),
+                    "p95": round(percentile(list(times), 95) * 1000, 1),
+                }
+                for section, times in sorted(run_timings.items())
+            ],
+            hide_index=True,
         )
-
-        if st.button("Submit Feedback"):
-            if feedback.strip():
-                with open("feedback_log.txt", "a", encoding="utf-8") as f:
-                    f.write(f"\n---\nTimestamp: {datetime.datetime.now()}\nFeedback: {feedback.strip()}\n")
-
-                st.markdown(
-                    """
-                    <div style="
-                        background-color: #004d00;
-                        color: white;
-                        padding: 10px;
-                        border-radius: 5px;
-                        margin-top: 10px;
-                        font-weight: bold;
-                    ">
-                    Thank you for your feedback!
-                    </div>
-                    """,
-                    unsafe_allow_html=True
-                )
-            else:
-                st.warning("Please enter some feedback before submitting.")
-
+        st.download_button(
+            "Export Prometheus metrics",
+            metrics.to_prometheus() + rate_limiter.to_prometheus(),
+            file_name="metrics.prom",
+        )
+        st.download_button("Export call log (JSONL)", metrics.to_jsonl(), file_name="llm_calls.jsonl")
 
     pass
 else:
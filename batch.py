@@ -0,0 +1,210 @@
+"""Headless batch mode: analyse a folder of contract PDFs into a JSONL file.
+
+    python batch.py contracts/ results.jsonl [--actions summary red_flags] [--concurrency 4]
+                    [--docs-per-minute 30] [--resume]
+
+Each PDF is extracted, its metadata and summary are generated and the chosen
+Quick Actions are run, exactly as in the app but without the login or UI. One
+JSON record is appended per contract as soon as it finishes, so the output file
+doubles as the checkpoint: with `--resume`, contracts that already have a
+successful record are skipped and failed ones are retried.
+
+The OpenAI key is read from OPENAI_API_KEY (and OPENAI_BASE_URL, if set).
+Responses go through the same cache as the app, so re-running a batch or
+opening one of its contracts in the app costs nothing extra.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from doc_cache import document_hash
+from llm_cache import ResponseCache
+from metrics import MetricsRecorder
+from openai_client import create_client
+from pdf_extract import shutdown_pool
+from pipeline import QUICK_ACTIONS, ContractPipeline, build_metadata_summary
+from ratelimit import RateLimiter
+from routing import DEFAULT_TIER_MODELS, ModelRouter
+
+logger = logging.getLogger("batch")
+
+ACTIONS_BY_NAME = {action["name"]: action for action in QUICK_ACTIONS}
+
+
+def find_pdfs(directory):
+    """Yields the PDFs under `directory` in a stable order."""
+    for path in sorted(Path(directory).rglob("*")):
+        if path.is_file() and path.suffix.lower() == ".pdf":
+            yield path
+
+
+def load_checkpoint(output_path):
+    """Returns the files that already have a successful record in the output."""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A line cut short by an interrupted run; that contract is simply redone
+                continue
+            if not record.get("error"):
+                done.add(record["file"])
+    return done
+
+
+def analyse_contract(pipeline, path, name, actions):
+    """Runs the app's analysis on one PDF and returns its record. Runs in a worker thread."""
+    started = time.perf_counter()
+    record = {"file": name}
+    try:
+        record["doc_hash"] = document_hash(path.read_bytes())
+        pages, record["text"] = pipeline.prepare_pages(pipeline.extract_pages_from_path(str(path)))
+        text = "".join(pages)
+        record["pages"] = len(pages)
+        metadata = pipeline.call_openai_for_metadata(text, pages)
+        metadata_summary = build_metadata_summary(metadata)
+        record["metadata"] = metadata.to_dict()
+        record["metadata_summary"] = metadata_summary
+        record["actions"] = {
+            action["name"]: pipeline.run_quick_action(action, record["doc_hash"], metadata_summary, text, pages)
+            for action in actions
+        }
+        record["error"] = None if metadata else "Metadata could not be extracted"
+    except Exception as e:
+        logger.exception("Failed to analyse %s", name)
+        record["error"] = f"{type(e).__name__}: {e}"
+    record["seconds"] = round(time.perf_counter() - started, 3)
+    return record
+
+
+class Pacer:
+    """Spaces out document starts so no more than `per_minute` begin each minute."""
+
+    def __init__(self, per_minute=None):
+        self.interval = 60 / per_minute if per_minute else 0
+        self.next_start = 0.0
+
+    async def wait(self):
+        if not self.interval:
+            return
+        now = time.monotonic()
+        start = max(now, self.next_start)
+        self.next_start = start + self.interval
+        await asyncio.sleep(start - now)
+
+
+async def run_batch(pipeline, directory, output_path, actions, concurrency=4, docs_per_minute=None, resume=False):
+    """Processes every PDF under `directory` and returns (succeeded, failed, skipped)."""
+    done = load_checkpoint(output_path) if resume else set()
+    queue = asyncio.Queue(maxsize=concurrency * 2)
+    pacer = Pacer(docs_per_minute)
+    counts = {"succeeded": 0, "failed": 0, "skipped": 0}
+    loop = asyncio.get_running_loop()
+
+    with open(output_path, "a" if resume else "w", encoding="utf-8") as out, \
+            ThreadPoolExecutor(max_workers=concurrency) as executor:
+
+        async def worker():
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                path, name = item
+                await pacer.wait()
+                record = await loop.run_in_executor(executor, analyse_contract, pipeline, path, name, actions)
+                # Records are written from the event loop thread only, so lines never interleave
+                out.write(json.dumps(record) + "\n")
+                out.flush()
+                counts["failed" if record["error"] else "succeeded"] += 1
+                logger.info("%s %s in %.1fs", "FAILED" if record["error"] else "done", name, record["seconds"])
+
+        workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+        # The bounded queue keeps the directory listing from running far ahead of the workers
+        for path in find_pdfs(directory):
+            name = path.relative_to(directory).as_posix()
+            if name in done:
+                counts["skipped"] += 1
+                continue
+            await queue.put((path, name))
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+    return counts["succeeded"], counts["failed"], counts["skipped"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("directory", help="folder of PDFs, searched recursively")
+    parser.add_argument("output", help="JSONL file to write, one record per contract")
+    parser.add_argument("--actions", nargs="*", default=["summary"], choices=sorted(ACTIONS_BY_NAME) + ["all"],
+                        help="Quick Actions to run for each contract (default: summary)")
+    parser.add_argument("--concurrency", type=int, default=4, help="contracts processed at the same time")
+    parser.add_argument("--docs-per-minute", type=float, help="throughput target; starts are spaced to stay under it")
+    parser.add_argument("--resume", action="store_true", help="skip contracts already recorded in the output")
+    parser.add_argument("--rpm", type=int, default=500, help="OpenAI requests per minute to stay under")
+    parser.add_argument("--tpm", type=int, default=30000, help="OpenAI tokens per minute to stay under")
+    parser.add_argument("--llm-cache-path", default=".cache/llm_responses.sqlite3")
+    parser.add_argument("--no-cache", action="store_true", help="always call the model")
+    parser.add_argument("--metrics-jsonl-path", help="append a record per OpenAI call to this file")
+    parser.add_argument("--context-token-budget", type=int, default=100000)
+    parser.add_argument("--map-workers", type=int, default=4)
+    parser.add_argument("--pdf-workers", type=int)
+    parser.add_argument("--small-model", default=DEFAULT_TIER_MODELS["small"],
+                        help="model for metadata, clause labels, jargon and glossary (see routing.py)")
+    parser.add_argument("--large-model", default=DEFAULT_TIER_MODELS["large"],
+                        help="model for the other actions and for answers the small model got wrong")
+    args = parser.parse_args()
+
+    logging.basicConfig(format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    logger.setLevel(logging.INFO)
+    actions = QUICK_ACTIONS if "all" in args.actions else [ACTIONS_BY_NAME[name] for name in args.actions]
+    metrics = MetricsRecorder(jsonl_path=args.metrics_jsonl_path)
+    pipeline = ContractPipeline(
+        # Retries are handled by the limiter, which backs off for every worker at once
+        create_client(max_connections=args.concurrency * args.map_workers),
+        cache=None if args.no_cache else ResponseCache(args.llm_cache_path),
+        metrics=metrics,
+        context_budget=args.context_token_budget,
+        map_workers=args.map_workers,
+        pdf_workers=args.pdf_workers,
+        router=ModelRouter(tier_models={"small": args.small_model, "large": args.large_model}),
+        limiter=RateLimiter(rpm=args.rpm, tpm=args.tpm),
+        priority="background",
+    )
+
+    started = time.perf_counter()
+    try:
+        succeeded, failed, skipped = asyncio.run(run_batch(
+            pipeline, Path(args.directory), args.output, actions,
+            concurrency=args.concurrency, docs_per_minute=args.docs_per_minute, resume=args.resume,
+        ))
+    finally:
+        shutdown_pool()
+    elapsed = time.perf_counter() - started
+
+    rate = (succeeded + failed) / elapsed * 60 if elapsed else 0.0
+    target = f" (target {args.docs_per_minute:g})" if args.docs_per_minute else ""
+    print(f"{succeeded} succeeded, {failed} failed, {skipped} skipped in {elapsed:.1f}s: {rate:.1f} docs/min{target}")
+    for row in metrics.summary():
+        print(f"  {row['action']:<14} calls {row['calls']:>4}  cache hits {row['cache_hits']:>4}  "
+              f"errors {row['errors']:>3}  tokens {row['prompt_tokens'] + row['completion_tokens']:>8}  "
+              f"cached {row['cached_tokens']:>8}  "
+              f"${row['cost_usd']:.2f}")
+    for row in metrics.tier_summary():
+        print(f"  tier {row['tier']:<9} calls {row['calls']:>4}  invalid {row['invalid']:>3}  "
+              f"p50 {row['p50_latency'] or 0:.2f}s  tokens {row['prompt_tokens'] + row['completion_tokens']:>8}  "
+              f"${row['cost_usd']:.2f}  ({row['models']})")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Micro-benchmark: a shared, pooled OpenAI client against one built per rerun.
+
+    python -m benchmarks.bench_client [--calls 200] [--concurrency 8]
+
+Runs against the local mock server (instant profile), so the numbers are pure
+client and connection overhead. Variants:
+
+* `per-rerun client`: what app.py did before openai_client existed, a new
+  `OpenAI(...)` (and connection pool) for every call.
+* `shared client`: one `create_client()` reused by every call.
+* `shared x N threads`: the same client used from N threads at once, as
+  concurrent sessions and Run Full Analysis do.
+* `async x N`: one `create_async_client()` with N calls in flight.
+
+Against the real API every new connection also costs a TLS handshake (one or
+two extra round trips), which a plain-HTTP localhost server cannot show.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from openai import OpenAI
+
+from benchmarks.mock_openai import base_url, start_in_thread
+from metrics import percentile
+from openai_client import create_async_client, create_client
+
+MESSAGES = [{"role": "user", "content": "Summarise the termination clause."}]
+
+
+def call(client):
+    started = time.perf_counter()
+    client.chat.completions.create(model="gpt-4o", messages=MESSAGES)
+    return time.perf_counter() - started
+
+
+def per_rerun_client(url, calls, concurrency):
+    def rerun():
+        started = time.perf_counter()
+        call(OpenAI(api_key="bench", base_url=url, max_retries=0))
+        return time.perf_counter() - started
+
+    return [rerun() for _ in range(calls)]
+
+
+def shared_client(url, calls, concurrency):
+    client = create_client(api_key="bench", base_url=url)
+    call(client)  # open the first connection outside the timing
+    return [call(client) for _ in range(calls)]
+
+
+def shared_client_threads(url, calls, concurrency):
+    client = create_client(api_key="bench", base_url=url, max_connections=concurrency)
+    call(client)
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return list(pool.map(lambda _: call(client), range(calls)))
+
+
+def async_client(url, calls, concurrency):
+    async def run():
+        client = create_async_client(api_key="bench", base_url=url, max_connections=concurrency)
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one():
+            async with semaphore:
+                started = time.perf_counter()
+                await client.chat.completions.create(model="gpt-4o", messages=MESSAGES)
+                return time.perf_counter() - started
+
+        await one()
+        timings = await asyncio.gather(*(one() for _ in range(calls)))
+        await client.close()
+        return timings
+
+    return asyncio.run(run())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    server = start_in_thread(profile="instant")
+    url = base_url(server)
+    variants = [
+        ("per-rerun client", per_rerun_client),
+        ("shared client", shared_client),
+        (f"shared x{args.concurrency} threads", shared_client_threads),
+        (f"async x{args.concurrency}", async_client),
+    ]
+    print(f"{args.calls} calls against {url}")
+    print(f"{'variant':<22} {'wall s':>7} {'calls/s':>8} {'mean ms':>8} {'p50 ms':>7} {'p95 ms':>7} {'conns':>6}")
+    try:
+        for name, fn in variants:
+            connections_before = server.connections
+            started = time.perf_counter()
+            timings = fn(url, args.calls, args.concurrency)
+            wall = time.perf_counter() - started
+            print(f"{name:<22} {wall:>7.2f} {args.calls / wall:>8.0f} {statistics.mean(timings) * 1000:>8.2f} "
+                  f"{percentile(timings, 50) * 1000:>7.2f} {percentile(timings, 95) * 1000:>7.2f} "
+                  f"{server.connections - connections_before:>6}")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""Benchmark: comparing versions of a contract clause by clause.
+
+    python -m benchmarks.bench_compare [--pages 20] [--versions 3] [--profile gpt-4o]
+
+Generates `--versions` versions of the same synthetic agreement (each one
+changes the notice period in TERMINATION, every other one also the governing
+law), then against the mock server:
+
+- full text: one call per version with its whole text, as when each version is
+  uploaded and analysed on its own;
+- compare: `ContractPipeline.compare_contracts`, which lines the clauses up
+  locally and sends only the ones that differ, in one call. This runs twice:
+  with each heading on its own line, and with run-in headings
+  ("5. Termination. Either party may...").
+
+Reports calls, prompt tokens, latency and estimated cost for each, and how many
+clauses were found to differ. Exits with status 1 unless, in both heading
+layouts, exactly the TERMINATION and GOVERNING LAW clauses differ. The response
+cache is off.
+"""
+import argparse
+import io
+import sys
+import time
+
+from benchmarks.corpus import CLAUSES, make_contract_pdf
+from benchmarks.mock_openai import PROFILES, base_url, start_in_thread
+from compare import ClauseIndex
+from doc_cache import DocumentCache, document_hash
+from metrics import MetricsRecorder
+from openai_client import create_client
+from pdf_extract import shutdown_pool
+from pipeline import QUICK_ACTIONS, ContractPipeline, build_quick_action_prompt
+
+METADATA_SUMMARY = "Contract Type: Master Services Agreement\nParties Involved: Northwind Traders Ltd and Contoso Consulting LLC"
+# Clauses version_replacements changes; every occurrence of these, and nothing else, must differ
+CHANGED_CLAUSES = {"termination", "governing law"}
+# Notice periods of the same length as the original's, so the clauses after it stay where they were
+NOTICE_PERIODS = ["ninety (90)", "thirty (30)", "eighty (80)", "twenty (20)", "eleven (11)", "twelve (12)"]
+
+
+def version_replacements(n):
+    """Returns the clause changes that make version `n` (version 0 is the original)."""
+    clauses = dict(CLAUSES)
+    replacements = {"TERMINATION": clauses["TERMINATION"].replace("ninety (90)", NOTICE_PERIODS[n % len(NOTICE_PERIODS)])}
+    if n % 2:
+        replacements["GOVERNING LAW"] = (
+            clauses["GOVERNING LAW"].replace("England and Wales", "State of New York").replace("London", "Albany")
+        )
+    return replacements
+
+
+def totals(metrics, seconds):
+    records = metrics.records
+    return {
+        "calls": len(records),
+        "prompt_tokens": sum(r["prompt_tokens"] for r in records),
+        "seconds": seconds,
+        "cost_usd": sum(r["cost_usd"] for r in records),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--versions", type=int, default=3)
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="gpt-4o")
+    args = parser.parse_args()
+
+    mock = start_in_thread(profile=args.profile)
+    client = create_client(api_key="bench", base_url=base_url(mock))
+    doc_cache = DocumentCache()
+    names = [f"version {n + 1}" for n in range(args.versions)]
+    results = {}
+    differing = {}
+    failures = []
+    try:
+        for layout, run_in_headings in (("compare", False), ("compare, run-in headings", True)):
+            documents = []
+            for n in range(args.versions):
+                data = make_contract_pdf(args.pages, replacements=version_replacements(n), run_in_headings=run_in_headings)
+                doc_hash = document_hash(data)
+                pages = ContractPipeline(client, doc_cache=doc_cache).load_pages(doc_hash, io.BytesIO(data))
+                documents.append((doc_hash, "".join(pages)))
+
+            if not results:
+                summary = next(action for action in QUICK_ACTIONS if action["name"] == "summary")
+                full_text = ContractPipeline(client, metrics=MetricsRecorder())
+                started = time.perf_counter()
+                for _, text in documents:
+                    full_text.ask(build_quick_action_prompt(summary, METADATA_SUMMARY, text), "summary")
+                results["full text"] = totals(full_text.metrics, time.perf_counter() - started)
+
+            compared = ContractPipeline(client, metrics=MetricsRecorder())
+            started = time.perf_counter()
+            rows, _, sent_tokens = compared.compare_contracts(ClauseIndex(), documents, names)
+            results[layout] = totals(compared.metrics, time.perf_counter() - started)
+            differing[layout] = (sum(row["status"] != "same" for row in rows), len(rows), sent_tokens)
+            # A heading on a page's last line loses its body to the page cut; it has nothing to differ
+            if any(
+                (row["status"] != "same") != (row["key"].split(" #")[0] in CHANGED_CLAUSES)
+                for row in rows if any(clause and clause["body"] for clause in row["clauses"])
+            ):
+                failures.append(layout)
+    finally:
+        mock.shutdown()
+        shutdown_pool()
+
+    print(f"\n{args.versions} versions x {args.pages} pages, profile {args.profile}")
+    for layout, (count, total, sent_tokens) in differing.items():
+        print(f"  {layout}: {count} of {total} clauses differ, {sent_tokens} contract tokens sent")
+    print(f"  {'approach':<25} {'calls':>5} {'prompt':>8} {'seconds':>8} {'cost $':>8}")
+    for approach, r in results.items():
+        print(f"  {approach:<25} {r['calls']:>5} {r['prompt_tokens']:>8} {r['seconds']:>8.2f} {r['cost_usd']:>8.4f}")
+
+    if failures:
+        print(f"\nFAIL: {', '.join(failures)} did not find exactly the changed clauses")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""Micro-benchmark: pdf_extract against the original single-pass extraction.
+
+    python -m benchmarks.bench_extract [--pages 100 300 500] [--repeat 3] [--workers N]
+
+The baseline is the implementation app.py used before pdf_extract existed:
+read the whole upload into memory and join `page.get_text()` on one core.
+"""
+import argparse
+import io
+import os
+import statistics
+import time
+
+import fitz  # PyMuPDF for PDF
+
+from benchmarks.corpus import make_contract_pdf
+from pdf_extract import PARALLEL_MIN_PAGES, extract_pages, shutdown_pool
+
+
+def baseline_extract(pdf_file):
+    pdf_reader = fitz.open(stream=pdf_file.read(), filetype="pdf")
+    return "".join(page.get_text() for page in pdf_reader)
+
+
+def best_of(fn, repeat):
+    timings = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings), statistics.median(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, nargs="+", default=[100, 300, 500])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    print(f"cpus: {os.cpu_count()}  workers: {args.workers}")
+    print(f"{'pages':>6} {'variant':<18} {'best s':>8} {'median s':>9} {'pages/s':>8}")
+    try:
+        # Warm the pool up once so its start-up cost is not billed to the first size
+        extract_pages(io.BytesIO(make_contract_pdf(PARALLEL_MIN_PAGES)), workers=args.workers)
+        for pages in args.pages:
+            data = make_contract_pdf(pages)
+            variants = [
+                ("baseline", lambda: baseline_extract(io.BytesIO(data))),
+                ("sequential", lambda: "".join(extract_pages(io.BytesIO(data), workers=1))),
+                (f"pool x{args.workers}", lambda: "".join(extract_pages(io.BytesIO(data), workers=args.workers))),
+            ]
+            expected = None
+            for name, fn in variants:
+                best, median, text = best_of(fn, args.repeat)
+                expected = expected if expected is not None else text
+                mismatch = "" if text == expected else "  OUTPUT DIFFERS"
+                print(f"{pages:>6} {name:<18} {best:>8.3f} {median:>9.3f} {pages / best:>8.0f}{mismatch}")
+    finally:
+        shutdown_pool()
+
+
+if __name__ == "__main__":
+    main()
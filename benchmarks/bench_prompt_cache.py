@@ -0,0 +1,139 @@
+"""Benchmark: provider-side prompt caching with the shared-prefix prompt layout.
+
+    python -m benchmarks.bench_prompt_cache [--pages 20] [--profile gpt-4o]
+
+Sends the calls the app makes for one document (metadata, each model-backed
+Quick Action, then Q&A questions) to the mock server twice, each time with a
+fresh prompt cache: once with the old prompt layout (indented f-strings, the
+metadata summary before the contract, no system prompt) and once with the
+`prompts.py` layout. Reports per-call latency, prompt tokens served from the
+cache and the estimated cost, so the discount and the shorter prefill can be
+checked. The mock caches prefixes the way OpenAI does (see `mock_openai`).
+"""
+import argparse
+import io
+import time
+
+from benchmarks.corpus import make_contract_pdf
+from benchmarks.mock_openai import PROFILES, base_url, start_in_thread
+from benchmarks.run_pipeline import QUESTIONS
+from metadata import RESPONSE_FORMAT, build_metadata_prompt
+from metrics import estimate_cost
+from normalize import normalize_pages
+from openai_client import create_client
+from pdf_extract import extract_pages, shutdown_pool
+from pipeline import QUICK_ACTIONS, build_qa_prompt, build_quick_action_prompt, build_retrieval_index
+from prompts import build_messages
+from retrieval import format_chunks
+
+MODEL = "gpt-4o"
+QA_TOP_K = 5
+METADATA_SUMMARY = "Contract Type: Master Services Agreement\nParties Involved: Northwind Traders Ltd and Contoso Consulting LLC"
+
+
+def legacy_metadata_prompt(text):
+    return f"""
+    You are a friendly legal assistant. From the following contract, extract the contract type,
+    the parties involved (one list item per party), the effective date, the expiration date and a
+    brief summary. Leave a date empty if the contract does not state it.
+
+    Contract Text:
+    {text}
+
+    Respond with a JSON object with the keys contract_type, parties, effective_date, expiration_date and summary.
+    """
+
+
+def legacy_quick_action_prompt(action, metadata_summary, text):
+    return f"""
+    Contract Metadata:
+    {metadata_summary}
+    Full Contract Text:
+    {text}
+    Task: {action["task"]}
+    """
+
+
+def legacy_qa_prompt(metadata_summary, sections, question):
+    return f"""
+    Contract Metadata:
+    {metadata_summary}
+    Relevant Contract Sections:
+    {sections}
+    Question:
+    {question}
+    Provide a clear and concise answer, citing the page numbers of the sections you relied on.
+    If the sections above do not contain the answer, say so.
+    """
+
+
+def calls_for(layout, text, pages):
+    """Returns (name, messages, response_format) for each call the app makes on the document."""
+    index = build_retrieval_index(pages)
+    if layout == "legacy":
+        wrap = lambda prompt: [{"role": "user", "content": prompt}]
+        metadata_prompt, action_prompt, qa_prompt = legacy_metadata_prompt, legacy_quick_action_prompt, legacy_qa_prompt
+    else:
+        wrap = build_messages
+        metadata_prompt, action_prompt, qa_prompt = build_metadata_prompt, build_quick_action_prompt, build_qa_prompt
+
+    calls = [("metadata", wrap(metadata_prompt(text)), RESPONSE_FORMAT)]
+    for action in QUICK_ACTIONS:
+        if not action.get("local"):
+            calls.append((action["name"], wrap(action_prompt(action, METADATA_SUMMARY, text)), None))
+    for i, question in enumerate(QUESTIONS):
+        sections = format_chunks(index.retrieve(question, k=QA_TOP_K) or index.chunks[:QA_TOP_K])
+        calls.append((f"qa {i + 1}", wrap(qa_prompt(METADATA_SUMMARY, sections, question)), None))
+    return calls
+
+
+def run_layout(layout, text, pages, profile):
+    server = start_in_thread(profile=profile)
+    client = create_client(api_key="bench", base_url=base_url(server))
+    rows = []
+    try:
+        for name, messages, response_format in calls_for(layout, text, pages):
+            extra = {"response_format": response_format} if response_format else {}
+            started = time.perf_counter()
+            response = client.chat.completions.create(model=MODEL, messages=messages, **extra)
+            latency = time.perf_counter() - started
+            usage = response.usage
+            cached = usage.prompt_tokens_details.cached_tokens if usage.prompt_tokens_details else 0
+            rows.append({
+                "call": name,
+                "latency": latency,
+                "prompt_tokens": usage.prompt_tokens,
+                "cached_tokens": cached or 0,
+                "cost": estimate_cost(MODEL, usage.prompt_tokens, usage.completion_tokens, cached or 0),
+            })
+    finally:
+        server.shutdown()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="gpt-4o")
+    args = parser.parse_args()
+
+    try:
+        pages, _ = normalize_pages(extract_pages(io.BytesIO(make_contract_pdf(args.pages))))
+    finally:
+        shutdown_pool()
+    text = "".join(pages)
+
+    for layout in ("legacy", "shared-prefix"):
+        rows = run_layout(layout, text, pages, args.profile)
+        print(f"\n{layout} layout, {args.pages} pages, profile {args.profile}")
+        print(f"  {'call':<10} {'latency s':>9} {'prompt':>7} {'cached':>7} {'cost $':>8}")
+        for r in rows:
+            print(f"  {r['call']:<10} {r['latency']:>9.3f} {r['prompt_tokens']:>7} {r['cached_tokens']:>7} {r['cost']:>8.4f}")
+        prompt = sum(r["prompt_tokens"] for r in rows)
+        cached = sum(r["cached_tokens"] for r in rows)
+        print(f"  {'total':<10} {sum(r['latency'] for r in rows):>9.3f} {prompt:>7} {cached:>7} "
+              f"{sum(r['cost'] for r in rows):>8.4f}  ({100 * cached / prompt:.0f}% of prompt tokens cached)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Synthetic contract PDFs for benchmarks.
+
+Generates deterministic multi-page agreements with numbered clauses, a
+repeated header and footer on every page, and a predictable set of parties and
+dates so benchmark runs are comparable across machines.
+"""
+import random
+
+import fitz  # PyMuPDF for PDF
+
+CLAUSES = [
+    ("DEFINITIONS", '"Confidential Information" means any non-public information disclosed by either party. '
+                    '"Services" means the services described in the applicable Statement of Work.'),
+    ("SERVICES", "The Provider shall perform the Services with reasonable skill, care and diligence "
+                 "and in accordance with good industry practice."),
+    ("FEES AND PAYMENT", "The Customer shall pay each undisputed invoice within forty-five (45) days of receipt. "
+                         "Late payments accrue interest at one percent (1%) per month."),
+    ("TERM", "This Agreement continues for an initial term of two (2) years and renews automatically "
+             "for successive periods of one (1) year unless either party gives notice of non-renewal."),
+    ("TERMINATION", "Either party may terminate this Agreement on ninety (90) days written notice, or "
+                    "immediately if the other party commits a material breach that is not remedied within thirty (30) days."),
+    ("CONFIDENTIALITY", "Each party shall keep the other party's Confidential Information secret and use it "
+                        "only for the purposes of this Agreement for five (5) years after termination."),
+    ("INTELLECTUAL PROPERTY", "All intellectual property rights in the deliverables vest in the Customer on "
+                              "payment in full. The Provider retains its pre-existing materials."),
+    ("LIMITATION OF LIABILITY", "Neither party's aggregate liability shall exceed the fees paid in the twelve (12) "
+                                "months preceding the claim, and neither party is liable for indirect loss."),
+    ("INDEMNITY", "The Provider shall indemnify the Customer against third-party claims that the deliverables "
+                  "infringe any intellectual property right."),
+    ("GOVERNING LAW", "This Agreement is governed by the laws of England and Wales and the courts of London "
+                      "have exclusive jurisdiction."),
+]
+
+PARTIES = ("Northwind Traders Ltd", "Contoso Consulting LLC")
+EFFECTIVE_DATE = "March 1, 2024"
+EXPIRATION_DATE = "February 28, 2026"
+
+
+def contract_pages(page_count, seed=0, lines_per_page=38, replacements=None, run_in_headings=False):
+    """Returns the body text of each page as a list of lines.
+
+    `replacements` maps clause headings to new body text (or None to leave the
+    clause out), to make another version of the same agreement. With
+    `run_in_headings`, each clause starts on its heading's line
+    ("5. Termination. Either party may...") instead of below it.
+    """
+    replacements = replacements or {}
+    rng = random.Random(seed)
+    pages = []
+    clause_no = 0
+    for page_no in range(page_count):
+        lines = []
+        if page_no == 0:
+            lines += [
+                "MASTER SERVICES AGREEMENT",
+                f"This Agreement is made on {EFFECTIVE_DATE} between {PARTIES[0]} (the Customer)",
+                f"and {PARTIES[1]} (the Provider). It expires on {EXPIRATION_DATE}.",
+            ]
+        while len(lines) < lines_per_page:
+            heading, body = CLAUSES[clause_no % len(CLAUSES)]
+            clause_no += 1
+            # Vary clause length so chunks do not all line up with page breaks
+            repeat = rng.randint(1, 3)
+            body = replacements.get(heading, body)
+            if body is None:
+                # Numbered as in the original, so the remaining clauses keep their numbers
+                continue
+            words = body.split() * repeat
+            if run_in_headings:
+                line = [f"{clause_no}. {heading.title()}."]
+            else:
+                lines.append(f"{clause_no}. {heading}")
+                line = []
+            for word in words:
+                line.append(word)
+                if len(" ".join(line)) > 85:
+                    lines.append(" ".join(line))
+                    line = []
+            if line:
+                lines.append(" ".join(line))
+        pages.append(lines[:lines_per_page])
+    return pages
+
+
+def make_contract_pdf(page_count, seed=0, replacements=None, run_in_headings=False):
+    """Returns the bytes of a synthetic contract PDF with `page_count` pages."""
+    pages = contract_pages(page_count, seed, replacements=replacements, run_in_headings=run_in_headings)
+    with fitz.open() as doc:
+        for page_no, lines in enumerate(pages, start=1):
+            page = doc.new_page()
+            page.insert_text((72, 40), "MASTER SERVICES AGREEMENT - CONFIDENTIAL", fontsize=8)
+            page.insert_text((72, 72), "\n".join(lines), fontsize=9, lineheight=1.6)
+            page.insert_text((280, 810), f"Page {page_no} of {page_count}", fontsize=8)
+        return doc.tobytes()
@@ -0,0 +1,163 @@
+"""Load test: sustained requests per second through the HTTP service.
+
+    python -m benchmarks.load_service [--concurrency 32] [--duration 20] [--profile gpt-4o-mini]
+                                      [--pages 20] [--documents 4] [--threads 64]
+
+Starts the mock OpenAI server and `service.py` (uvicorn, one process, one event
+loop) on local ports, uploads `--documents` synthetic contracts, then keeps
+`--concurrency` clients busy for `--duration` seconds with a mix of the
+service's requests: metadata, Quick Actions (plain and streamed), Q&A (plain
+and streamed) and Modify. The response cache and question cache are off, so
+every analysis, Q&A and Modify request makes its real call to the mock.
+
+Reports requests per second over the run and per-endpoint p50/p99 latency
+(and time to first byte for streamed answers). With the mock's latency
+profile, requests per second should grow with `--concurrency` until the worker
+threads (`--threads`) or the CPU run out, showing that slow model calls do not
+hold up other requests. The mock, the service and the clients share this one
+process, so with the `instant` profile the number is bounded by its CPU.
+"""
+import argparse
+import asyncio
+import itertools
+import socket
+import threading
+import time
+
+import uvicorn
+
+try:
+    import httpx
+except ImportError:  # newer SDK releases are built on httpx2
+    import httpx2 as httpx
+
+from benchmarks.corpus import make_contract_pdf
+from benchmarks.mock_openai import PROFILES, base_url, start_in_thread
+from benchmarks.run_pipeline import MODIFY_INSTRUCTION, QUESTIONS
+from doc_cache import DocumentCache
+from metrics import MetricsRecorder, percentile
+from openai_client import create_client
+from pdf_extract import shutdown_pool
+from pipeline import ContractPipeline
+from service import create_app
+
+# (endpoint label, method, path after /documents/{id}, JSON body, streamed)
+REQUEST_MIX = [
+    ("metadata", "GET", "/metadata", None, False),
+    ("summary", "GET", "/analysis/summary", None, False),
+    ("summary stream", "GET", "/analysis/summary?stream=true", None, True),
+    ("red_flags", "GET", "/analysis/red_flags", None, False),
+    ("clauses", "GET", "/analysis/clauses", None, False),
+    ("qa", "POST", "/qa", {"question": QUESTIONS[0]}, False),
+    ("qa stream", "POST", "/qa?stream=true", {"question": QUESTIONS[1]}, True),
+    ("modify", "POST", "/modify", {"instruction": MODIFY_INSTRUCTION}, False),
+]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_service(app, port):
+    """Runs uvicorn on a daemon thread and returns the server once it accepts connections."""
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+async def send(client, document_id, request, samples):
+    label, method, path, body, streamed = request
+    started = time.perf_counter()
+    first_byte = None
+    async with client.stream(method, f"/documents/{document_id}{path}", json=body) as response:
+        async for _ in response.aiter_bytes():
+            if first_byte is None:
+                first_byte = time.perf_counter() - started
+    samples.append({
+        "endpoint": label,
+        "latency": time.perf_counter() - started,
+        "ttfb": first_byte if streamed else None,
+        "ok": response.status_code < 400,
+    })
+
+
+async def run_load(url, document_ids, concurrency, duration):
+    """Returns (samples, seconds) for `concurrency` clients sending the mix for `duration` seconds."""
+    samples = []
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=300) as client:
+        # Metadata is cached after the first request for a document; warm it outside the timing
+        await asyncio.gather(*(send(client, d, REQUEST_MIX[0], []) for d in document_ids))
+        deadline = time.perf_counter() + duration
+
+        async def worker(n):
+            # Each client starts at a different point of the mix and cycles through it
+            requests = itertools.islice(itertools.cycle(REQUEST_MIX), n, None)
+            documents = itertools.islice(itertools.cycle(document_ids), n, None)
+            while time.perf_counter() < deadline:
+                await send(client, next(documents), next(requests), samples)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(n) for n in range(concurrency)))
+        return samples, time.perf_counter() - started
+
+
+async def upload(url, pdfs):
+    async with httpx.AsyncClient(base_url=url, timeout=300) as client:
+        responses = await asyncio.gather(*(
+            client.post("/documents", content=data, headers={"Content-Type": "application/pdf"}) for data in pdfs
+        ))
+    return [response.json()["document_id"] for response in responses]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=32, help="clients sending requests at once")
+    parser.add_argument("--duration", type=float, default=20, help="seconds to keep the load up")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="gpt-4o-mini")
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--documents", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=64, help="the service's worker threads")
+    args = parser.parse_args()
+
+    mock = start_in_thread(profile=args.profile)
+    metrics = MetricsRecorder()
+    pipeline = ContractPipeline(
+        create_client(api_key="bench", base_url=base_url(mock), max_connections=args.threads),
+        doc_cache=DocumentCache(max_items=args.documents * 2),
+        metrics=metrics,
+    )
+    port = free_port()
+    service = start_service(create_app(pipeline, threads=args.threads), port)
+    url = f"http://127.0.0.1:{port}"
+
+    try:
+        document_ids = asyncio.run(upload(url, [make_contract_pdf(args.pages, seed=i) for i in range(args.documents)]))
+        samples, elapsed = asyncio.run(run_load(url, document_ids, args.concurrency, args.duration))
+    finally:
+        service.should_exit = True
+        mock.shutdown()
+        shutdown_pool()
+
+    errors = sum(not s["ok"] for s in samples)
+    print(f"\n{len(samples)} requests in {elapsed:.1f}s from {args.concurrency} clients: "
+          f"{len(samples) / elapsed:.1f} requests/s, {errors} errors")
+    print(f"  {args.documents} x {args.pages} page contracts, mock profile {args.profile}, "
+          f"{args.threads} service threads, {len(metrics.records)} model calls")
+    print(f"  {'endpoint':<15} {'n':>5} {'p50 s':>8} {'p99 s':>8} {'ttfb p50':>9}")
+    for label, *_ in REQUEST_MIX:
+        rows = [s for s in samples if s["endpoint"] == label]
+        if not rows:
+            continue
+        latencies = [s["latency"] for s in rows]
+        ttfbs = [s["ttfb"] for s in rows if s["ttfb"] is not None]
+        ttfb = f"{percentile(ttfbs, 50):>9.3f}" if ttfbs else f"{'':>9}"
+        print(f"  {label:<15} {len(rows):>5} {percentile(latencies, 50):>8.3f} {percentile(latencies, 99):>8.3f} {ttfb}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+"""OpenAI-compatible stand-in server for offline benchmarks.
+
+    python -m benchmarks.mock_openai [--port 8765] [--profile gpt-4o] [--per-model] [--error-rate 0.0]
+
+Serves `POST /v1/chat/completions` (plain and streamed, with usage) on
+localhost. Each profile sets the latency before the first token, the output
+token rate and the answer length, so runs behave like a real model without a
+network or an API key. With `--per-model`, a request for a model that has a
+profile of the same name (gpt-4o, gpt-4o-mini) is answered at that model's
+speed, so routing actions to a smaller model shows up in the timings. Like OpenAI, the server caches prompt prefixes: the
+longest prefix (from 1,024 tokens, in 128 token steps) it has seen before is
+reported as `prompt_tokens_details.cached_tokens` and skips the prefill delay.
+Responses follow the request: JSON-schema requests
+(metadata) get contract metadata, Modify prompts get find/replace edits, clause
+prompts get category labels and everything else gets plain text (headed by the
+title the prompt asks for, if any).
+
+Point the app at it with `OpenAI(api_key="bench", base_url="http://127.0.0.1:8765/v1")`.
+"""
+import argparse
+import json
+import random
+import re
+import socket
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmarks.corpus import EFFECTIVE_DATE, EXPIRATION_DATE, PARTIES
+from tokens import count_tokens, encode
+
+# latency: seconds before the response starts, prefill_tokens_per_sec: rate at which
+# uncached prompt tokens add to that, tokens_per_sec: output rate,
+# completion_tokens: length of plain text answers
+PROFILES = {
+    "instant": {"latency": 0.0, "prefill_tokens_per_sec": 0, "tokens_per_sec": 0, "completion_tokens": 200},
+    "gpt-4o-mini": {"latency": 0.25, "prefill_tokens_per_sec": 40000, "tokens_per_sec": 150, "completion_tokens": 300},
+    "gpt-4o": {"latency": 0.5, "prefill_tokens_per_sec": 20000, "tokens_per_sec": 80, "completion_tokens": 400},
+    "slow": {"latency": 2.0, "prefill_tokens_per_sec": 5000, "tokens_per_sec": 25, "completion_tokens": 400},
+}
+
+# OpenAI's prompt caching granularity
+CACHE_MIN_TOKENS = 1024
+CACHE_BLOCK_TOKENS = 128
+
+
+class PrefixCache:
+    """Remembers prompt prefixes as a chain of hashes, one per 128 token block."""
+
+    def __init__(self, max_blocks=200000):
+        self.max_blocks = max_blocks
+        self._blocks = OrderedDict()
+        self._lock = threading.Lock()
+
+    def lookup_and_store(self, tokens):
+        """Returns how many leading tokens were cached, then caches this prompt's prefixes."""
+        cached = 0
+        key = None
+        with self._lock:
+            for start in range(0, len(tokens) - CACHE_BLOCK_TOKENS + 1, CACHE_BLOCK_TOKENS):
+                key = hash((key, tuple(tokens[start:start + CACHE_BLOCK_TOKENS])))
+                if key in self._blocks and cached == start:
+                    cached = start + CACHE_BLOCK_TOKENS
+                    self._blocks.move_to_end(key)
+                else:
+                    self._blocks[key] = True
+            while len(self._blocks) > self.max_blocks:
+                self._blocks.popitem(last=False)
+        return cached if cached >= CACHE_MIN_TOKENS else 0
+
+FILLER = (
+    "The contract sets out the obligations of each party, the payment schedule and the conditions "
+    "under which either party may terminate, with notice periods stated in the relevant clauses. "
+)
+
+
+def _metadata_response():
+    return json.dumps({
+        "contract_type": "Master Services Agreement",
+        "parties": list(PARTIES),
+        "effective_date": EFFECTIVE_DATE,
+        "expiration_date": EXPIRATION_DATE,
+        "summary": "An agreement for the provision of consulting services.",
+    })
+
+
+def _edits_response(prompt):
+    # Change the first "thirty (30) days" in a listed section, or append to the first section
+    for m in re.finditer(r"\[(S\d+)\]\n(.*?)(?=\n\n\s*\[S\d+\]|\n\s*Instruction:)", prompt, re.DOTALL):
+        if "thirty (30) days" in m.group(2):
+            return json.dumps({"edits": [{"section": m.group(1), "find": "thirty (30) days", "replace": "sixty (60) days"}]})
+    m = re.search(r"\[(S\d+)\]\n\s*(\S+(?: \S+){0,3})", prompt)
+    if m is None:
+        return json.dumps({"edits": []})
+    return json.dumps({"edits": [{"section": m.group(1), "find": m.group(2), "replace": m.group(2) + " (amended)"}]})
+
+
+def _classification_response(prompt):
+    ids = re.findall(r"^\s*(\d+): ", prompt, re.M)
+    return json.dumps({i: "Miscellaneous" for i in ids})
+
+
+def _text_response(completion_tokens):
+    words = FILLER.split()
+    # Roughly 0.75 words per token
+    count = max(1, completion_tokens * 3 // 4)
+    return " ".join(words[i % len(words)] for i in range(count))
+
+
+def respond(prompt, profile, response_format=None):
+    """Returns the mock answer for a prompt."""
+    if '"edits"' in prompt:
+        return _edits_response(prompt)
+    if "Classify each contract section" in prompt:
+        return _classification_response(prompt)
+    if response_format and response_format.get("type") == "json_schema":
+        return _metadata_response()
+    title = re.search(r'title the (?:list|response) as "([^"]+)"', prompt)
+    text = _text_response(profile["completion_tokens"])
+    return f"{title.group(1)}\n\n{text}" if title else text
+
+
+class MockOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Set by make_server
+    profile = PROFILES["instant"]
+    per_model = False
+    error_rate = 0.0
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+        # Without this, Nagle's algorithm and delayed ACKs add ~40ms to every kept-alive request
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            return self._send_json(404, {"error": {"message": f"Unknown path {self.path}", "type": "not_found"}})
+        if self.error_rate and random.random() < self.error_rate:
+            return self._send_json(500, {"error": {"message": "Injected failure", "type": "server_error"}})
+
+        prompt = "\n".join(m.get("content") or "" for m in body.get("messages", []) if isinstance(m.get("content"), str))
+        model = body.get("model", "gpt-4o")
+        profile = PROFILES.get(model, self.profile) if self.per_model else self.profile
+        content = respond(prompt, profile, body.get("response_format"))
+        prompt_tokens = encode(prompt)
+        cached_tokens = self.server.prefix_cache.lookup_and_store(prompt_tokens)
+        usage = {
+            "prompt_tokens": len(prompt_tokens),
+            "completion_tokens": count_tokens(content),
+            "prompt_tokens_details": {"cached_tokens": cached_tokens},
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+
+        delay = profile["latency"]
+        if profile["prefill_tokens_per_sec"]:
+            delay += (len(prompt_tokens) - cached_tokens) / profile["prefill_tokens_per_sec"]
+        time.sleep(delay)
+        if body.get("stream"):
+            return self._send_stream(model, profile, content, usage, body.get("stream_options") or {})
+        # A non-streamed answer arrives once it has been fully generated
+        if profile["tokens_per_sec"]:
+            time.sleep(usage["completion_tokens"] / profile["tokens_per_sec"])
+        self._send_json(200, {
+            "id": "chatcmpl-mock",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": usage,
+        })
+
+    def _send_json(self, status, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_stream(self, model, profile, content, usage, stream_options):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        def event(choices, **extra):
+            chunk = {"id": "chatcmpl-mock", "object": "chat.completion.chunk", "created": int(time.time()),
+                     "model": model, "choices": choices, **extra}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.flush()
+
+        # Send about four tokens per chunk, paced at the profile's output rate
+        pieces = re.findall(r"\S+\s*", content) or [content]
+        delay = 4 / profile["tokens_per_sec"] if profile["tokens_per_sec"] else 0
+        for i in range(0, len(pieces), 3):
+            event([{"index": 0, "delta": {"content": "".join(pieces[i:i + 3])}, "finish_reason": None}])
+            if delay:
+                time.sleep(delay)
+        event([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+        if stream_options.get("include_usage"):
+            event([], usage=usage)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+class MockServer(ThreadingHTTPServer):
+    # The default listen backlog of 5 refuses connections when hundreds of load test calls open at once
+    request_queue_size = 1024
+
+
+def make_server(port=8765, profile="instant", error_rate=0.0, host="127.0.0.1", per_model=False):
+    """Returns an unstarted server; port 0 picks a free port (see `server.server_port`)."""
+    handler = type("Handler", (MockOpenAIHandler,), {
+        "profile": PROFILES[profile], "per_model": per_model, "error_rate": error_rate,
+    })
+    server = MockServer((host, port), handler)
+    server.daemon_threads = True
+    # Connections accepted so far, to show how well clients reuse them
+    server.connections = 0
+    server.lock = threading.Lock()
+    server.prefix_cache = PrefixCache()
+    return server
+
+
+def start_in_thread(port=0, profile="instant", error_rate=0.0, per_model=False):
+    """Starts a server on a daemon thread and returns it; call `server.shutdown()` when done."""
+    server = make_server(port, profile, error_rate, per_model=per_model)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def base_url(server):
+    host, port = server.server_address[:2]
+    return f"http://{host}:{port}/v1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="gpt-4o")
+    parser.add_argument("--per-model", action="store_true", help="answer gpt-4o and gpt-4o-mini at their own speed")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = make_server(args.port, args.profile, args.error_rate, per_model=args.per_model)
+    print(f"mock OpenAI ({args.profile}) listening on {base_url(server)}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""Offline check of the text normalization stage.
+
+    python -m benchmarks.normalize_eval [--pages 2 20 100] [--live]
+
+For each synthetic contract PDF, extracts the pages, normalizes them and
+reports the tokens before and after. Then checks that nothing the app relies on
+was lost: the title, parties and dates are still in the text, clause
+segmentation finds the same headings, and Q&A retrieval over the sample
+agreement from `retrieval_eval` (with a header, footer and split words added)
+ranks the expected sections as it does on the clean text.
+
+`--live` also asks the model (OPENAI_API_KEY) for metadata on the raw and the
+normalized text of the 20 page contract and compares the two.
+
+Exits with status 1 if any check fails.
+"""
+import argparse
+import io
+import os
+import sys
+
+from benchmarks.corpus import EFFECTIVE_DATE, EXPIRATION_DATE, PARTIES, make_contract_pdf
+from benchmarks.retrieval_eval import CONTRACT_PAGES, QUESTIONS
+from clauses import segment
+from normalize import MIN_PAGES, normalize_pages
+from pdf_extract import extract_pages, shutdown_pool
+from retrieval import BM25Index, split_into_chunks
+
+TITLE = "MASTER SERVICES AGREEMENT"
+
+
+def check(failures, ok, message):
+    print(f"  {'ok  ' if ok else 'FAIL'} {message}")
+    if not ok:
+        failures.append(message)
+
+
+def headings(text):
+    return [(s["number"], s["heading"]) for s in segment(text)]
+
+
+def check_corpus(page_count, failures):
+    raw = extract_pages(io.BytesIO(make_contract_pdf(page_count)))
+    pages, report = normalize_pages(raw)
+    text = "".join(pages)
+    print(f"\n{page_count} pages: {report['tokens_before']} -> {report['tokens_after']} tokens "
+          f"({report['saved_pct']:.1f}% saved), {report['header_footer_lines']} header/footer lines, "
+          f"{report['page_number_lines']} page numbers, {report['hyphens_joined']} hyphens joined")
+    check(failures, len(pages) == len(raw), "one page out for every page in")
+    check(failures, report["tokens_after"] <= report["tokens_before"], "no more tokens than before")
+    for value in (TITLE, *PARTIES, EFFECTIVE_DATE, EXPIRATION_DATE):
+        check(failures, value in text, f"keeps {value!r}")
+    if page_count >= MIN_PAGES:
+        check(failures, f"{TITLE} - CONFIDENTIAL" not in text, "drops the running header")
+    check(failures, f"of {page_count}" not in text, "drops the page number footers")
+    check(failures, headings(text) == headings("".join(raw)), "clause headings unchanged")
+
+
+def decorate(pages):
+    # The retrieval sample as a PDF would extract it: running header, page footer and a split word
+    decorated = []
+    for page_no, page in enumerate(pages, start=1):
+        page = page.replace("Confidential Information secret", "Confiden-\ntial Information secret")
+        decorated.append(f"NORTHWIND / CONTOSO MSA\n{page}\nPage {page_no} of {len(pages)}\n")
+    return decorated
+
+
+def ranks(pages, k=5):
+    index = BM25Index(split_into_chunks(pages))
+    result = []
+    for question, expected in QUESTIONS:
+        found = [chunk["heading"] for chunk, _ in index.search(question, k=k)]
+        result.append(found.index(expected) + 1 if expected in found else None)
+    return result
+
+
+def check_retrieval(failures):
+    pages, report = normalize_pages(decorate(CONTRACT_PAGES))
+    print(f"\nretrieval sample: {report['tokens_before']} -> {report['tokens_after']} tokens")
+    check(failures, "Confidential Information secret" in "".join(pages), "rejoins hyphenated words")
+    check(failures, ranks(pages) == ranks(CONTRACT_PAGES), "retrieval ranks match the clean text")
+
+
+def check_repeated_body(failures):
+    # Short pages whose clause headings and sentences repeat must not lose them as "running headers"
+    body = "{n}. CONFIDENTIALITY\nThe Receiving Party shall keep Confidential Information strictly confidential.\n"
+    raw = [f"ACME NDA\n{body.format(n=n)}Page {n} of 5\n" for n in range(1, 6)]
+    pages, _ = normalize_pages(raw)
+    check(failures, pages == [body.format(n=n) for n in range(1, 6)], "keeps repeated headings and sentences")
+
+
+def check_live(failures):
+    from openai_client import create_client
+    from pipeline import ContractPipeline
+
+    pipeline = ContractPipeline(create_client(), normalize=False)
+    raw = extract_pages(io.BytesIO(make_contract_pdf(20)))
+    pages, _ = normalize_pages(raw)
+    before = pipeline.extract_metadata("".join(raw))
+    after = pipeline.extract_metadata("".join(pages))
+    print("\nlive metadata (raw / normalized):")
+    for key in ("contract_type", "parties", "effective_date", "expiration_date"):
+        print(f"  {key}: {getattr(before, key)!r} / {getattr(after, key)!r}")
+    check(failures, sorted(before.parties) == sorted(after.parties), "same parties")
+    check(failures, (before.effective_date, before.expiration_date) == (after.effective_date, after.expiration_date),
+          "same dates")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, nargs="+", default=[2, 20, 100])
+    parser.add_argument("--live", action="store_true", help="compare model metadata on raw and normalized text")
+    args = parser.parse_args()
+
+    failures = []
+    try:
+        for page_count in args.pages:
+            check_corpus(page_count, failures)
+    finally:
+        shutdown_pool()
+    check_retrieval(failures)
+    check_repeated_body(failures)
+    if args.live:
+        if os.environ.get("OPENAI_API_KEY"):
+            check_live(failures)
+        else:
+            print("\n--live needs OPENAI_API_KEY; skipped")
+
+    print(f"\n{len(failures)} check(s) failed" if failures else "\nall checks passed")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""Offline check for the near-duplicate Q&A question cache.
+
+Stores one question per pair against the synthetic agreement from
+`retrieval_eval`, then looks up the other question with the app's settings
+(contract IDF, top retrieved section, default threshold). Rewordings must be
+answered from the cache; questions that differ in who or what they ask about
+(the other party, another clause) must not be.
+
+    python -m benchmarks.qa_cache_eval [--threshold 0.8]
+"""
+import argparse
+import sys
+
+from benchmarks.retrieval_eval import CONTRACT_PAGES
+from question_cache import QuestionCache
+from retrieval import BM25Index, split_into_chunks
+
+# (stored question, new question)
+SAME = [
+    ("What is the notice period to terminate?", "What's the notice period to terminate?"),
+    ("Is there a cap on liability?", "Is there a liability cap?"),
+    ("Which law governs the agreement?", "Which law governs this agreement?"),
+    ("Can the customer terminate for convenience?", "Can the customer terminate for convenience?"),
+]
+DIFFERENT = [
+    ("Can the customer terminate for convenience?", "Can the provider terminate for convenience?"),
+    ("Is the customer liable for lost profits?", "Is the provider liable for lost profits?"),
+    ("When must the customer pay invoices?", "When must the provider pay invoices?"),
+    ("How long do confidentiality obligations survive?", "How long do non-solicitation obligations survive?"),
+    ("Is interest charged on late payments?", "Is interest charged on late payments after 30 days?"),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threshold", type=float, default=0.8)
+    args = parser.parse_args()
+
+    index = BM25Index(split_into_chunks(CONTRACT_PAGES))
+
+    def top_section(question):
+        results = index.search(question, k=1)
+        return results[0][0]["id"] if results else None
+
+    failures = 0
+    for expected, pairs in (("hit", SAME), ("miss", DIFFERENT)):
+        for stored, asked in pairs:
+            cache = QuestionCache(threshold=args.threshold)
+            cache.put("contract", stored, "answer", 1.0, idf=index.idf, top_section=top_section(stored))
+            similar = cache.lookup("contract", asked, idf=index.idf, top_section=top_section(asked))
+            ok = (similar is not None) == (expected == "hit")
+            failures += not ok
+            print(f"  {'ok  ' if ok else 'FAIL'} {expected:<4} {stored!r} / {asked!r}")
+
+    print(f"\n{failures} check(s) failed" if failures else "\nall checks passed")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Offline quality check for the Q&A clause retrieval.
+
+Builds the retrieval index over a small synthetic services agreement and checks
+that each question's expected section is among the top-k chunks. Also reports
+how many tokens each question sends compared with the full contract.
+
+    python -m benchmarks.retrieval_eval [--k 5]
+"""
+import argparse
+
+from retrieval import BM25Index, format_chunks, split_into_chunks
+from tokens import count_tokens
+
+CONTRACT_PAGES = [
+    """MASTER SERVICES AGREEMENT
+This Master Services Agreement is entered into on March 1, 2024 by and between
+Northwind Traders Ltd ("Customer") and Contoso Consulting LLC ("Provider").
+1. DEFINITIONS
+"Confidential Information" means any non-public information disclosed by either party.
+"Deliverables" means the work product provided by Provider under a Statement of Work.
+"Services" means the consulting services described in each Statement of Work.
+2. SERVICES
+Provider shall perform the Services described in each Statement of Work with reasonable
+skill and care and in accordance with good industry practice.
+""",
+    """3. FEES AND PAYMENT
+Customer shall pay all undisputed invoices within forty-five (45) days of receipt.
+Late payments accrue interest at one percent (1%) per month. Fees are exclusive of VAT.
+4. TERM
+This Agreement commences on the Effective Date and continues for an initial term of
+two (2) years, renewing automatically for successive one-year periods.
+5. TERMINATION
+Either party may terminate this Agreement for convenience on ninety (90) days written
+notice. Either party may terminate immediately if the other commits a material breach
+that is not remedied within thirty (30) days of notice.
+""",
+    """6. CONFIDENTIALITY
+Each party shall keep the other party's Confidential Information secret and use it only
+to perform this Agreement. These obligations survive for five (5) years after termination.
+7. INTELLECTUAL PROPERTY
+All Deliverables and intellectual property rights created by Provider vest in Customer on
+payment in full. Provider retains its pre-existing tools and know-how.
+8. LIMITATION OF LIABILITY
+Neither party's total liability shall exceed the fees paid in the twelve (12) months before
+the claim. Neither party is liable for indirect or consequential loss or lost profits.
+""",
+    """9. INDEMNITY
+Provider shall indemnify Customer against third-party claims that the Deliverables infringe
+any intellectual property right.
+10. DATA PROTECTION
+Provider shall process personal data only on Customer's documented instructions and shall
+notify Customer of any personal data breach within forty-eight (48) hours.
+11. GOVERNING LAW
+This Agreement is governed by the laws of England and Wales, and the courts of London have
+exclusive jurisdiction over any dispute.
+12. NON-SOLICITATION
+Neither party shall solicit or hire the other party's employees during the term and for
+twelve (12) months afterwards.
+""",
+]
+
+# (question, heading the answer lives under)
+QUESTIONS = [
+    ("How long do we have to pay an invoice?", "3. FEES AND PAYMENT"),
+    ("Is interest charged on late payments?", "3. FEES AND PAYMENT"),
+    ("What notice period applies to terminate for convenience?", "5. TERMINATION"),
+    ("Can the contract be ended if the other side breaches it?", "5. TERMINATION"),
+    ("How long does the agreement last and does it renew?", "4. TERM"),
+    ("How long do confidentiality obligations survive?", "6. CONFIDENTIALITY"),
+    ("Who owns the deliverables and intellectual property?", "7. INTELLECTUAL PROPERTY"),
+    ("Is there a cap on liability?", "8. LIMITATION OF LIABILITY"),
+    ("Are consequential losses or lost profits excluded?", "8. LIMITATION OF LIABILITY"),
+    ("Does the provider indemnify us for infringement claims?", "9. INDEMNITY"),
+    ("How quickly must a personal data breach be reported?", "10. DATA PROTECTION"),
+    ("Which country's law governs the agreement?", "11. GOVERNING LAW"),
+    ("Can we hire the provider's staff?", "12. NON-SOLICITATION"),
+    ("What does Confidential Information mean?", "1. DEFINITIONS"),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--k", type=int, default=5, help="chunks retrieved per question")
+    parser.add_argument("--max-tokens", type=int, default=350, help="token budget per chunk")
+    args = parser.parse_args()
+
+    chunks = split_into_chunks(CONTRACT_PAGES, max_tokens=args.max_tokens)
+    index = BM25Index(chunks)
+    full_tokens = count_tokens("".join(CONTRACT_PAGES))
+
+    hits = 0
+    reciprocal_ranks = 0.0
+    sent_tokens = 0
+    for question, expected in QUESTIONS:
+        results = index.search(question, k=args.k)
+        headings = [chunk["heading"] for chunk, _ in results]
+        rank = headings.index(expected) + 1 if expected in headings else None
+        hits += rank is not None
+        reciprocal_ranks += 1 / rank if rank else 0.0
+        sent_tokens += count_tokens(format_chunks(index.retrieve(question, k=args.k)))
+        status = f"rank {rank}" if rank else "MISS"
+        print(f"{status:>7}  {question}  ->  {headings[:3]}")
+
+    n = len(QUESTIONS)
+    print()
+    print(f"chunks: {len(chunks)}  questions: {n}  k: {args.k}")
+    print(f"recall@{args.k}: {hits / n:.2f}  MRR: {reciprocal_ranks / n:.2f}")
+    print(f"avg tokens sent: {sent_tokens / n:.0f} vs full text {full_tokens} "
+          f"({100 * sent_tokens / n / full_tokens:.0f}%)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""End-to-end benchmark of the contract pipeline against the mock OpenAI server.
+
+    python -m benchmarks.run_pipeline [--pages 2 20 100 500] [--profile instant] [--repeat 3] [--route-models]
+                                      [--output results.json] [--compare baseline.json] [--threshold 0.2]
+
+For each corpus size, generates a synthetic contract PDF and drives every step
+of the app headlessly through `ContractPipeline`: page extraction, text
+normalization, metadata, each Quick Action, Q&A and Modify. Response caching is
+off, so every step makes its real calls to the mock server. Reports per-stage
+p50/p99 latency, pages per second, tokens sent and received and peak RSS.
+
+`--route-models` sends each action to its model tier (see `routing.py`) and
+has the mock answer gpt-4o-mini and gpt-4o at their own profile's speed, to
+compare against a run where every call goes to the default model.
+
+`--output` writes the results as JSON; `--compare` loads an earlier output and
+exits with status 1 if any stage's p50 latency got more than `--threshold`
+slower.
+"""
+import argparse
+import io
+import json
+import platform
+import resource
+import sys
+import time
+
+from benchmarks.corpus import make_contract_pdf
+from benchmarks.mock_openai import PROFILES, base_url, start_in_thread
+from doc_cache import document_hash
+from metrics import MetricsRecorder, percentile
+from openai_client import create_client
+from pdf_extract import shutdown_pool
+from pipeline import QUICK_ACTIONS, ContractPipeline, build_metadata_summary, build_retrieval_index
+from routing import ModelRouter
+
+QUESTIONS = [
+    "When are invoices due and what interest applies to late payments?",
+    "How much notice is needed to terminate the agreement?",
+    "Which law governs the agreement?",
+]
+MODIFY_INSTRUCTION = "Extend the thirty (30) day cure period for material breach to sixty (60) days."
+
+# Stages faster than this are too noisy to flag as regressions
+MIN_COMPARABLE_SECONDS = 0.01
+
+
+def peak_rss_mb():
+    # ru_maxrss is in KiB on Linux and bytes on macOS; children covers the PDF process pool
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    peak = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+    return round(peak / scale, 1)
+
+
+def timed(timings, stage, fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    timings.setdefault(stage, []).append(time.perf_counter() - started)
+    return result
+
+
+def run_once(pipeline, data, timings):
+    """Runs every step of the app once on the PDF bytes."""
+    doc_hash = document_hash(data)
+    pages = timed(timings, "extract", pipeline.extract_pages_from_pdf, io.BytesIO(data))
+    pages, _ = timed(timings, "normalize", pipeline.prepare_pages, pages)
+    text = "".join(pages)
+    metadata = timed(timings, "metadata", pipeline.call_openai_for_metadata, text, pages)
+    metadata_summary = build_metadata_summary(metadata)
+    for action in QUICK_ACTIONS:
+        timed(timings, action["name"], pipeline.run_quick_action, action, doc_hash, metadata_summary, text, pages)
+
+    index = timed(timings, "qa_index", build_retrieval_index, pages)
+    for question in QUESTIONS:
+        prompt, _ = pipeline.prepare_qa_prompt(index, metadata_summary, question)
+        timed(timings, "qa", pipeline.ask, prompt, "qa")
+
+    result = timed(timings, "modify", pipeline.modify, text, MODIFY_INSTRUCTION)
+    return result is not None and bool(result[1])
+
+
+def run_size(client, page_count, repeat, context_budget, map_workers, router=None):
+    data = make_contract_pdf(page_count)
+    metrics = MetricsRecorder()
+    pipeline = ContractPipeline(client, metrics=metrics, context_budget=context_budget, map_workers=map_workers,
+                                router=router)
+    timings = {}
+    modified = True
+    started = time.perf_counter()
+    for _ in range(repeat):
+        modified = run_once(pipeline, data, timings) and modified
+    elapsed = time.perf_counter() - started
+
+    records = list(metrics.records)
+    return {
+        "pages": page_count,
+        "runs": repeat,
+        "seconds": round(elapsed, 3),
+        "pages_per_second": round(page_count * repeat / elapsed, 2),
+        "llm_calls": len(records),
+        "llm_errors": sum(bool(r["error"]) for r in records),
+        "prompt_tokens": sum(r["prompt_tokens"] for r in records) // repeat,
+        "completion_tokens": sum(r["completion_tokens"] for r in records) // repeat,
+        "cached_tokens": sum(r["cached_tokens"] for r in records) // repeat,
+        "modify_applied": modified,
+        "cost_usd": round(sum(r["cost_usd"] for r in records) / repeat, 4),
+        "tiers": metrics.tier_summary(),
+        "peak_rss_mb": peak_rss_mb(),
+        "stages": {
+            stage: {
+                "p50": round(percentile(values, 50), 4),
+                "p99": round(percentile(values, 99), 4),
+                "count": len(values),
+            }
+            for stage, values in timings.items()
+        },
+    }
+
+
+def print_result(result):
+    print(f"\n{result['pages']} pages: {result['seconds']:.2f}s for {result['runs']} run(s), "
+          f"{result['pages_per_second']:.1f} pages/s, {result['llm_calls']} calls ({result['llm_errors']} errors), "
+          f"peak RSS {result['peak_rss_mb']} MB")
+    print(f"  tokens per run: {result['prompt_tokens']} prompt ({result.get('cached_tokens', 0)} cached), "
+          f"{result['completion_tokens']} completion, ${result.get('cost_usd', 0):.4f}"
+          f"{'' if result['modify_applied'] else '  MODIFY PRODUCED NO CHANGE'}")
+    for tier in result.get("tiers", []):
+        print(f"  tier {tier['tier']:<6} {tier['models']:<12} calls {tier['calls']:>4}  invalid {tier['invalid']:>3}  "
+              f"p50 {tier['p50_latency'] or 0:.3f}s  tokens {tier['prompt_tokens'] + tier['completion_tokens']:>8}")
+    print(f"  {'stage':<10} {'p50 s':>8} {'p99 s':>8} {'n':>4}")
+    for stage, s in result["stages"].items():
+        print(f"  {stage:<10} {s['p50']:>8.3f} {s['p99']:>8.3f} {s['count']:>4}")
+
+
+def compare(results, baseline, threshold):
+    """Returns the stages whose p50 latency regressed by more than `threshold`."""
+    previous = {r["pages"]: r for r in baseline["results"]}
+    regressions = []
+    for result in results:
+        before = previous.get(result["pages"])
+        if before is None:
+            continue
+        for stage, s in result["stages"].items():
+            old = before["stages"].get(stage)
+            if old is None or max(old["p50"], s["p50"]) < MIN_COMPARABLE_SECONDS:
+                continue
+            change = (s["p50"] - old["p50"]) / old["p50"] if old["p50"] else float("inf")
+            marker = "REGRESSION" if change > threshold else ""
+            print(f"  {result['pages']:>4} pages {stage:<10} {old['p50']:>8.3f} -> {s['p50']:>8.3f} {change:>+7.0%} {marker}")
+            if marker:
+                regressions.append((result["pages"], stage, change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, nargs="+", default=[2, 20, 100, 500])
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="instant")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--context-budget", type=int, default=100000)
+    parser.add_argument("--map-workers", type=int, default=4)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON from an earlier --output run")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed p50 slowdown, 0.2 = 20%%")
+    parser.add_argument("--route-models", action="store_true", help="send each action to its model tier")
+    args = parser.parse_args()
+
+    server = start_in_thread(profile=args.profile, per_model=args.route_models)
+    client = create_client(api_key="bench", base_url=base_url(server))
+    router = ModelRouter() if args.route_models else None
+    print(f"mock server {base_url(server)}  profile: {args.profile}  repeat: {args.repeat}"
+          f"{'  routed by model tier' if router else ''}")
+    try:
+        results = []
+        for page_count in args.pages:
+            result = run_size(client, page_count, args.repeat, args.context_budget, args.map_workers, router)
+            print_result(result)
+            results.append(result)
+    finally:
+        shutdown_pool()
+        server.shutdown()
+
+    report = {
+        "profile": args.profile,
+        "route_models": args.route_models,
+        "repeat": args.repeat,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nwrote {args.output}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(f"\np50 latency against {args.compare} (threshold {args.threshold:.0%}):")
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} stage(s) regressed")
+            sys.exit(1)
+        print("no regressions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+"""Local clause segmentation for "Extract Clauses".
+
+Finds the section hierarchy of a contract from its headings (numbered
+`1.` / `1.2.3` headings, `ARTICLE`/`Section` headings, all-caps lines and
+quoted defined-term blocks), then classifies each section against a keyword
+taxonomy. Only sections the taxonomy cannot place are sent to the model, in a
+single small batched prompt.
+"""
+import json
+import re
+from collections import Counter
+
+from normalize import page_for_offset
+from prompts import document_prompt
+
+# Category -> keywords matched against the heading first, then the body
+TAXONOMY = {
+    "Recitals": ["recitals", "whereas", "background"],
+    "Definitions": ["definition", "interpretation", "defined term", "means"],
+    "Scope of Services": ["services", "scope", "statement of work", "deliverable", "obligations of"],
+    "Term": ["term", "duration", "renewal", "commencement"],
+    "Termination": ["termination", "terminate", "expiry", "cancellation"],
+    "Payment Terms": ["payment", "fees", "invoice", "price", "compensation", "charges", "expenses"],
+    "Confidentiality": ["confidential", "non-disclosure", "nondisclosure", "secrecy"],
+    "Intellectual Property": ["intellectual property", "ownership", "licence", "license", "copyright", "patent"],
+    "Warranties": ["warrant", "representation"],
+    "Limitation of Liability": ["limitation of liability", "liability", "consequential"],
+    "Indemnification": ["indemn", "hold harmless"],
+    "Insurance": ["insurance"],
+    "Data Protection": ["data protection", "personal data", "privacy", "gdpr"],
+    "Non-Solicitation": ["non-solicitation", "solicit"],
+    "Non-Compete": ["non-compete", "restrictive covenant", "compete"],
+    "Force Majeure": ["force majeure"],
+    "Assignment": ["assignment", "assign", "subcontract"],
+    "Notices": ["notices", "notice"],
+    "Governing Law": ["governing law", "jurisdiction", "applicable law"],
+    "Dispute Resolution": ["dispute", "arbitration", "mediation"],
+    "Entire Agreement": ["entire agreement", "whole agreement"],
+    "Amendments": ["amendment", "variation", "modification"],
+    "Severability": ["severab", "invalidity"],
+    "Miscellaneous": ["miscellaneous", "general provisions", "general"],
+}
+
+NUMBERED_RE = re.compile(r"^[ \t]*(?P<number>\d+(?:\.\d+)*)(?:\.|\))?[ \t]+(?P<title>[A-Z][^\n]*)$", re.M)
+ARTICLE_RE = re.compile(
+    r"^[ \t]*(?P<number>(?:ARTICLE|Article|SECTION|Section|SCHEDULE|Schedule|EXHIBIT|Exhibit)[ \t]+[0-9IVXLC]+)"
+    r"[ \t]*[.:\-]?[ \t]*(?P<title>[^\n]*)$",
+    re.M,
+)
+CAPS_RE = re.compile(r"^[ \t]*(?P<title>[A-Z][A-Z0-9 ,&'/\-]{3,60})[ \t]*$", re.M)
+DEFINITION_RE = re.compile(r"^[ \t]*[\"“](?P<term>[^\"”\n]{1,60})[\"”][ \t]+(?:means|shall mean|has the meaning)", re.M)
+
+# Longest a numbered line can be and still count as a heading rather than a numbered paragraph
+MAX_HEADING_WORDS = 10
+
+
+def _heading_title(title):
+    """Returns the heading part of a numbered line, or None if it reads like body text.
+
+    Handles both "5. TERMINATION" and run-in headings like "5. Termination. Either party may...".
+    """
+    title = title.strip()
+    run_in = re.match(r"^([A-Z][^.:\n]{1,60})[.:]\s+\S", title)
+    if run_in and len(run_in.group(1).split()) <= MAX_HEADING_WORDS:
+        return run_in.group(1).strip()
+    if len(title.split()) <= MAX_HEADING_WORDS and not title.endswith((",", ";")):
+        return title.rstrip(".:")
+    return None
+
+
+def _find_headings(text):
+    headings = {}
+    for m in NUMBERED_RE.finditer(text):
+        title = _heading_title(m.group("title"))
+        if title is None:
+            continue
+        number = m.group("number")
+        headings[m.start()] = {"number": number, "heading": title, "level": number.count(".") + 1}
+    for m in ARTICLE_RE.finditer(text):
+        # Articles and schedules sit above numbered clauses
+        headings[m.start()] = {"number": m.group("number"), "heading": m.group("title").strip(" .:-"), "level": 0}
+    caps = list(CAPS_RE.finditer(text))
+    # An all-caps line repeated on many pages is a running header, not a section
+    repeats = Counter(m.group("title").strip() for m in caps)
+    for m in caps:
+        title = m.group("title").strip()
+        if m.start() not in headings and repeats[title] <= 2 and sum(c.isalpha() for c in title) >= 4:
+            headings[m.start()] = {"number": "", "heading": title, "level": 1}
+    return [dict(start=start, **headings[start]) for start in sorted(headings)]
+
+
+def segment(text):
+    """Splits contract text into sections.
+
+    Returns dicts with `number`, `heading`, `level`, `start`/`end` character
+    offsets into `text`, `parent` (index of the enclosing section or None) and
+    `definitions` (defined terms found inside the section).
+    """
+    headings = _find_headings(text)
+    sections = []
+    stack = []
+    for i, h in enumerate(headings):
+        end = headings[i + 1]["start"] if i + 1 < len(headings) else len(text)
+        while stack and sections[stack[-1]]["level"] >= h["level"]:
+            stack.pop()
+        body = text[h["start"]:end]
+        sections.append({
+            "number": h["number"],
+            "heading": h["heading"],
+            "level": h["level"],
+            "start": h["start"],
+            "end": end,
+            "parent": stack[-1] if stack else None,
+            "definitions": [m.group("term") for m in DEFINITION_RE.finditer(body)],
+        })
+        stack.append(len(sections) - 1)
+    return sections
+
+
+def _match_category(text, min_hits):
+    text = text.lower()
+    best, best_score, best_hits = None, 0, 0
+    for category, keywords in TAXONOMY.items():
+        hits = 0
+        score = 0
+        for keyword in keywords:
+            count = len(re.findall(r"\b" + re.escape(keyword), text))
+            hits += count
+            # Longer keywords are more specific: "termination" beats "term"
+            score += count * len(keyword)
+        if score > best_score:
+            best, best_score, best_hits = category, score, hits
+    return best if best_hits >= min_hits else None
+
+
+def classify(sections, text):
+    """Sets `category` on each section from the keyword taxonomy (None if unknown).
+
+    The heading decides when it matches anything. Otherwise a block of defined
+    terms is Definitions, a subsection inherits its parent's category, and the
+    body must mention a category's keywords at least twice.
+    """
+    for i, section in enumerate(sections):
+        if i == 0 and not section["number"] and section["start"] < 200:
+            # Unnumbered opening heading: the contract title and who it is between
+            section["category"] = "Preamble"
+            continue
+        category = _match_category(section["heading"], 1)
+        if category is None and len(section["definitions"]) >= 2:
+            category = "Definitions"
+        if category is None and section["parent"] is not None:
+            category = sections[section["parent"]]["category"]
+        if category is None:
+            category = _match_category(text[section["start"]:section["end"]], 2)
+        section["category"] = category
+    return sections
+
+
+def classify_with_model(sections, text, ask):
+    """Classifies the remaining sections with one model call via `ask(prompt)`.
+
+    Anything the model does not place is labelled "Other".
+    """
+    unknown = [i for i, s in enumerate(sections) if s["category"] is None]
+    if not unknown:
+        return sections
+    listing = "\n".join(
+        f'{i}: {sections[i]["heading"]} -- {" ".join(text[sections[i]["start"]:sections[i]["end"]].split())[:300]}'
+        for i in unknown
+    )
+    prompt = document_prompt(
+        listing,
+        f"""Classify each contract section above into exactly one of these categories:
+{", ".join(TAXONOMY)}, Other
+
+Respond only with a JSON object mapping each id to its category, e.g. {{"3": "Termination"}}.""",
+        label="Sections (id: heading -- opening text)",
+    )
+    try:
+        labels = json.loads(re.sub(r"```(?:json)?\s*(.*?)```", r"\1", ask(prompt).strip(), flags=re.DOTALL))
+    except (ValueError, TypeError):
+        labels = {}
+    for i in unknown:
+        label = labels.get(str(i)) if isinstance(labels, dict) else None
+        sections[i]["category"] = label if label in TAXONOMY else "Other"
+    # Subsections of newly classified sections follow their parent
+    for section in sections:
+        if section["category"] == "Other" and section["parent"] is not None:
+            section["category"] = sections[section["parent"]]["category"]
+    return sections
+
+
+def clause_table(sections, offsets=None):
+    """Renders the sections as a compact markdown table.
+
+    With `offsets` (see `normalize.page_offsets`) the last column gives each
+    section's pages instead of its character range.
+    """
+    if not sections:
+        return "No clause headings were found in this contract."
+    location = "Pages" if offsets else "Characters"
+    rows = [f"| Section | Heading | Category | {location} |", "| --- | --- | --- | --- |"]
+    for s in sections:
+        indent = "&nbsp;&nbsp;" * (s["level"] - 1)
+        heading = s["heading"].replace("|", "/")
+        if offsets:
+            first, last = page_for_offset(offsets, s["start"]), page_for_offset(offsets, max(s["start"], s["end"] - 1))
+            span = str(first) if first == last else f"{first}-{last}"
+        else:
+            span = f"{s['start']}-{s['end']}"
+        rows.append(f"| {indent}{s['number']} | {heading} | {s['category']} | {span} |")
+    return "\n".join(rows)
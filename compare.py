@@ -0,0 +1,282 @@
+"""Clause index shared across contracts, and clause-by-clause comparison.
+
+`ClauseIndex` is shared by every session. Each contract added to it is split
+into clauses locally (see `clauses.py`), and each clause is keyed by its
+normalized heading rather than its number, so "7. TERMINATION" in one version
+of an agreement matches "8. Termination" in the next. Clause bodies are
+compared with whitespace ignored.
+
+`ClauseIndex.compare` lines the clauses of several contracts up by key, using
+the index's map from each clause key to the contracts that have it, and decides
+locally which ones read the same in every contract. Only the clauses that differ
+(changed, or missing from some contracts) go to the model, so comparing three
+versions of an agreement that differ in two clauses sends those two clauses
+instead of three full contracts.
+"""
+import difflib
+import re
+import threading
+from collections import Counter, OrderedDict
+
+from clauses import classify, segment
+from prompts import document_prompt
+
+# Letters the contracts are referred to by in reports and prompts
+LABELS = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+
+COMPARE_TASK = """The contracts above were compared clause by clause; only the clauses that differ between them are shown, and every other clause reads the same in all of them.
+For each clause, explain in plain English what differs between the contracts, and which party each difference favours.
+Finish with a short overall summary of the most important differences."""
+
+COMPARE_TITLE = "Contract Comparison"
+
+# A run of non-blank lines; the clauses of a contract without headings
+PARAGRAPH_RE = re.compile(r"\S(?:.|\n(?!\s*\n))*")
+
+
+def _heading_key(heading):
+    return re.sub(r"[^a-z0-9]+", " ", heading.lower()).strip()
+
+
+def _untitled(heading, start, end):
+    # A stretch of text with no heading of its own, shaped like a segment() section
+    return {"number": "", "heading": heading, "level": 1, "start": start, "end": end, "parent": None,
+            "definitions": [], "untitled": True}
+
+
+def _sections(text):
+    """Returns the contract's sections. Text before the first heading (e.g. the parties above
+    "1. TERM") is a "Preamble" section; a contract without headings is split into paragraphs."""
+    sections = segment(text)
+    if not sections:
+        return [_untitled(f"Paragraph {i + 1}", m.start(), m.end()) for i, m in enumerate(PARAGRAPH_RE.finditer(text))]
+    if text[:sections[0]["start"]].strip():
+        for section in sections:
+            if section["parent"] is not None:
+                section["parent"] += 1
+        sections.insert(0, _untitled("Preamble", 0, sections[0]["start"]))
+    return sections
+
+
+def _body_start(text, section):
+    """Returns where the clause text starts: after the heading title, which for a run-in heading
+    ("2. Termination. Either party may...") is followed by the clause on the same line."""
+    if section.get("untitled"):
+        return section["start"]
+    line_end = text.find("\n", section["start"], section["end"])
+    line_end = section["end"] if line_end < 0 else line_end
+    title = text.find(section["heading"], section["start"], line_end)
+    if title < 0:
+        return line_end
+    start = title + len(section["heading"])
+    return start + 1 if text[start:start + 1] in (".", ":") else start
+
+
+def extract_clauses(text):
+    """Returns the contract's clauses as dicts with `key`, `number`, `heading`, `category` and
+    `body` (the clause text after its heading, on one line), including any text before the
+    first heading. Classification is local only."""
+    sections = classify(_sections(text), text)
+    seen = Counter()
+    clauses = []
+    for section in sections:
+        heading_key = _heading_key(section["heading"]) or "untitled"
+        seen[heading_key] += 1
+        # A heading used more than once is told apart by its occurrence
+        key = heading_key if seen[heading_key] == 1 else f"{heading_key} #{seen[heading_key]}"
+        clauses.append({
+            "key": key,
+            "number": section["number"],
+            "heading": section["heading"],
+            "category": section["category"],
+            "body": " ".join(text[_body_start(text, section):section["end"]].split()),
+        })
+    return clauses
+
+
+def _clauses_size(clauses):
+    # Approximate memory taken by a contract's clauses: the length of their text
+    return sum(len(c["key"]) + len(c["heading"]) + len(c["body"]) for c in clauses)
+
+
+class ClauseIndex:
+    """Clauses of the most recently used contracts, keyed by document hash, with a shared map
+    from clause key to the documents that have that clause.
+
+    Holds at most `max_documents` contracts and, with `max_bytes`, at most about that much
+    clause text; the least recently used contracts are dropped first, except those being
+    compared at the time.
+    """
+
+    def __init__(self, max_documents=64, max_bytes=None):
+        self.max_documents = max_documents
+        self.max_bytes = max_bytes
+        # doc_hash -> {clause key: clause}, in the contract's order
+        self._documents = OrderedDict()
+        # doc_hash -> approximate size of its clauses
+        self._sizes = {}
+        # clause key -> documents that have it
+        self._keys = {}
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def _store(self, doc_hash, clauses, keep=()):
+        # Caller holds the lock. Documents in `keep` are not evicted.
+        self._documents[doc_hash] = {clause["key"]: clause for clause in clauses}
+        self._sizes[doc_hash] = _clauses_size(clauses)
+        for clause in clauses:
+            self._keys.setdefault(clause["key"], set()).add(doc_hash)
+        # The newest document is kept even if it alone is over max_bytes
+        while len(self._documents) > 1 and (
+            len(self._documents) > self.max_documents
+            or (self.max_bytes and sum(self._sizes.values()) > self.max_bytes)
+        ):
+            evicted = next((d for d in self._documents if d != doc_hash and d not in keep), None)
+            if evicted is None:
+                break
+            old = self._documents.pop(evicted)
+            del self._sizes[evicted]
+            self.evictions += 1
+            for key in old:
+                holders = self._keys[key]
+                holders.discard(evicted)
+                if not holders:
+                    del self._keys[key]
+
+    def add(self, doc_hash, text):
+        """Indexes a contract, unless it already is."""
+        with self._lock:
+            if doc_hash in self._documents:
+                self._documents.move_to_end(doc_hash)
+                return
+        clauses = extract_clauses(text)
+        with self._lock:
+            if doc_hash not in self._documents:
+                self._store(doc_hash, clauses)
+
+    def compare(self, documents):
+        """Lines up the clauses of several contracts, given as (doc_hash, text) in order.
+
+        Returns one row per clause key, in the order the clauses first appear, with
+        `key`, `heading`, `category`, `clauses` (one clause or None per contract) and
+        `status`: "same" when every contract has it with the same text, "changed"
+        when every contract has it but the text differs, "partial" when some lack it.
+        """
+        for doc_hash, text in documents:
+            self.add(doc_hash, text)
+        doc_hashes = [doc_hash for doc_hash, _ in documents]
+        selected = set(doc_hashes)
+        with self._lock:
+            # A contract pushed out since (by the others, or another session) is split up again,
+            # and the ones being compared stay until the next add, even if they are over the limits
+            for doc_hash, text in documents:
+                if doc_hash not in self._documents:
+                    self._store(doc_hash, extract_clauses(text), keep=selected)
+                self._documents.move_to_end(doc_hash)
+            rows = []
+            for key in dict.fromkeys(key for doc_hash in doc_hashes for key in self._documents[doc_hash]):
+                clauses = [self._documents[doc_hash].get(key) for doc_hash in doc_hashes]
+                first = next(c for c in clauses if c is not None)
+                if not selected <= self._keys[key]:
+                    status = "partial"
+                elif len({c["body"] for c in clauses}) == 1:
+                    status = "same"
+                else:
+                    status = "changed"
+                rows.append({
+                    "key": key,
+                    "heading": first["heading"],
+                    "category": first["category"],
+                    "clauses": clauses,
+                    "status": status,
+                })
+        return rows
+
+    def stats(self):
+        with self._lock:
+            return {
+                "documents": len(self._documents),
+                "clauses": sum(len(c) for c in self._documents.values()),
+                "distinct_clauses": len(self._keys),
+                "shared_clauses": sum(len(holders) > 1 for holders in self._keys.values()),
+                "bytes": sum(self._sizes.values()),
+                "evictions": self.evictions,
+            }
+
+
+def _sentences(body):
+    return re.split(r"(?<=[.;:])\s+", body)
+
+
+def clause_diff(rows, names):
+    """Returns a unified diff of every changed clause against the first contract that has it."""
+    out = []
+    for row in rows:
+        if row["status"] == "same":
+            continue
+        present = [(i, c) for i, c in enumerate(row["clauses"]) if c is not None]
+        base_i, base = present[0]
+        for i, clause in present[1:]:
+            if clause["body"] == base["body"]:
+                continue
+            out.extend(difflib.unified_diff(
+                _sentences(base["body"]), _sentences(clause["body"]),
+                fromfile=f"{names[base_i]}: {row['heading']}", tofile=f"{names[i]}: {row['heading']}",
+                lineterm="", n=1,
+            ))
+    return "\n".join(out)
+
+
+def comparison_table(rows, names):
+    """Renders the clauses that differ as a markdown table, one column per contract."""
+    differing = [row for row in rows if row["status"] != "same"]
+    same = len(rows) - len(differing)
+    header = f"{same} of {len(rows)} clauses read the same in every contract."
+    if not differing:
+        return header
+    columns = " | ".join(f"{LABELS[i]}: {name}" for i, name in enumerate(names))
+    lines = [header, "", f"| Clause | Category | {columns} |", "| --- | --- |" + " --- |" * len(names)]
+    for row in differing:
+        cells = []
+        for clause in row["clauses"]:
+            if clause is None:
+                cells.append("missing")
+                continue
+            # Label each version by the first contract with the same text
+            first = next(i for i, c in enumerate(row["clauses"]) if c is not None and c["body"] == clause["body"])
+            cells.append(f"version {LABELS[first]}")
+        lines.append(f"| {row['heading'].replace('|', '/')} | {row['category']} | {' | '.join(cells)} |")
+    return "\n".join(lines)
+
+
+def differing_sections(rows):
+    """Returns the text the model sees for each clause that differs, one string per clause.
+    A version is given once; contracts with the same text refer back to it."""
+    sections = []
+    for row in rows:
+        if row["status"] == "same":
+            continue
+        lines = [f"### {row['heading']} ({row['category'] or 'Other'})"]
+        for i, clause in enumerate(row["clauses"]):
+            if clause is None:
+                lines.append(f"[{LABELS[i]}] (no such clause)")
+                continue
+            first = next(j for j, c in enumerate(row["clauses"]) if c is not None and c["body"] == clause["body"])
+            lines.append(f"[{LABELS[i]}] " + (clause["body"] if first == i else f"(same as {LABELS[first]})"))
+        sections.append("\n".join(lines))
+    return sections
+
+
+def build_comparison_prompt(sections, names, part=None):
+    """Returns the prompt for the differing clauses; `part` is "(i of n)" when they were split up."""
+    contracts = "\n".join(f"{LABELS[i]}: {name}" for i, name in enumerate(names))
+    if part:
+        task = f"{COMPARE_TASK}\nThese are only some of the differing clauses {part}; cover only these."
+    else:
+        task = f'{COMPARE_TASK}\nPlease title the response as "{COMPARE_TITLE}"'
+    return document_prompt(
+        "\n\n".join(sections),
+        task,
+        context=f"Contracts compared:\n{contracts}",
+        label="Clauses that differ between the contracts",
+    )
@@ -0,0 +1,149 @@
+"""Content-addressed cache for per-document results.
+
+Every Streamlit rerun re-executes app.py from the top, so anything derived from
+the uploaded PDF (extracted text, metadata, the prompt summary) is stored here
+keyed by the SHA-256 of the uploaded bytes. A bounded in-memory LRU sits in
+front of an optional on-disk tier of one JSON file per document. The memory tier
+holds at most `max_items` documents and, with `max_bytes`, at most about that
+much text; the least recently used documents are dropped first (and read back
+from disk, or extracted again, when next needed).
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+
+def _size(value):
+    """Approximate memory taken by a JSON-like value: the length of its strings and keys."""
+    if isinstance(value, str):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(len(str(k)) + _size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sum(_size(v) for v in value)
+    return 8
+
+
+def document_hash(data):
+    """Returns the hex SHA-256 of the uploaded file bytes."""
+    return hashlib.sha256(data).hexdigest()
+
+
+class DocumentCache:
+    """LRU cache of `{field: value}` dicts keyed by document hash.
+
+    Values must be JSON-serialisable when `disk_dir` is set.
+    """
+
+    def __init__(self, max_items=32, disk_dir=None, max_bytes=None):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self._entries = OrderedDict()
+        # doc_hash -> approximate size of its in-memory entry
+        self._sizes = {}
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def _disk_path(self, doc_hash):
+        return os.path.join(self.disk_dir, f"{doc_hash}.json")
+
+    def _load_from_disk(self, doc_hash):
+        if not self.disk_dir:
+            return None
+        try:
+            with open(self._disk_path(doc_hash), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_to_disk(self, doc_hash, entry):
+        # Write to a temp file and rename so concurrent readers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=self.disk_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, self._disk_path(doc_hash))
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _entry(self, doc_hash):
+        # Caller holds the lock
+        entry = self._entries.get(doc_hash)
+        if entry is not None:
+            self._entries.move_to_end(doc_hash)
+            return entry, "memory"
+        entry = self._load_from_disk(doc_hash)
+        if entry is not None:
+            self._store(doc_hash, entry)
+            return entry, "disk"
+        return None, None
+
+    def _store(self, doc_hash, entry):
+        self._entries[doc_hash] = entry
+        self._entries.move_to_end(doc_hash)
+        self._sizes[doc_hash] = _size(entry)
+        # The newest document is kept even if it alone is over max_bytes
+        while len(self._entries) > 1 and (
+            len(self._entries) > self.max_items
+            or (self.max_bytes and sum(self._sizes.values()) > self.max_bytes)
+        ):
+            evicted, _ = self._entries.popitem(last=False)
+            del self._sizes[evicted]
+            self.evictions += 1
+
+    def get(self, doc_hash, field):
+        """Returns the cached value or None, updating the hit/miss counters."""
+        with self._lock:
+            entry, tier = self._entry(doc_hash)
+            if entry is not None and field in entry:
+                if tier == "disk":
+                    self.disk_hits += 1
+                else:
+                    self.hits += 1
+                return entry[field]
+            self.misses += 1
+            return None
+
+    def put(self, doc_hash, field, value):
+        with self._lock:
+            entry, _ = self._entry(doc_hash)
+            entry = dict(entry or {})
+            entry[field] = value
+            self._store(doc_hash, entry)
+            if self.disk_dir:
+                self._write_to_disk(doc_hash, entry)
+
+    def get_or_compute(self, doc_hash, field, compute):
+        """Returns the cached value, computing and storing it on a miss.
+
+        `compute` runs outside the lock, so two sessions uploading the same file
+        at the same moment may both compute it; the later result wins.
+        """
+        value = self.get(doc_hash, field)
+        if value is None:
+            value = compute()
+            self.put(doc_hash, field, value)
+        return value
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "documents": len(self._entries),
+                "bytes": sum(self._sizes.values()),
+                "evictions": self.evictions,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,159 @@
+"""Single entry point for chat completion calls made by the app.
+
+Every call goes through `complete` or `stream`, which check the response cache,
+wait for the shared `limiter` (if any) and, when given a `metrics` recorder,
+record the action, model (and routing tier), latency, time to first token, token
+usage (including prompt tokens served from OpenAI's prompt cache), cache hit,
+any error and whether the answer failed the caller's validation.
+Prompts are sent after the shared system prompt from `prompts.py`.
+"""
+import logging
+import time
+
+from prompts import build_messages
+from ratelimit import priority_for
+from tokens import count_tokens
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = "gpt-4o"
+
+# Completion tokens reserved against the TPM limit before the real usage is known
+COMPLETION_TOKENS_ESTIMATE = 800
+
+
+def _usage(usage):
+    """Returns (prompt_tokens, completion_tokens, cached_tokens) from a response's usage."""
+    if usage is None:
+        return 0, 0, 0
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = getattr(details, "cached_tokens", None) or 0
+    return usage.prompt_tokens or 0, usage.completion_tokens or 0, cached
+
+
+def _format(response_format):
+    return {} if response_format is None else {"response_format": response_format}
+
+
+def _create(client, limiter, priority, action, prompt, **kwargs):
+    """Sends the request, through the limiter when there is one. Returns (response, estimate, waited)."""
+    if limiter is None:
+        return client.chat.completions.create(**kwargs), 0, 0.0
+    estimate = count_tokens(prompt) + COMPLETION_TOKENS_ESTIMATE
+    response, waited = limiter.call(
+        lambda: client.chat.completions.create(**kwargs), estimate, priority or priority_for(action)
+    )
+    return response, estimate, waited
+
+
+def complete(client, prompt, model=DEFAULT_MODEL, cache=None, refresh=False, validate=None,
+             action="unknown", metrics=None, limiter=None, priority=None, response_format=None, tier=None):
+    """Returns the completion text for a single-turn user prompt.
+
+    With a `cache`, a stored response is returned unless `refresh` is set; fresh
+    responses are stored only if `validate(content)` (when given) is truthy.
+    `response_format` is passed to the API, e.g. to constrain the answer to a JSON schema.
+    `tier` is the routing tier `model` was picked from, recorded with the metrics.
+    """
+    messages = build_messages(prompt)
+    started = time.perf_counter()
+    if cache is not None and not refresh:
+        cached = cache.get(model, messages)
+        if cached is not None:
+            if metrics is not None:
+                metrics.record(action, model, time.perf_counter() - started, cache_hit=True, tier=tier)
+            return cached
+
+    try:
+        response, estimate, waited = _create(
+            client, limiter, priority, action, prompt, model=model, messages=messages, **_format(response_format)
+        )
+    except Exception as e:
+        if metrics is not None:
+            metrics.record(action, model, time.perf_counter() - started, error=type(e).__name__, tier=tier)
+        raise
+    content = response.choices[0].message.content
+    valid = bool(content) and (validate is None or validate(content))
+
+    prompt_tokens, completion_tokens, cached_tokens = _usage(response.usage)
+    if limiter is not None:
+        limiter.settle(estimate, prompt_tokens + completion_tokens or estimate)
+    if metrics is not None:
+        # Latency is the API's; time spent queued for the rate limit is recorded separately
+        metrics.record(action, model, time.perf_counter() - started - waited,
+                       prompt_tokens=prompt_tokens, completion_tokens=completion_tokens, cached_tokens=cached_tokens,
+                       queue_wait=round(waited, 4), tier=tier, invalid=not valid)
+    if cache is not None and valid:
+        cache.put(model, messages, content)
+    return content
+
+
+def stream(client, prompt, model=DEFAULT_MODEL, cache=None, refresh=False, action="unknown", metrics=None,
+           limiter=None, priority=None, response_format=None, validate=None, tier=None):
+    """Yields the completion text in chunks as the model produces them.
+
+    A cached response is yielded as a single chunk. The full response is cached
+    only once the stream has been consumed to the end, and only if
+    `validate(content)` (when given) is truthy.
+    """
+    messages = build_messages(prompt)
+    started = time.perf_counter()
+    if cache is not None and not refresh:
+        cached = cache.get(model, messages)
+        if cached is not None:
+            if metrics is not None:
+                metrics.record(action, model, time.perf_counter() - started, cache_hit=True, tier=tier)
+            yield cached
+            return
+
+    first_token_at = None
+    usage = None
+    parts = []
+    waited = 0.0
+    try:
+        # Only opening the stream is retried; an error mid-answer is raised to the caller
+        response, estimate, waited = _create(
+            client,
+            limiter,
+            priority,
+            action,
+            prompt,
+            model=model,
+            messages=messages,
+            stream=True,
+            # The final chunk then carries token usage (with no choices)
+            stream_options={"include_usage": True},
+            **_format(response_format),
+        )
+        for chunk in response:
+            if chunk.usage is not None:
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if not delta:
+                continue
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+                logger.info("%s %s time to first token: %.2fs", action, model, first_token_at - started - waited)
+            parts.append(delta)
+            yield delta
+    except Exception as e:
+        if metrics is not None:
+            metrics.record(action, model, time.perf_counter() - started, error=type(e).__name__, tier=tier)
+        raise
+
+    content = "".join(parts)
+    valid = bool(content) and (validate is None or validate(content))
+    elapsed = time.perf_counter() - started - waited
+    logger.info("%s %s streamed %d chars in %.2fs", action, model, len(content), elapsed)
+    prompt_tokens, completion_tokens, cached_tokens = _usage(usage)
+    if limiter is not None:
+        limiter.settle(estimate, prompt_tokens + completion_tokens or estimate)
+    if metrics is not None:
+        metrics.record(action, model, elapsed,
+                       ttft=first_token_at - started - waited if first_token_at is not None else None,
+                       prompt_tokens=prompt_tokens, completion_tokens=completion_tokens, cached_tokens=cached_tokens,
+                       queue_wait=round(waited, 4), tier=tier, invalid=not valid)
+    if cache is not None and valid:
+        cache.put(model, messages, content)
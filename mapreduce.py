@@ -0,0 +1,123 @@
+"""Map-reduce over contracts that do not fit in one model context.
+
+The text is packed into parts of whole sections (never more than
+`max_tokens` each), a map call runs on every part in parallel with bounded
+concurrency, and the partial results are combined in part order so the merged
+output does not depend on which call finished first.
+"""
+import datetime
+import re
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from metadata import ContractMetadata
+from retrieval import split_into_chunks
+from tokens import count_tokens
+
+DATE_FORMATS = [
+    "%B %d, %Y", "%B %d %Y", "%d %B %Y", "%d %B, %Y",
+    "%b %d, %Y", "%b %d %Y", "%d %b %Y",
+    "%Y-%m-%d", "%m/%d/%Y", "%d.%m.%Y",
+]
+
+
+def split_for_budget(pages, max_tokens):
+    """Packs consecutive section chunks into parts of at most `max_tokens`.
+
+    Returns dicts with `text`, `page_start` and `page_end`. A single section
+    larger than the budget is already split by `split_into_chunks`.
+    """
+    parts = []
+    current = []
+    used = 0
+    for chunk in split_into_chunks(pages, max_tokens=max_tokens):
+        tokens = count_tokens(chunk["text"])
+        if current and used + tokens > max_tokens:
+            parts.append(current)
+            current, used = [], 0
+        current.append(chunk)
+        used += tokens
+    if current:
+        parts.append(current)
+    return [
+        {
+            "text": "\n".join(c["text"] for c in part),
+            "page_start": part[0]["page_start"],
+            "page_end": part[-1]["page_end"],
+        }
+        for part in parts
+    ]
+
+
+def map_reduce(parts, map_fn, reduce_fn, max_workers=4):
+    """Runs `map_fn(part, index, total)` on every part, then `reduce_fn(results)`.
+
+    Results are passed to `reduce_fn` in part order. Any exception from a map
+    call propagates once the pool has finished.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = [pool.submit(map_fn, part, i, len(parts)) for i, part in enumerate(parts)]
+        results = [future.result() for future in futures]
+    return reduce_fn(results)
+
+
+def parse_date(value):
+    cleaned = re.sub(r"(\d)(st|nd|rd|th)\b", r"\1", value.strip())
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.datetime.strptime(cleaned, fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+def _is_blank(value):
+    return not value or str(value).strip().lower() in ["", "not specified", "n/a", "none"]
+
+
+def _pick_date(values, pick):
+    values = [v for v in values if not _is_blank(v)]
+    dated = [(parse_date(str(v)), v) for v in values]
+    dated = [(d, v) for d, v in dated if d is not None]
+    if dated:
+        return pick(dated, key=lambda pair: pair[0])[1]
+    # Nothing parseable: keep the first value the model gave
+    return values[0] if values else ""
+
+
+def merge_metadata(partials):
+    """Merges per-part `ContractMetadata` into one.
+
+    The contract type is the most common answer, with ties going to the earliest
+    part. Parties are the union in first-seen order. The effective date is the
+    earliest date and the expiration date is the latest. The summary comes from
+    the first part that has one, usually the opening recitals.
+    """
+    partials = [p for p in partials if p]
+    if not partials:
+        return ContractMetadata()
+
+    types = [p.contract_type.strip() for p in partials if not _is_blank(p.contract_type)]
+    contract_type = ""
+    if types:
+        counts = Counter(types)
+        contract_type = max(counts, key=lambda t: (counts[t], -types.index(t)))
+
+    parties = []
+    seen = set()
+    for p in partials:
+        for party in p.parties:
+            normalized = re.sub(r"[^a-z0-9]", "", party.lower())
+            if normalized and normalized not in seen:
+                seen.add(normalized)
+                parties.append(party)
+
+    summaries = [p.summary for p in partials if not _is_blank(p.summary)]
+
+    return ContractMetadata(
+        contract_type=contract_type,
+        parties=parties,
+        effective_date=_pick_date([p.effective_date for p in partials], min),
+        expiration_date=_pick_date([p.expiration_date for p in partials], max),
+        summary=summaries[0] if summaries else "",
+    )
@@ -0,0 +1,218 @@
+"""Structured contract metadata.
+
+The model is asked for metadata with a strict JSON schema (`RESPONSE_FORMAT`),
+so the answer is a JSON object with a real list of parties rather than free
+text. `ContractMetadata` is the typed result; `to_dict` / `from_dict` convert
+it to and from the display-keyed dict stored in the document cache and batch
+output.
+
+`PartialJSONObject` parses the object while it streams in, so each field can be
+shown as soon as its value is complete.
+"""
+import json
+import re
+from dataclasses import asdict, dataclass, field
+
+from prompts import document_prompt, task_prompt
+
+METADATA_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "contract_type": {"type": "string", "description": "Kind of contract, e.g. Non-Disclosure Agreement."},
+        "parties": {
+            "type": "array",
+            "items": {"type": "string"},
+            "description": "Name of each party to the contract, one per item.",
+        },
+        "effective_date": {"type": "string", "description": "As written in the contract; empty if not stated."},
+        "expiration_date": {"type": "string", "description": "As written in the contract; empty if not stated."},
+        "summary": {"type": "string", "description": "Two or three sentence summary of the contract."},
+    },
+    "required": ["contract_type", "parties", "effective_date", "expiration_date", "summary"],
+    "additionalProperties": False,
+}
+
+RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {"name": "contract_metadata", "strict": True, "schema": METADATA_SCHEMA},
+}
+
+# Schema key -> key used for display, in the document cache and in batch output
+DISPLAY_KEYS = {
+    "contract_type": "Contract Type",
+    "parties": "Parties Involved",
+    "effective_date": "Effective Date",
+    "expiration_date": "Expiration Date",
+    "summary": "Summary Text",
+}
+
+
+@dataclass
+class ContractMetadata:
+    contract_type: str = ""
+    parties: list = field(default_factory=list)
+    effective_date: str = ""
+    expiration_date: str = ""
+    summary: str = ""
+
+    def __bool__(self):
+        return any(asdict(self).values())
+
+    @classmethod
+    def from_json(cls, data, partial=False):
+        """Builds metadata from a schema-keyed object, raising ValueError if it does not match.
+
+        With `partial`, missing fields are allowed (for objects still streaming in).
+        """
+        if not isinstance(data, dict):
+            raise ValueError("expected a JSON object")
+        values = {}
+        for key in METADATA_SCHEMA["properties"]:
+            if key not in data:
+                if partial:
+                    continue
+                raise ValueError(f'missing "{key}"')
+            value = data[key]
+            if key == "parties":
+                if not isinstance(value, list) or not all(isinstance(p, str) for p in value):
+                    raise ValueError('"parties" must be a list of strings')
+                values[key] = [p.strip() for p in value if p.strip()]
+            elif value is None:
+                values[key] = ""
+            elif isinstance(value, str):
+                values[key] = value.strip()
+            else:
+                raise ValueError(f'"{key}" must be a string')
+        return cls(**values)
+
+    @classmethod
+    def from_dict(cls, data):
+        """Reads the display-keyed dict written by `to_dict` (parties may be a comma-separated string)."""
+        values = {key: data.get(display) or "" for key, display in DISPLAY_KEYS.items()}
+        parties = values["parties"]
+        if isinstance(parties, str):
+            parties = parties.split(",")
+        values["parties"] = [str(p).strip() for p in parties if str(p).strip()]
+        return cls(**values)
+
+    def to_dict(self):
+        return {display: getattr(self, key) for key, display in DISPLAY_KEYS.items()}
+
+
+def parse_metadata(content):
+    """Parses a complete model response, raising ValueError if it is not valid metadata."""
+    # A refusal under a strict schema comes back with no content at all
+    if not isinstance(content, str) or not content.strip():
+        raise ValueError("the response was empty")
+    # Schema-constrained answers have no fences, but a model without schema support may add them
+    cleaned = re.sub(r"```(?:json)?\s*(.*?)```", r"\1", content.strip(), flags=re.DOTALL).strip()
+    try:
+        data = json.loads(cleaned)
+    except ValueError as e:
+        raise ValueError(f"not valid JSON ({e})") from None
+    return ContractMetadata.from_json(data)
+
+
+METADATA_TASK = """From the contract above, extract the contract type, the parties involved (one list item per
+party), the effective date, the expiration date and a brief summary. Leave a date empty if the
+contract does not state it.
+
+Respond with a JSON object with the keys contract_type, parties, effective_date, expiration_date and summary."""
+
+
+def build_metadata_prompt(text):
+    return document_prompt(text, METADATA_TASK)
+
+
+def build_repair_prompt(content, error):
+    return task_prompt(
+        f"""The response above was meant to be a JSON object with the keys contract_type (string), parties
+(list of strings), effective_date (string), expiration_date (string) and summary (string), but it
+could not be used: {error}.
+
+Return only the corrected JSON object, keeping every value that was already there.""",
+        context=f"Response:\n{content or '(empty)'}",
+    )
+
+
+class PartialJSONObject:
+    """Incrementally parses a JSON object as it streams in.
+
+    `feed(text)` returns the top-level keys whose values were completed by that
+    text; `fields` holds every completed value so far. Anything before the
+    opening brace (such as a code fence) is ignored.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.fields = {}
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        # "key", "colon", "value" or "after" while inside the top-level object
+        self._phase = None
+        self._key_start = None
+        self._key = None
+        self._value_start = None
+
+    def feed(self, text):
+        self.buffer += text
+        completed = []
+        buffer = self.buffer
+        for i in range(self._pos, len(buffer)):
+            c = buffer[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._phase == "key":
+                        self._key = json.loads(buffer[self._key_start:i + 1])
+                        self._phase = "colon"
+                    elif self._depth == 1 and self._phase == "value":
+                        completed += self._complete(i + 1)
+                continue
+            if c == '"':
+                self._in_string = True
+                if self._depth == 1 and self._phase == "key":
+                    self._key_start = i
+                elif self._depth == 1 and self._phase == "value":
+                    self._value_start = i
+            elif c in "{[":
+                self._depth += 1
+                if self._depth == 1:
+                    self._phase = "key"
+                elif self._depth == 2 and self._phase == "value":
+                    self._value_start = i
+            elif c in "}]":
+                if self._depth == 1 and self._phase == "value" and self._value_start is not None:
+                    # A number or literal ended by the closing brace
+                    completed += self._complete(i)
+                self._depth -= 1
+                if self._depth == 1 and self._phase == "value":
+                    completed += self._complete(i + 1)
+            elif self._depth == 1:
+                if c == ":":
+                    self._phase = "value"
+                    self._value_start = None
+                elif c == ",":
+                    if self._phase == "value" and self._value_start is not None:
+                        completed += self._complete(i)
+                    self._phase = "key"
+                elif not c.isspace() and self._phase == "value" and self._value_start is None:
+                    self._value_start = i
+        self._pos = len(buffer)
+        return completed
+
+    def _complete(self, end):
+        raw = self.buffer[self._value_start:end]
+        self._phase = "after"
+        self._value_start = None
+        try:
+            self.fields[self._key] = json.loads(raw)
+        except ValueError:
+            return []
+        return [self._key]
@@ -0,0 +1,160 @@
+"""Per-call latency, token and cost metrics for OpenAI calls.
+
+One `MetricsRecorder` is shared by every session. Each call made through
+`llm.complete` / `llm.stream` appends a record; the recorder aggregates them per
+action (p50/p95 latency, tokens, estimated cost) and exports them as
+Prometheus text or JSONL. `cached_tokens` counts prompt tokens OpenAI served
+from its prompt cache, which are billed at the lower cached-input price.
+Calls routed to a model tier (see `routing.py`) are also aggregated per tier,
+with the answers that failed validation and were asked again on a larger model.
+"""
+import json
+import math
+import threading
+import time
+from collections import deque
+
+# USD per million (prompt, completion, cached prompt) tokens, used for the cost estimate only
+PRICES_PER_MILLION = {
+    "gpt-4o": (2.50, 10.00, 1.25),
+    "gpt-4o-mini": (0.15, 0.60, 0.075),
+    "gpt-4.1": (2.00, 8.00, 0.50),
+    "gpt-4.1-mini": (0.40, 1.60, 0.10),
+}
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of a list of numbers (None if empty)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(q / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def estimate_cost(model, prompt_tokens, completion_tokens, cached_tokens=0):
+    prices = PRICES_PER_MILLION.get(model)
+    if prices is None:
+        return 0.0
+    # cached_tokens are part of prompt_tokens
+    uncached = prompt_tokens - cached_tokens
+    return (uncached * prices[0] + completion_tokens * prices[1] + cached_tokens * prices[2]) / 1_000_000
+
+
+class MetricsRecorder:
+    def __init__(self, max_records=10000, jsonl_path=None):
+        self.records = deque(maxlen=max_records)
+        self.jsonl_path = jsonl_path
+        self._lock = threading.Lock()
+
+    def record(self, action, model, latency, ttft=None, prompt_tokens=0, completion_tokens=0,
+               cached_tokens=0, cache_hit=False, error=None, **extra):
+        entry = {
+            "timestamp": time.time(),
+            "action": action,
+            "model": model,
+            "latency": round(latency, 4),
+            "ttft": round(ttft, 4) if ttft is not None else None,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "cached_tokens": cached_tokens,
+            "cache_hit": cache_hit,
+            "error": error,
+            "cost_usd": round(estimate_cost(model, prompt_tokens, completion_tokens, cached_tokens), 6),
+            **extra,
+        }
+        with self._lock:
+            self.records.append(entry)
+            if self.jsonl_path:
+                with open(self.jsonl_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry) + "\n")
+        return entry
+
+    def summary(self):
+        """Returns one row per action with counts, p50/p95 latency, tokens and cost."""
+        return self._summarize("action")
+
+    def tier_summary(self):
+        """Same as `summary`, with one row per routing tier (calls made without one are left out)."""
+        return self._summarize("tier")
+
+    def _summarize(self, key):
+        with self._lock:
+            records = list(self.records)
+        groups = {}
+        for r in records:
+            if r.get(key) is not None:
+                groups.setdefault(r[key], []).append(r)
+
+        rows = []
+        for name in sorted(groups):
+            group = groups[name]
+            # Latency percentiles describe real API calls; cache hits would drag them to zero
+            calls = [r for r in group if not r["cache_hit"] and not r["error"]]
+            latencies = [r["latency"] for r in calls]
+            ttfts = [r["ttft"] for r in calls if r["ttft"] is not None]
+            queue_waits = [r.get("queue_wait") or 0.0 for r in calls]
+            rows.append({
+                key: name,
+                "models": ", ".join(sorted({r["model"] for r in group})),
+                "calls": len(group),
+                "cache_hits": sum(r["cache_hit"] for r in group),
+                "errors": sum(bool(r["error"]) for r in group),
+                "invalid": sum(bool(r.get("invalid")) for r in group),
+                "p50_latency": percentile(latencies, 50),
+                "p95_latency": percentile(latencies, 95),
+                "p50_ttft": percentile(ttfts, 50),
+                "p95_queue_wait": percentile(queue_waits, 95),
+                "prompt_tokens": sum(r["prompt_tokens"] for r in group),
+                "cached_tokens": sum(r.get("cached_tokens", 0) for r in group),
+                "completion_tokens": sum(r["completion_tokens"] for r in group),
+                "cost_usd": round(sum(r["cost_usd"] for r in group), 4),
+            })
+        return rows
+
+    def to_jsonl(self):
+        with self._lock:
+            return "".join(json.dumps(r) + "\n" for r in self.records)
+
+    def to_prometheus(self):
+        """Renders the aggregated metrics in the Prometheus text exposition format."""
+        with self._lock:
+            records = list(self.records)
+
+        calls = {}
+        tokens = {}
+        latencies = {}
+        for r in records:
+            status = "error" if r["error"] else ("cache_hit" if r["cache_hit"] else ("invalid" if r.get("invalid") else "ok"))
+            key = (r["action"], r["model"], status)
+            calls[key] = calls.get(key, 0) + 1
+            for kind in ("prompt", "completion", "cached"):
+                tkey = (r["action"], r["model"], kind)
+                tokens[tkey] = tokens.get(tkey, 0) + r.get(f"{kind}_tokens", 0)
+            if status in ("ok", "invalid"):
+                latencies.setdefault((r["action"], r["model"]), []).append(r["latency"])
+
+        lines = [
+            "# HELP llm_calls_total OpenAI chat completion calls by action, model and outcome "
+            "(invalid: the answer failed validation and was asked again on a larger model, if any).",
+            "# TYPE llm_calls_total counter",
+        ]
+        for (action, model, status), n in sorted(calls.items()):
+            lines.append(f'llm_calls_total{{action="{action}",model="{model}",status="{status}"}} {n}')
+        lines += [
+            "# HELP llm_tokens_total Tokens used by action, model and kind (cached prompt tokens are included in prompt).",
+            "# TYPE llm_tokens_total counter",
+        ]
+        for (action, model, kind), n in sorted(tokens.items()):
+            lines.append(f'llm_tokens_total{{action="{action}",model="{model}",kind="{kind}"}} {n}')
+        lines += [
+            "# HELP llm_latency_seconds Latency of uncached OpenAI calls.",
+            "# TYPE llm_latency_seconds summary",
+        ]
+        for (action, model), values in sorted(latencies.items()):
+            labels = f'action="{action}",model="{model}"'
+            for q in (0.5, 0.95):
+                lines.append(f'llm_latency_seconds{{{labels},quantile="{q}"}} {percentile(values, q * 100)}')
+            lines.append(f"llm_latency_seconds_sum{{{labels}}} {sum(values):.4f}")
+            lines.append(f"llm_latency_seconds_count{{{labels}}} {len(values)}")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,142 @@
+"""Text normalization between PDF extraction and prompting.
+
+Extracted pages carry the same running header and footer on every page, page
+number lines, words hyphenated across line breaks and runs of spaces, all of
+which are sent to the model again with every prompt. `normalize_pages` strips
+them while keeping one string per page, so page numbers used for citations
+stay correct, and reports the tokens saved.
+
+Line breaks are kept: clause segmentation and retrieval rely on headings
+starting a line.
+"""
+import bisect
+import math
+import re
+from collections import Counter
+
+from tokens import count_tokens
+
+# Lines at the top and bottom of a page that are checked for running headers/footers
+EDGE_LINES = 3
+# A line is a running header/footer if it appears on at least this share of pages
+REPEAT_SHARE = 0.5
+MIN_PAGES = 3
+
+PAGE_NUMBER_RE = re.compile(
+    r"^(?:page\s+)?[-–(\[]?\s*\d{1,4}\s*[-–)\]]?(?:\s*(?:of|/)\s*\d{1,4})?$", re.IGNORECASE
+)
+# Clause headings ("5. TERMINATION") and sentences are never running headers, however often they repeat
+CLAUSE_HEADING_RE = re.compile(r"^\d+(?:\.\d+)*[.)]?\s+[A-Z]")
+SENTENCE_RE = re.compile(r"^(?:\S+\s+){5,}\S*[.;:]$")
+HYPHEN_BREAK_RE = re.compile(r"([A-Za-z]{2,})-\n([a-z]{2,})")
+SPACES_RE = re.compile(r"[ \t\u00a0\u2000-\u200b]+")
+
+
+def _signature(line):
+    # "Page 3 of 40" and "Page 4 of 40" are the same footer
+    return re.sub(r"\d+", "#", line.lower())
+
+
+def _could_repeat(line):
+    return not CLAUSE_HEADING_RE.match(line) and not SENTENCE_RE.match(line)
+
+
+def _edge_indexes(lines):
+    content = [i for i, line in enumerate(lines) if line]
+    return set(content[:EDGE_LINES] + content[-EDGE_LINES:])
+
+
+def _peel(lines, is_edge_line):
+    """Returns the indexes of the lines running in from the top and bottom of the page
+    for which `is_edge_line` holds, stopping at the first body line from each side."""
+    content = [i for i, line in enumerate(lines) if line]
+    peeled = set()
+    for side in (content[:EDGE_LINES], content[::-1][:EDGE_LINES]):
+        for i in side:
+            if not is_edge_line(lines[i]):
+                break
+            peeled.add(i)
+    return peeled
+
+
+def _clean_lines(page):
+    return [SPACES_RE.sub(" ", line).strip() for line in page.splitlines()]
+
+
+def normalize_pages(pages):
+    """Returns `(pages, report)` with running headers/footers, page numbers,
+    hyphenation breaks and extra whitespace removed.
+
+    Every occurrence of a running header or footer is removed, including the
+    first: kept once, clause segmentation would take it for a section heading.
+    `report` holds token counts before and after and what was removed.
+    """
+    page_lines = [_clean_lines(page) for page in pages]
+
+    repeated = set()
+    if len(pages) >= MIN_PAGES:
+        counts = Counter()
+        for lines in page_lines:
+            counts.update({_signature(lines[i]) for i in _edge_indexes(lines) if _could_repeat(lines[i])})
+        threshold = max(2, math.ceil(REPEAT_SHARE * len(pages)))
+        repeated = {sig for sig, n in counts.items() if n >= threshold}
+
+    header_lines = 0
+    page_numbers = 0
+    cleaned = []
+    for lines in page_lines:
+        edges = _peel(lines, lambda line: bool(PAGE_NUMBER_RE.match(line)) or _signature(line) in repeated)
+        kept = []
+        for i, line in enumerate(lines):
+            if i in edges:
+                if PAGE_NUMBER_RE.match(line):
+                    page_numbers += 1
+                else:
+                    header_lines += 1
+                continue
+            # Collapse runs of blank lines to one
+            if line or (kept and kept[-1]):
+                kept.append(line)
+        cleaned.append("\n".join(kept).strip("\n"))
+
+    hyphens = 0
+    for i, page in enumerate(cleaned):
+        page, n = HYPHEN_BREAK_RE.subn(r"\1\2", page)
+        hyphens += n
+        # A word split across the page break moves to the end of the earlier page
+        next_page = cleaned[i + 1] if i + 1 < len(cleaned) else ""
+        m = re.match(r"([a-z]{2,})(\S*)\s*", next_page)
+        if m and re.search(r"[A-Za-z]{2,}-$", page):
+            page = page[:-1] + m.group(1) + m.group(2)
+            cleaned[i + 1] = next_page[m.end():]
+            hyphens += 1
+        cleaned[i] = page
+
+    # Each page ends with a newline so "".join(pages) never glues two pages' lines together
+    normalized = [page + "\n" if page else "" for page in cleaned]
+    before = count_tokens("".join(pages))
+    after = count_tokens("".join(normalized))
+    report = {
+        "tokens_before": before,
+        "tokens_after": after,
+        "saved_pct": round(100 * (before - after) / before, 1) if before else 0.0,
+        "header_footer_lines": header_lines,
+        "page_number_lines": page_numbers,
+        "hyphens_joined": hyphens,
+    }
+    return normalized, report
+
+
+def page_offsets(pages):
+    """Returns the character offset at which each page starts in "".join(pages)."""
+    offsets = []
+    total = 0
+    for page in pages:
+        offsets.append(total)
+        total += len(page)
+    return offsets
+
+
+def page_for_offset(offsets, offset):
+    """Returns the 1-based page number containing a character offset of the joined text."""
+    return max(1, bisect.bisect_right(offsets, offset))
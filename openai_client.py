@@ -0,0 +1,67 @@
+"""Process-wide OpenAI clients with a tuned HTTP connection pool.
+
+Building an `OpenAI` client creates a new HTTP connection pool (and SSL
+context), so a client built on every Streamlit rerun pays for a fresh TCP and
+TLS handshake on its first call and never reuses a connection. These factories
+are meant to be called once per process (the app holds the result in
+`st.cache_resource`); the clients are thread-safe and shared by every session.
+"""
+import importlib.util
+import logging
+
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, DefaultHttpxClient, OpenAI
+
+try:
+    import httpx
+except ImportError:  # newer SDK releases are built on httpx2
+    import httpx2 as httpx
+
+# httpx only speaks HTTP/2 with the optional h2 package installed
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+logger = logging.getLogger(__name__)
+
+# Long contracts can take a couple of minutes to answer; connecting should not
+DEFAULT_TIMEOUT = httpx.Timeout(180.0, connect=5.0)
+
+
+def _http_options(max_connections, keepalive_expiry, timeout, http2):
+    if http2 and not HTTP2_AVAILABLE:
+        logger.warning("HTTP/2 requested but the h2 package is not installed; using HTTP/1.1")
+        http2 = False
+    return {
+        "limits": httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+            keepalive_expiry=keepalive_expiry,
+        ),
+        "timeout": timeout,
+        "http2": http2,
+    }
+
+
+def create_client(api_key=None, base_url=None, max_connections=20, keepalive_expiry=60.0,
+                  timeout=DEFAULT_TIMEOUT, http2=False, max_retries=0):
+    """Returns an `OpenAI` client backed by a keep-alive connection pool.
+
+    `max_connections` bounds concurrent requests (extra ones wait for a free
+    connection); idle connections are kept for `keepalive_expiry` seconds.
+    Retries default to 0 because the shared rate limiter handles them.
+    """
+    return OpenAI(
+        api_key=api_key,
+        base_url=base_url,
+        max_retries=max_retries,
+        http_client=DefaultHttpxClient(**_http_options(max_connections, keepalive_expiry, timeout, http2)),
+    )
+
+
+def create_async_client(api_key=None, base_url=None, max_connections=20, keepalive_expiry=60.0,
+                        timeout=DEFAULT_TIMEOUT, http2=False, max_retries=0):
+    """Same as `create_client`, for code running on an asyncio event loop."""
+    return AsyncOpenAI(
+        api_key=api_key,
+        base_url=base_url,
+        max_retries=max_retries,
+        http_client=DefaultAsyncHttpxClient(**_http_options(max_connections, keepalive_expiry, timeout, http2)),
+    )
@@ -0,0 +1,149 @@
+"""Patch-based contract modification.
+
+Instead of asking the model to regenerate the whole contract, only the sections
+most relevant to the instruction are sent, labelled with ids. The model answers
+with a list of find/replace edits keyed by section id, which are applied locally
+to the working copy, so the output is a few lines of JSON regardless of the
+contract's length. The edits are requested with a strict JSON schema
+(`EDITS_RESPONSE_FORMAT`) and checked again by `parse_edits`.
+"""
+import difflib
+import json
+import re
+
+from clauses import segment
+from prompts import document_prompt
+from retrieval import BM25Index
+
+EDIT_FIELDS = ("section", "find", "replace")
+
+EDITS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "edits": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {field: {"type": "string"} for field in EDIT_FIELDS},
+                "required": list(EDIT_FIELDS),
+                "additionalProperties": False,
+            },
+        },
+    },
+    "required": ["edits"],
+    "additionalProperties": False,
+}
+
+EDITS_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {"name": "contract_edits", "strict": True, "schema": EDITS_SCHEMA},
+}
+
+
+def section_chunks(text):
+    """Returns the sections of `text` as retrieval chunks with character offsets.
+
+    Falls back to blank-line separated paragraphs when there are no headings.
+    """
+    spans = [(s["start"], s["end"], s["heading"]) for s in segment(text)]
+    if not spans:
+        spans = [(m.start(), m.end(), "") for m in re.finditer(r"\S(?:.|\n(?!\s*\n))*", text)]
+    elif spans[0][0] > 0:
+        spans.insert(0, (0, spans[0][0], ""))
+    return [
+        {"id": i, "heading": heading, "text": text[start:end], "start": start, "end": end}
+        for i, (start, end, heading) in enumerate(spans)
+    ]
+
+
+def select_sections(text, instruction, k=4):
+    """Returns the `k` sections most relevant to the instruction, in document order."""
+    chunks = section_chunks(text)
+    selected = BM25Index(chunks).retrieve(instruction, k=k)
+    # An instruction with no lexical match ("make it friendlier") gets the opening sections
+    return selected or chunks[:k]
+
+
+def build_patch_prompt(sections, instruction):
+    listing = "\n\n".join(f"[S{s['id']}]\n{s['text'].strip()}" for s in sections)
+    return document_prompt(
+        listing,
+        """You are editing the contract. Apply the instruction by returning only a JSON object of the form
+{"edits": [{"section": "S3", "find": "exact text currently in that section", "replace": "new text"}]}
+Copy "find" exactly from the section, keep it as short as possible while still unique, and only
+include text that actually changes. Return {"edits": []} if nothing needs to change.""",
+        context=f"Instruction:\n{instruction}",
+        label="Contract sections relevant to the requested change, each labelled with an id",
+    )
+
+
+def parse_edits(content):
+    """Returns the edit list from a model response, or None if it is not valid JSON or any
+    edit is not an object with string `section`, `find` and `replace`."""
+    # A refusal under the strict schema comes back with no content at all
+    if not isinstance(content, str):
+        return None
+    cleaned = re.sub(r"```(?:json)?\s*(.*?)```", r"\1", content.strip(), flags=re.DOTALL).strip()
+    try:
+        edits = json.loads(cleaned).get("edits")
+    except (ValueError, AttributeError):
+        return None
+    if not isinstance(edits, list):
+        return None
+    for edit in edits:
+        if not isinstance(edit, dict) or not all(isinstance(edit.get(field), str) for field in EDIT_FIELDS):
+            return None
+    return edits
+
+
+def _locate(text, find, start, end):
+    """Finds `find` within text[start:end], tolerating whitespace differences."""
+    pos = text.find(find, start, end)
+    if pos >= 0:
+        return pos, pos + len(find)
+    pattern = r"\s+".join(re.escape(word) for word in find.split())
+    if not pattern:
+        return None
+    m = re.compile(pattern).search(text, start, end)
+    return (m.start(), m.end()) if m else None
+
+
+def apply_edits(text, sections, edits):
+    """Applies find/replace edits to the sections they name.
+
+    Returns `(new_text, applied, failed)`, where `failed` holds edits whose
+    section id or find text could not be located. `edits` come from `parse_edits`.
+    """
+    by_id = {f"S{s['id']}": s for s in sections}
+    located = []
+    failed = []
+    for edit in edits:
+        section = by_id.get(edit["section"].strip("[]"))
+        find = edit["find"]
+        span = _locate(text, find, section["start"], section["end"]) if section and find else None
+        if span is None:
+            failed.append(edit)
+        else:
+            located.append((span, edit))
+
+    applied = []
+    # Apply from the end of the text so earlier offsets stay valid; skip overlapping edits
+    last_start = len(text) + 1
+    for (start, end), edit in sorted(located, key=lambda item: item[0][0], reverse=True):
+        if end > last_start:
+            failed.append(edit)
+            continue
+        text = text[:start] + edit["replace"] + text[end:]
+        last_start = start
+        applied.append(edit)
+    applied.reverse()
+    return text, applied, failed
+
+
+def render_diff(old, new, context=2):
+    """Returns a unified diff of the two texts, line by line."""
+    return "\n".join(
+        difflib.unified_diff(
+            old.splitlines(), new.splitlines(), "original", "modified", n=context, lineterm=""
+        )
+    )
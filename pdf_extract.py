@@ -0,0 +1,99 @@
+"""Page-streaming PDF text extraction.
+
+Uploads are spooled to a temporary file instead of being read into one bytes
+object, large documents are split into page ranges that are extracted in a
+shared process pool, and pages are yielded in order as `(page_number, text)`
+so callers can start work before the last page is parsed. Every document and
+temporary file is closed as soon as it is no longer needed.
+"""
+import atexit
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import fitz  # PyMuPDF for PDF
+
+# Documents shorter than this are extracted in-process; pool overhead would dominate
+PARALLEL_MIN_PAGES = 64
+BATCH_SIZE = 32
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool(workers):
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn rather than fork: the Streamlit server is multithreaded
+            _pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _pool
+
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(cancel_futures=True)
+            _pool = None
+
+
+atexit.register(shutdown_pool)
+
+
+def _extract_range(path, start, stop):
+    with fitz.open(path) as doc:
+        return [(i + 1, doc[i].get_text()) for i in range(start, stop)]
+
+
+def iter_pages(path, workers=None):
+    """Yields `(page_number, text)` for the PDF at `path`, in page order."""
+    with fitz.open(path) as doc:
+        page_count = doc.page_count
+        if workers == 1 or page_count < PARALLEL_MIN_PAGES:
+            for i in range(page_count):
+                yield i + 1, doc[i].get_text()
+            return
+
+    workers = workers or os.cpu_count() or 1
+    pool = _get_pool(workers)
+    ranges = [(start, min(start + BATCH_SIZE, page_count)) for start in range(0, page_count, BATCH_SIZE)]
+    futures = [pool.submit(_extract_range, path, start, stop) for start, stop in ranges]
+    try:
+        for future in futures:
+            yield from future.result()
+    finally:
+        # Consumer stopped early: drop the batches nobody will read
+        for future in futures:
+            future.cancel()
+
+
+def spool(pdf_file):
+    """Copies an uploaded file object to a temporary file and returns its path."""
+    pdf_file.seek(0)
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as f:
+        shutil.copyfileobj(pdf_file, f, length=1024 * 1024)
+        return f.name
+
+
+def iter_uploaded_pages(pdf_file, workers=None):
+    """Yields `(page_number, text)` for an uploaded file object.
+
+    The temporary copy is removed when the generator finishes or is closed.
+    """
+    path = spool(pdf_file)
+    try:
+        yield from iter_pages(path, workers=workers)
+    finally:
+        os.remove(path)
+
+
+def extract_pages(pdf_file, workers=None):
+    """Returns the list of page texts for an uploaded file object."""
+    return [text for _, text in iter_uploaded_pages(pdf_file, workers=workers)]
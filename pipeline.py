@@ -0,0 +1,539 @@
+"""Contract analysis pipeline shared by the Streamlit app, batch mode and benchmarks.
+
+Nothing here imports Streamlit. `ContractPipeline` binds an OpenAI client to the
+shared caches and metrics recorder and exposes each step of the app: page
+extraction, metadata, the Quick Actions, Q&A, Modify and the comparison of
+several contracts. With a `ModelRouter`,
+each step is sent to the model tier configured for it (see `routing.py`).
+"""
+import copy
+import logging
+
+from clauses import classify, classify_with_model, clause_table, segment
+from compare import COMPARE_TITLE, LABELS, build_comparison_prompt, differing_sections
+from llm import DEFAULT_MODEL, complete, stream
+from mapreduce import map_reduce, merge_metadata, split_for_budget
+from normalize import normalize_pages, page_offsets
+from metadata import (
+    RESPONSE_FORMAT,
+    ContractMetadata,
+    PartialJSONObject,
+    build_metadata_prompt,
+    build_repair_prompt,
+    parse_metadata,
+)
+from patching import (
+    EDITS_RESPONSE_FORMAT,
+    apply_edits,
+    build_patch_prompt,
+    parse_edits,
+    render_diff,
+    select_sections,
+)
+from pdf_extract import extract_pages, iter_pages
+from prompts import document_prompt, task_prompt
+from retrieval import BM25Index, format_chunks, split_into_chunks
+from tokens import count_tokens
+
+logger = logging.getLogger(__name__)
+
+# Quick Actions: button, metrics name, spinner text and the task given to the model
+QUICK_ACTIONS = [
+    {
+        "key": "btn1",
+        "name": "summary",
+        "label": "Generate Executive Summary",
+        "spinner": "Generating executive summary...",
+        "task": "Provide an executive summary with main purpose, parties involved, key obligations and timelines, termination conditions.",
+    },
+    {
+        "key": "btn2",
+        "name": "clauses",
+        "label": "Extract Clauses",
+        "spinner": "Extracting clauses...",
+        "task": "Extract main clauses like Termination, Confidentiality, Payment Terms, etc.",
+        # Answered by the local clause segmenter; the model only sees sections it can't classify
+        "local": True,
+    },
+    {
+        "key": "btn3",
+        "name": "jargon",
+        "label": "Simplify Jargon",
+        "spinner": "Simplifying legal jargon...",
+        "task": """Identify complex legal terms, jargon, or phrases in the contract that a small business user or someone not well-versed in legal terminology may not readily understand.
+For each one, please explain it clearly and concisely in plain English.
+
+Please format the output as a bullet-point list such as this:
+- **Term**: Explanation
+
+Also, please title the list as "Jargon Explanations\"""",
+        # An answer without the title is taken as a failed one and asked again on a larger model
+        "title": "Jargon Explanations",
+    },
+    {
+        "key": "btn4",
+        "name": "red_flags",
+        "label": "Detect Problematic Clauses",
+        "spinner": "Scanning for problematic clauses...",
+        "task": """Identify any clauses or sections that may pose potential risks, unusual obligations, unclear responsibilities, or any concerning legal implications - especially from the perspective of a small business user or someone not well-versed in legal terminology.
+
+For each one, provide a simple explanation of why it could be a problematic clause.
+
+Please format the output as a bullet-point list like this:
+- **Clause Name or Description**: Explanation of concern
+
+Also, please title the list as "Red Flag Clauses\"""",
+        "title": "Red Flag Clauses",
+    },
+    {
+        "key": "btn5",
+        "name": "glossary",
+        "label": "Glossary of Terms",
+        "spinner": "Generating glossary...",
+        "task": """Create a glossary of important terms or key concepts used in the contract. For each term, provide a brief and simple definition or explanation that a small business user or someone not well-versed in legal terminology can understand.
+
+Please format the output as a bullet-point list like this:
+- **Term**: Definition
+
+Also, please title the list as "Glossary of Terms\"""",
+        "title": "Glossary of Terms",
+    },
+]
+
+
+# Helper function to format parties nicely
+def format_parties(parties):
+    if len(parties) == 2:
+        return " and ".join(parties)
+    elif len(parties) > 2:
+        return ", ".join(parties[:-1]) + ", and " + parties[-1]
+    elif len(parties) == 1:
+        return parties[0]
+    return "Not specified"
+
+
+# Helper function to validate metafields
+def validate_metadata_field(field_value, default="Not specified"):
+    if not field_value or field_value.strip().lower() in ["", "not specified", "n/a", "none"]:
+        return default, False
+    return field_value.strip(), True
+
+
+# Helper function to build display metadata summary for prompts
+def build_metadata_summary(meta):
+    summary_lines = []
+
+    # Contract Type
+    contract_type, ct_valid = validate_metadata_field(meta.contract_type)
+    if ct_valid:
+        summary_lines.append(f"Contract Type: {contract_type}")
+
+    # Parties Involved (formatted)
+    if meta.parties:
+        summary_lines.append(f"Parties Involved: {format_parties(meta.parties)}")
+
+    # Dates
+    effective_date, ed_valid = validate_metadata_field(meta.effective_date)
+    if ed_valid:
+        summary_lines.append(f"Effective Date: {effective_date}")
+
+    expiration_date, exd_valid = validate_metadata_field(meta.expiration_date)
+    if exd_valid:
+        summary_lines.append(f"Expiration Date: {expiration_date}")
+
+    # Summary
+    summary_text, st_valid = validate_metadata_field(meta.summary)
+    if st_valid:
+        summary_lines.append(f"Summary: {summary_text}")
+
+    if not summary_lines:
+        return "Metadata could not be reliably extracted from the contract."
+
+    return "\n".join(summary_lines)
+
+
+# Helper function to build the prompt for one of the Quick Actions. The contract comes
+# first so every action on a document shares the same cacheable prefix (see prompts.py).
+def build_quick_action_prompt(action, metadata_summary, text):
+    return document_prompt(text, action["task"], context=f"Contract Metadata:\n{metadata_summary}")
+
+
+# Helper function to build the Q&A prompt from the retrieved sections
+def build_qa_prompt(metadata_summary, sections, question):
+    return document_prompt(
+        sections,
+        f"""Question: {question}
+Provide a clear and concise answer, citing the page numbers of the sections you relied on.
+If the sections above do not contain the answer, say so.""",
+        context=f"Contract Metadata:\n{metadata_summary}",
+        label="Relevant Contract Sections",
+    )
+
+
+def _is_metadata(content):
+    try:
+        parse_metadata(content)
+    except ValueError:
+        return False
+    return True
+
+
+# A whole contract's metadata must also have something in it; one part of a long contract may not
+def _has_metadata(content):
+    try:
+        return bool(parse_metadata(content))
+    except ValueError:
+        return False
+
+
+def answer_validator(action):
+    """Returns the check a Quick Action's answer must pass to be cached and kept (None if any
+    answer will do): not empty and, for actions that ask for one, carrying the list's title."""
+    title = action.get("title")
+    if not title:
+        return None
+    return lambda content: title.lower() in content.lower()
+
+
+def build_retrieval_index(pages):
+    return BM25Index(split_into_chunks(pages))
+
+
+class ContractPipeline:
+    """The app's analysis steps bound to a client, caches and settings.
+
+    `cache` is the shared response cache, `doc_cache` the per-document cache,
+    `metrics` the call recorder and `limiter` the shared rate limiter; any of
+    them may be None. `priority` overrides the limiter priority picked from each
+    action. Contracts over `context_budget` tokens are map-reduced with
+    `map_workers` parallel calls. `router` picks the model for each action;
+    without one, every call goes to the default model.
+    """
+
+    def __init__(self, client, cache=None, doc_cache=None, metrics=None, refresh=False,
+                 context_budget=100000, map_workers=4, pdf_workers=None, qa_top_k=5, modify_top_k=4,
+                 limiter=None, priority=None, normalize=True, router=None):
+        self.client = client
+        self.cache = cache
+        self.doc_cache = doc_cache
+        self.metrics = metrics
+        self.limiter = limiter
+        self.priority = priority
+        self.refresh = refresh
+        self.context_budget = context_budget
+        self.map_workers = map_workers
+        self.pdf_workers = pdf_workers
+        self.normalize = normalize
+        self.qa_top_k = qa_top_k
+        self.modify_top_k = modify_top_k
+        self.router = router
+
+    # Same pipeline with its calls queued at another rate limiter priority, e.g. for prefetching
+    def with_priority(self, priority):
+        other = copy.copy(self)
+        other.priority = priority
+        return other
+
+    # (tier, model) pairs to try for an action, in order
+    def models_for(self, action):
+        if self.router is None:
+            return [(None, DEFAULT_MODEL)]
+        return self.router.models_for(action)
+
+    # Send a prompt to OpenAI through the shared response cache. An answer that fails
+    # `validate` is asked again on the next larger model tier, if there is one.
+    def ask(self, prompt, action, validate=None, response_format=None):
+        models = self.models_for(action)
+        for i, (tier, model) in enumerate(models):
+            content = complete(
+                self.client,
+                prompt,
+                model=model,
+                cache=self.cache,
+                refresh=self.refresh,
+                validate=validate,
+                action=action,
+                metrics=self.metrics,
+                limiter=self.limiter,
+                priority=self.priority,
+                response_format=response_format,
+                tier=tier,
+            )
+            if i + 1 == len(models) or (content and (validate is None or validate(content))):
+                return content
+            logger.warning("%s answer from %s failed validation; asking %s", action, model, models[i + 1][1])
+
+    # Same as ask, but yields the answer in chunks as it is generated. Streamed text cannot be
+    # taken back, so a failed answer is only asked again when the caller passes `on_fallback`,
+    # which is called (to clear what it has shown) before the larger model's answer streams.
+    def stream(self, prompt, action, validate=None, response_format=None, on_fallback=None):
+        models = self.models_for(action)
+        if on_fallback is None:
+            models = models[:1]
+        for i, (tier, model) in enumerate(models):
+            parts = []
+            for chunk in stream(
+                self.client,
+                prompt,
+                model=model,
+                cache=self.cache,
+                refresh=self.refresh,
+                action=action,
+                metrics=self.metrics,
+                limiter=self.limiter,
+                priority=self.priority,
+                response_format=response_format,
+                validate=validate,
+                tier=tier,
+            ):
+                parts.append(chunk)
+                yield chunk
+            content = "".join(parts)
+            if i + 1 == len(models) or (content and (validate is None or validate(content))):
+                return
+            logger.warning("%s answer from %s failed validation; asking %s", action, model, models[i + 1][1])
+            on_fallback()
+
+    # Extract text from PDF, one string per page
+    def extract_pages_from_pdf(self, pdf_file):
+        return extract_pages(pdf_file, workers=self.pdf_workers)
+
+    def extract_text_from_pdf(self, pdf_file):
+        return "".join(self.extract_pages_from_pdf(pdf_file))
+
+    # Same for a PDF already on disk, without copying it to a temporary file first
+    def extract_pages_from_path(self, path):
+        return [text for _, text in iter_pages(path, workers=self.pdf_workers)]
+
+    # Strip running headers/footers, page numbers, hyphenation and extra whitespace from
+    # extracted pages before they reach any prompt. Returns (pages, token_report).
+    def prepare_pages(self, pages):
+        if not self.normalize:
+            tokens = count_tokens("".join(pages))
+            return pages, {"tokens_before": tokens, "tokens_after": tokens, "saved_pct": 0.0}
+        pages, report = normalize_pages(pages)
+        logger.info("Normalized text: %d -> %d tokens (%.1f%% saved)",
+                    report["tokens_before"], report["tokens_after"], report["saved_pct"])
+        return pages, report
+
+    # Pages of an uploaded PDF file object, extracted and normalized once per
+    # document when there is a doc_cache. The token report is kept as "text_report".
+    def load_pages(self, doc_hash, pdf_file):
+        def load():
+            pages, report = self.prepare_pages(self.extract_pages_from_pdf(pdf_file))
+            if self.doc_cache is not None:
+                self.doc_cache.put(doc_hash, "text_report", report)
+            return pages
+
+        if self.doc_cache is None:
+            return load()
+        return self.doc_cache.get_or_compute(doc_hash, "pages", load)
+
+    # The document's ContractMetadata and prompt summary, asked for once per document when
+    # there is a doc_cache. A failed (empty) extraction is not kept, so the next call retries.
+    def load_metadata(self, doc_hash, text, pages, on_field=None):
+        if self.doc_cache is not None:
+            cached_metadata = self.doc_cache.get(doc_hash, "metadata")
+            metadata_summary = self.doc_cache.get(doc_hash, "metadata_summary")
+            if cached_metadata is not None and metadata_summary is not None:
+                return ContractMetadata.from_dict(cached_metadata), metadata_summary
+        metadata = self.call_openai_for_metadata(text, pages, on_field=on_field)
+        metadata_summary = build_metadata_summary(metadata)
+        if metadata and self.doc_cache is not None:
+            self.doc_cache.put(doc_hash, "metadata", metadata.to_dict())
+            self.doc_cache.put(doc_hash, "metadata_summary", metadata_summary)
+        return metadata, metadata_summary
+
+    # Call OpenAI and return the contract's ContractMetadata. With `on_field`, the answer is
+    # streamed and on_field(partial_metadata, completed_keys) is called as each field completes.
+    def call_openai_for_metadata(self, text, pages=None, on_field=None):
+        # Contracts too large for one prompt are extracted part by part and merged
+        if count_tokens(text) > self.context_budget:
+            parts = split_for_budget(pages or [text], self.context_budget)
+            return map_reduce(
+                parts,
+                lambda part, i, total: self.extract_metadata(part["text"], validate=_is_metadata),
+                merge_metadata,
+                max_workers=self.map_workers,
+            )
+        if on_field is not None:
+            return self.stream_metadata(text, on_field)
+        return self.extract_metadata(text)
+
+    # Extract metadata from text that fits in one prompt. Unparseable (or, for a whole
+    # contract, empty) responses are not cached and are asked again on a larger model.
+    def extract_metadata(self, text, validate=_has_metadata):
+        content = self.ask(
+            build_metadata_prompt(text), "metadata", validate=validate, response_format=RESPONSE_FORMAT
+        )
+        return self.parse_or_repair_metadata(content)
+
+    # Same as extract_metadata, streaming the answer and reporting fields as they complete
+    def stream_metadata(self, text, on_field):
+        parser = PartialJSONObject()
+
+        def restart():
+            # The larger model's answer starts a new object
+            nonlocal parser
+            parser = PartialJSONObject()
+
+        for chunk in self.stream(
+            build_metadata_prompt(text), "metadata", validate=_has_metadata, response_format=RESPONSE_FORMAT,
+            on_fallback=restart,
+        ):
+            if parser.feed(chunk):
+                try:
+                    on_field(ContractMetadata.from_json(parser.fields, partial=True), set(parser.fields))
+                except ValueError:
+                    # A field of the wrong type; parse_or_repair_metadata deals with it at the end
+                    pass
+        return self.parse_or_repair_metadata(parser.buffer)
+
+    # Parse a metadata answer, asking the model once to fix it if it does not match the schema.
+    # Returns empty metadata (and logs why) if the repaired answer is still unusable.
+    def parse_or_repair_metadata(self, content):
+        try:
+            return parse_metadata(content)
+        except ValueError as e:
+            logger.warning("Metadata response did not match the schema (%s); asking for a repair", e)
+            repaired = self.ask(
+                build_repair_prompt(content, e), "metadata:repair", validate=_is_metadata,
+                response_format=RESPONSE_FORMAT,
+            )
+        try:
+            return parse_metadata(repaired)
+        except ValueError as e:
+            logger.error("Repaired metadata response is still unusable: %s", e)
+            return ContractMetadata()
+
+    # Get the final prompt for a Quick Action. Contracts over the context budget are
+    # first analysed part by part in parallel (the map calls), and the returned prompt
+    # asks the model to combine those partial results.
+    def prepare_quick_action_prompt(self, action, metadata_summary, text, pages):
+        if count_tokens(text) <= self.context_budget:
+            return build_quick_action_prompt(action, metadata_summary, text)
+
+        def analyse_part(part, i, total):
+            # The part's text leads, as in the metadata map calls, so both share its prefix
+            return self.ask(
+                document_prompt(
+                    part["text"],
+                    f"""{action["task"]}
+This excerpt is only part of the contract. Cover only what appears in it and mention page numbers.""",
+                    context=f"""Contract Metadata:
+{metadata_summary}
+
+The text above is part {i + 1} of {total} of the contract (pages {part["page_start"]}-{part["page_end"]}).""",
+                ),
+                f"{action['name']}:map",
+            )
+
+        def combine(results):
+            partials = "\n\n".join(
+                f"--- Part {i + 1} (pages {part['page_start']}-{part['page_end']}) ---\n{result}"
+                for i, (part, result) in enumerate(zip(parts, results))
+            )
+            return task_prompt(
+                f"""{action["task"]}
+Combine the partial results into a single response covering the whole contract.
+Remove duplicates and keep the requested format.""",
+                context=f"""Contract Metadata:
+{metadata_summary}
+
+The contract was too long to review in one pass, so each part was analysed separately.
+Partial results, in document order:
+{partials}""",
+            )
+
+        parts = split_for_budget(pages, self.context_budget)
+        return map_reduce(parts, analyse_part, combine, max_workers=self.map_workers)
+
+    # "Extract Clauses": segment and classify locally, asking the model only about
+    # sections the keyword taxonomy could not place
+    def extract_clause_table(self, doc_hash, text, pages=None):
+        def find_clauses():
+            sections = classify(segment(text), text)
+            return classify_with_model(sections, text, lambda prompt: self.ask(prompt, "clauses"))
+
+        if self.doc_cache is None:
+            sections = find_clauses()
+        else:
+            sections = self.doc_cache.get_or_compute(doc_hash, "clauses", find_clauses)
+        offsets = page_offsets(pages) if pages else None
+        return f"<b>Key Clauses</b> ({len(sections)} sections)\n\n{clause_table(sections, offsets)}"
+
+    # Run one Quick Action to completion (no streaming)
+    def run_quick_action(self, action, doc_hash, metadata_summary, text, pages):
+        if action.get("local"):
+            return self.extract_clause_table(doc_hash, text, pages)
+        return self.ask(
+            self.prepare_quick_action_prompt(action, metadata_summary, text, pages),
+            action["name"],
+            validate=answer_validator(action),
+        )
+
+    # Q&A prompt with only the sections that match the question. Returns the prompt and
+    # the number of contract tokens it carries.
+    def prepare_qa_prompt(self, index, metadata_summary, question):
+        # With no lexical match, the opening sections (parties, definitions) are the best guess
+        sections = format_chunks(index.retrieve(question, k=self.qa_top_k) or index.chunks[:self.qa_top_k])
+        return build_qa_prompt(metadata_summary, sections, question), count_tokens(sections)
+
+    # Compare contracts clause by clause. `documents` is a list of (doc_hash, text); their clauses
+    # come from the shared `clause_index`. Clauses are matched and compared locally and only the
+    # ones that differ are sent to the model, in parts if they are over the context budget.
+    # Returns (rows from ClauseIndex.compare, the model's answer or None if nothing differs,
+    # contract tokens sent).
+    def compare_contracts(self, clause_index, documents, names):
+        if not 2 <= len(documents) <= len(LABELS):
+            raise ValueError(f"Compare between 2 and {len(LABELS)} contracts")
+        rows = clause_index.compare(documents)
+        if not rows:
+            # Nothing was compared; that is not the same as the contracts being identical
+            raise ValueError("The contracts have no text to compare")
+        sections = differing_sections(rows)
+        if not sections:
+            return rows, None, 0
+        sent_tokens = count_tokens("\n\n".join(sections))
+
+        # Differing clauses packed into parts that each fit the context budget
+        parts, size = [[]], 0
+        for section in sections:
+            tokens = count_tokens(section)
+            if parts[-1] and size + tokens > self.context_budget:
+                parts.append([])
+                size = 0
+            parts[-1].append(section)
+            size += tokens
+
+        if len(parts) == 1:
+            answer = self.ask(
+                build_comparison_prompt(sections, names), "compare",
+                validate=lambda content: COMPARE_TITLE.lower() in content.lower(),
+            )
+            return rows, answer, sent_tokens
+        answer = map_reduce(
+            parts,
+            lambda part, i, total: self.ask(
+                build_comparison_prompt(part, names, part=f"({i + 1} of {total})"), "compare:map"
+            ),
+            lambda results: f"{COMPARE_TITLE}\n\n" + "\n\n".join(results),
+            max_workers=self.map_workers,
+        )
+        return rows, answer, sent_tokens
+
+    # Apply a modification instruction to the working copy as section patches.
+    # Returns (new_copy, diff, failed_edits), or None if the model's edits could not be parsed.
+    def modify(self, working_copy, instruction):
+        sections = select_sections(working_copy, instruction, k=self.modify_top_k)
+        content = self.ask(
+            build_patch_prompt(sections, instruction),
+            "modify",
+            validate=lambda content: parse_edits(content) is not None,
+            response_format=EDITS_RESPONSE_FORMAT,
+        )
+        edits = parse_edits(content)
+        if edits is None:
+            return None
+        new_copy, applied, failed = apply_edits(working_copy, sections, edits)
+        return new_copy, render_diff(working_copy, new_copy), failed
@@ -0,0 +1,118 @@
+"""Speculative background runs of the Quick Actions users usually click next.
+
+One `PrefetchScheduler` is shared by every session. Once a document's text and
+metadata are ready, the app hands it the configured actions; they run on a
+small worker pool (at background priority in the rate limiter) and their
+futures are kept against the document hash. A click then `claim`s the future:
+the answer is ready at once, or the click waits on the call already in flight
+instead of starting another.
+
+Jobs that have not started are cancelled when no session is looking at their
+document any more (e.g. the user uploaded a different file). A call already in
+flight cannot be interrupted, but its answer still lands in the response cache.
+Every job is charged its estimated tokens against `token_budget_per_hour`;
+once the last hour's budget is spent, nothing more is prefetched.
+"""
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+BUDGET_WINDOW_SECONDS = 3600
+
+
+class PrefetchScheduler:
+    def __init__(self, max_workers=2, token_budget_per_hour=500000, max_documents=32):
+        self.token_budget_per_hour = token_budget_per_hour
+        self.max_documents = max_documents
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prefetch")
+        self._lock = threading.Lock()
+        # (doc_hash, action name) -> Future
+        self._jobs = {}
+        # session id -> doc hash it is looking at
+        self._sessions = {}
+        # (time, tokens) charged to the budget within the window
+        self._spent = deque()
+        self._stats = {"scheduled": 0, "claimed": 0, "cancelled": 0, "failed": 0, "over_budget": 0}
+
+    def _tokens_spent(self, now):
+        while self._spent and now - self._spent[0][0] > BUDGET_WINDOW_SECONDS:
+            self._spent.popleft()
+        return sum(tokens for _, tokens in self._spent)
+
+    def _forget(self, doc_hash):
+        """Cancels pending jobs for a document nobody is looking at and drops its finished ones."""
+        for key in [key for key in self._jobs if key[0] == doc_hash]:
+            if self._jobs.pop(key).cancel():
+                self._stats["cancelled"] += 1
+
+    def watch(self, session_id, doc_hash):
+        """Records the document a session is looking at, releasing the one it looked at before."""
+        with self._lock:
+            previous = self._sessions.get(session_id)
+            self._sessions[session_id] = doc_hash
+            if previous is not None and previous != doc_hash and previous not in self._sessions.values():
+                self._forget(previous)
+
+    def release(self, session_id):
+        """Forgets a session, e.g. when its file is removed."""
+        with self._lock:
+            previous = self._sessions.pop(session_id, None)
+            if previous is not None and previous not in self._sessions.values():
+                self._forget(previous)
+
+    def prefetch(self, session_id, doc_hash, jobs):
+        """Starts `jobs`, a list of `(action_name, fn, estimated_tokens)`, unless already
+        scheduled for the document or over the token budget. Returns the names started."""
+        self.watch(session_id, doc_hash)
+        started = []
+        with self._lock:
+            for name, fn, tokens in jobs:
+                key = (doc_hash, name)
+                if key in self._jobs:
+                    continue
+                now = time.monotonic()
+                if self._tokens_spent(now) + tokens > self.token_budget_per_hour:
+                    self._stats["over_budget"] += 1
+                    logger.info("Prefetch budget spent; not prefetching %s", name)
+                    continue
+                self._spent.append((now, tokens))
+                self._jobs[key] = self._pool.submit(fn)
+                self._stats["scheduled"] += 1
+                started.append(name)
+            # Sessions that close never release their document; keep only the newest ones
+            documents = list(dict.fromkeys(key[0] for key in self._jobs))
+            for old in documents[:-self.max_documents]:
+                self._forget(old)
+        return started
+
+    def claim(self, doc_hash, name):
+        """Returns the future of a prefetched action (done or in flight), or None if there is
+        no usable one, in which case the caller runs the action itself."""
+        with self._lock:
+            future = self._jobs.get((doc_hash, name))
+            if future is None or future.cancelled():
+                return None
+            if future.done() and future.exception() is not None:
+                logger.warning("Prefetched %s failed: %s", name, future.exception())
+                del self._jobs[(doc_hash, name)]
+                self._stats["failed"] += 1
+                return None
+            self._stats["claimed"] += 1
+            return future
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self._stats,
+                "in_flight": sum(not f.done() for f in self._jobs.values()),
+                "ready": sum(f.done() and not f.cancelled() and f.exception() is None for f in self._jobs.values()),
+                "tokens_spent_last_hour": self._tokens_spent(time.monotonic()),
+                "token_budget_per_hour": self.token_budget_per_hour,
+            }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
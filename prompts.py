@@ -0,0 +1,43 @@
+"""Prompt layout shared by every model call.
+
+OpenAI caches the longest previously seen prefix of a prompt (from 1,024
+tokens, in 128 token steps) and bills those tokens at a discount with a shorter
+time to first token. A prefix only matches if it is byte-identical, so every
+prompt built here has the same order: the fixed `SYSTEM_PROMPT`, then the
+contract text (the same string for metadata and every Quick Action on a
+document), then anything that changes from call to call, such as the metadata
+summary, the task and the question. Templates have no leading indentation, so
+the contract text is byte-identical in every prompt.
+"""
+
+SYSTEM_PROMPT = (
+    "You are a friendly legal assistant helping small business users understand their contracts. "
+    "Base every answer on the contract text you are given, quote or cite it where useful, and say so "
+    "plainly when the contract does not cover something."
+)
+
+
+def build_messages(prompt):
+    """Returns the chat messages for a prompt: the shared system prompt, then the prompt."""
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": prompt},
+    ]
+
+
+def document_prompt(text, task, context=None, label="Contract Text"):
+    """Returns a prompt with the document first and the per-call parts last.
+
+    `text` is the contract (or the part of it being analysed) under `label`;
+    `context` (e.g. the metadata summary) and `task` follow it.
+    """
+    parts = [f"{label}:\n{text.strip()}"]
+    if context:
+        parts.append(context.strip())
+    parts.append(f"Task:\n{task.strip()}")
+    return "\n\n".join(parts) + "\n"
+
+
+def task_prompt(task, context=None):
+    """Returns a prompt with no contract text (e.g. combining partial results)."""
+    return "\n\n".join(p.strip() for p in (context, f"Task:\n{task}") if p) + "\n"
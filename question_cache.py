@@ -0,0 +1,165 @@
+"""Near-duplicate question cache for Q&A.
+
+Users ask the same thing in different words ("what's the notice period?",
+"what notice period applies?"). Each answered question is stored against its
+document with a sparse vector: hashed TF-IDF over the question's stemmed words
+(IDF from the contract's own retrieval index, so "agreement" counts for little)
+plus character trigrams, which catch typos and word forms. A new question is
+answered from the cache when its cosine similarity to a stored one reaches
+`threshold`, it mentions the same numbers and (when known) it retrieves the
+same leading contract section. Nothing leaves the machine.
+
+The IDF weighting means words used all over the contract, such as the party
+names, count for little in the similarity, yet "can the customer terminate?"
+and "can the provider terminate?" need different answers. So a hit also
+requires that neither question has a word the other lacks that the contract
+uses (any word at all when there is no index). Other forms of the same word
+("invoice", "invoices") are not counted as different.
+
+Entries are evicted least recently used first once there are `max_entries`.
+"""
+import math
+import re
+import threading
+import time
+import zlib
+from collections import Counter, OrderedDict
+
+from retrieval import tokenize
+
+# Hash buckets for the sparse vectors; collisions only matter within one question pair
+BUCKETS = 1 << 20
+# Share of the similarity that comes from whole words rather than character trigrams
+WORD_WEIGHT = 0.7
+# Weight of a word the contract never uses (and of every word when there is no index)
+DEFAULT_IDF = 3.0
+
+
+def _bucket(feature):
+    return zlib.crc32(feature.encode("utf-8")) % BUCKETS
+
+
+def _normalize(vector):
+    norm = math.sqrt(sum(v * v for v in vector.values()))
+    return {k: v / norm for k, v in vector.items()} if norm else {}
+
+
+def _words(question):
+    # Single letters are mostly contractions ("what's", "don't")
+    return [w for w in tokenize(question) if len(w) > 1]
+
+
+def vectorize(question, idf=None):
+    """Returns the question's sparse unit vector as {bucket: weight}."""
+    words = _words(question)
+    word_vector = Counter()
+    for word, count in Counter(words).items():
+        weight = idf.get(word, DEFAULT_IDF) if idf else DEFAULT_IDF
+        word_vector[_bucket("w:" + word)] += (1 + math.log(count)) * weight
+    char_vector = Counter()
+    for word in words:
+        padded = f" {word} "
+        for i in range(len(padded) - 2):
+            char_vector[_bucket("c:" + padded[i:i + 3])] += 1.0
+
+    vector = Counter()
+    for part, share in ((_normalize(word_vector), WORD_WEIGHT), (_normalize(char_vector), 1 - WORD_WEIGHT)):
+        for k, v in part.items():
+            vector[k] += v * math.sqrt(share)
+    return _normalize(vector)
+
+
+def cosine(a, b):
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(v * b.get(k, 0.0) for k, v in a.items())
+
+
+def _numbers(question):
+    return set(re.findall(r"\d+", question))
+
+
+def _same_word(a, b):
+    # The stemmer leaves some forms apart ("invoice", "invoic"), so a shared start counts too
+    return a == b or (min(len(a), len(b)) >= 4 and (a.startswith(b) or b.startswith(a)))
+
+
+def _differing_words(words, other):
+    """Returns the words in either set that have no form of themselves in the other."""
+    return (
+        {w for w in words if not any(_same_word(w, o) for o in other)}
+        | {o for o in other if not any(_same_word(o, w) for w in words)}
+    )
+
+
+class QuestionCache:
+    def __init__(self, threshold=0.8, max_entries=512):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        # (doc_hash, question) -> entry dict, least recently used first
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.seconds_saved = 0.0
+
+    def lookup(self, doc_hash, question, idf=None, top_section=None):
+        """Returns the best stored entry for a near-duplicate question on the document, or None.
+
+        The entry has `question`, `answer`, `extra`, `latency` and `similarity`.
+        """
+        vector = vectorize(question, idf)
+        numbers = _numbers(question)
+        words = set(_words(question))
+        with self._lock:
+            best, best_score = None, 0.0
+            for (entry_doc, _), entry in self._entries.items():
+                if entry_doc != doc_hash or entry["numbers"] != numbers:
+                    continue
+                if top_section is not None and entry["top_section"] not in (None, top_section):
+                    continue
+                # A word the contract uses (e.g. the other party) changes what is being asked
+                differing = _differing_words(words, entry["words"])
+                if idf:
+                    differing = {w for w in differing if w in idf}
+                if differing:
+                    continue
+                score = cosine(vector, entry["vector"])
+                if score > best_score:
+                    best, best_score = entry, score
+            if best is None or best_score < self.threshold:
+                self.misses += 1
+                return None
+            self._entries.move_to_end((doc_hash, best["question"]))
+            self.hits += 1
+            self.seconds_saved += best["latency"]
+            return {**best, "similarity": round(best_score, 3)}
+
+    def put(self, doc_hash, question, answer, latency, idf=None, top_section=None, extra=None):
+        """Stores an answer; `latency` is how long it took, counted as saved on each hit."""
+        entry = {
+            "question": question,
+            "answer": answer,
+            "extra": extra,
+            "latency": latency,
+            "vector": vectorize(question, idf),
+            "numbers": _numbers(question),
+            "words": set(_words(question)),
+            "top_section": top_section,
+            "stored": time.time(),
+        }
+        with self._lock:
+            self._entries[(doc_hash, question)] = entry
+            self._entries.move_to_end((doc_hash, question))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "seconds_saved": round(self.seconds_saved, 2),
+        }
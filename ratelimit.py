@@ -0,0 +1,207 @@
+"""Process-wide rate limiting and retries for OpenAI calls.
+
+One `RateLimiter` is shared by every session (and every worker thread). Before
+a call goes out it takes one request from an RPM bucket and its estimated
+prompt + completion tokens from a TPM bucket, waiting in a priority queue when
+either is empty, so interactive Q&A overtakes background map calls. Once the
+response arrives, the token estimate is corrected with the real usage.
+
+429s and 5xx responses are retried with exponential backoff and full jitter.
+A 429 pauses the whole queue rather than just the caller, so concurrent
+sessions back off together instead of all hammering the API at once.
+"""
+import heapq
+import itertools
+import random
+import threading
+import time
+from collections import deque
+
+import openai
+
+from metrics import percentile
+
+# Lower runs first
+PRIORITIES = {"interactive": 0, "normal": 1, "background": 2}
+
+# Actions a user is waiting on; everything else is "normal", and map calls are "background"
+ACTION_PRIORITIES = {"qa": "interactive", "modify": "interactive"}
+
+
+def priority_for(action):
+    if action.endswith(":map"):
+        return "background"
+    return ACTION_PRIORITIES.get(action, "normal")
+
+
+def _retryable_status(error):
+    """Returns the HTTP status (0 for connection errors) if the error is worth retrying, else None."""
+    if isinstance(error, (openai.APIConnectionError, openai.APITimeoutError)):
+        return 0
+    status = getattr(error, "status_code", None)
+    if status == 429 or (status is not None and status >= 500):
+        return status
+    return None
+
+
+def _retry_after(error):
+    response = getattr(error, "response", None)
+    try:
+        return float(response.headers.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """Refills continuously at `per_minute` per minute, holding at most one minute's worth."""
+
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """Seconds until `amount` can be taken (capped at capacity so huge requests still run)."""
+        self._refill(now)
+        needed = min(amount, self.capacity)
+        return 0.0 if self.level >= needed else (needed - self.level) / self.rate
+
+    def take(self, amount):
+        # May go negative: under-estimated calls are paid back by later callers waiting longer
+        self.level -= amount
+
+
+class RateLimiter:
+    def __init__(self, rpm=500, tpm=30000, max_retries=6, base_delay=1.0, max_delay=60.0):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.paused_until = 0.0
+        self._cond = threading.Condition()
+        self._waiting = []
+        self._seq = itertools.count()
+        self._waits = deque(maxlen=1000)
+        self.granted = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.failures = 0
+        self.max_queue_depth = 0
+
+    def acquire(self, tokens, priority="normal"):
+        """Blocks until the call may go out; returns the seconds spent waiting."""
+        ticket = (PRIORITIES[priority], next(self._seq))
+        started = time.monotonic()
+        with self._cond:
+            heapq.heappush(self._waiting, ticket)
+            self.max_queue_depth = max(self.max_queue_depth, len(self._waiting))
+            # A new ticket may outrank the current head; let it re-check
+            self._cond.notify_all()
+            try:
+                while True:
+                    now = time.monotonic()
+                    if self._waiting[0] != ticket:
+                        self._cond.wait()
+                        continue
+                    delay = max(
+                        self.paused_until - now,
+                        self.requests.wait_time(1, now),
+                        self.tokens.wait_time(tokens, now),
+                    )
+                    if delay <= 0:
+                        break
+                    self._cond.wait(delay)
+            finally:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                self._cond.notify_all()
+            self.requests.take(1)
+            self.tokens.take(tokens)
+            self.granted += 1
+        waited = time.monotonic() - started
+        self._waits.append(waited)
+        return waited
+
+    def settle(self, estimated, actual):
+        """Corrects the token bucket once a call's real usage is known."""
+        with self._cond:
+            self.tokens.take(actual - estimated)
+            self._cond.notify_all()
+
+    def backoff(self, attempt, error=None):
+        retry_after = _retry_after(error) if error is not None else None
+        if retry_after is not None:
+            return retry_after
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def call(self, fn, tokens, priority="normal"):
+        """Runs `fn()` within the limits, retrying 429/5xx/connection errors.
+
+        Returns `(result, waited)`, where `waited` is the time spent queued and
+        backing off. The last error is raised once `max_retries` is exhausted.
+        """
+        waited = 0.0
+        for attempt in itertools.count():
+            waited += self.acquire(tokens, priority)
+            try:
+                return fn(), waited
+            except Exception as e:
+                status = _retryable_status(e)
+                if status is None or attempt >= self.max_retries:
+                    with self._cond:
+                        self.failures += 1
+                    raise
+                delay = self.backoff(attempt, e)
+                with self._cond:
+                    self.retries += 1
+                    if status == 429:
+                        # Everyone is over the quota, not just this caller
+                        self.rate_limited += 1
+                        self.paused_until = max(self.paused_until, time.monotonic() + delay)
+                        self._cond.notify_all()
+                if status != 429:
+                    time.sleep(delay)
+                    waited += delay
+
+    def stats(self):
+        with self._cond:
+            queued = {name: 0 for name in PRIORITIES}
+            for level, _ in self._waiting:
+                queued[next(name for name, value in PRIORITIES.items() if value == level)] += 1
+            waits = [round(w, 3) for w in self._waits]
+            return {
+                "queued": queued,
+                "max_queue_depth": self.max_queue_depth,
+                "requests": self.granted,
+                "retries": self.retries,
+                "rate_limited": self.rate_limited,
+                "failures": self.failures,
+                "p50_wait": percentile(waits, 50),
+                "p95_wait": percentile(waits, 95),
+                "tokens_available": int(self.tokens.level),
+                "paused_for": round(max(0.0, self.paused_until - time.monotonic()), 2),
+            }
+
+    def to_prometheus(self):
+        stats = self.stats()
+        lines = [
+            "# HELP llm_queue_depth OpenAI calls waiting for rate limit capacity, by priority.",
+            "# TYPE llm_queue_depth gauge",
+        ]
+        for priority, n in stats["queued"].items():
+            lines.append(f'llm_queue_depth{{priority="{priority}"}} {n}')
+        lines += [
+            "# HELP llm_retries_total OpenAI calls retried after a 429, 5xx or connection error.",
+            "# TYPE llm_retries_total counter",
+            f"llm_retries_total {stats['retries']}",
+            "# HELP llm_rate_limited_total 429 responses from OpenAI.",
+            "# TYPE llm_rate_limited_total counter",
+            f"llm_rate_limited_total {stats['rate_limited']}",
+        ]
+        return "\n".join(lines) + "\n"
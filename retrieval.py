@@ -0,0 +1,137 @@
+"""Clause-level lexical retrieval so Q&A only sends the relevant sections.
+
+The contract is split once per document into section chunks (a new chunk at
+every numbered or all-caps heading, and whenever a chunk outgrows its token
+budget). Questions are matched against the chunks with BM25; nothing leaves the
+machine until the top-k chunks are placed in the prompt.
+"""
+import math
+import re
+from collections import Counter
+
+from tokens import count_tokens
+
+HEADING_RE = re.compile(
+    r"^\s*(?:"
+    r"(?:ARTICLE|Article|SECTION|Section|CLAUSE|Clause|SCHEDULE|Schedule|EXHIBIT|Exhibit|ANNEX|Annex)\s+[0-9IVXLC]+\b"
+    r"|\d+\.(?:\d+\.?)*\s+[A-Z]"
+    r"|[A-Z][A-Z0-9 ,&'/\-]{3,60}$"
+    r")"
+)
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "for", "from",
+    "has", "have", "how", "i", "if", "in", "is", "it", "its", "of", "on", "or", "our",
+    "shall", "that", "the", "their", "there", "this", "to", "under", "was", "we", "what",
+    "when", "where", "which", "who", "will", "with", "would", "you", "your",
+}
+
+SUFFIXES = ("ations", "ation", "ments", "ment", "ings", "ing", "ies", "ate", "ed", "es", "s")
+
+
+def is_heading(line):
+    return bool(line.strip()) and bool(HEADING_RE.match(line))
+
+
+def stem(word):
+    for suffix in SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 4:
+            return word[: -len(suffix)]
+    return word
+
+
+def tokenize(text):
+    return [stem(w) for w in re.findall(r"[a-z0-9]+", text.lower()) if w not in STOPWORDS]
+
+
+def split_into_chunks(pages, max_tokens=350):
+    """Splits page texts into section chunks.
+
+    Returns a list of dicts with `id`, `heading`, `text`, `page_start` and
+    `page_end` (1-based), in document order.
+    """
+    chunks = []
+    lines = []
+    heading = ""
+    start_page = 1
+    budget_used = 0
+
+    def flush(end_page):
+        text = "\n".join(lines).strip()
+        if text:
+            chunks.append({
+                "id": len(chunks),
+                "heading": heading,
+                "text": text,
+                "page_start": start_page,
+                "page_end": end_page,
+            })
+
+    page_no = 1
+    for page_no, page_text in enumerate(pages, start=1):
+        for line in page_text.splitlines():
+            line_tokens = count_tokens(line) + 1
+            if is_heading(line) and lines:
+                flush(page_no)
+                lines, heading, start_page, budget_used = [], line.strip(), page_no, 0
+            elif budget_used + line_tokens > max_tokens and lines:
+                # Long sections are split; the continuation keeps the section heading
+                flush(page_no)
+                lines, start_page, budget_used = [], page_no, 0
+            elif not lines:
+                start_page = page_no
+                if is_heading(line):
+                    heading = line.strip()
+            lines.append(line)
+            budget_used += line_tokens
+    flush(page_no)
+    return chunks
+
+
+class BM25Index:
+    def __init__(self, chunks, k1=1.5, b=0.75):
+        self.chunks = chunks
+        self.k1 = k1
+        self.b = b
+        self.term_freqs = [Counter(tokenize(c["heading"] + "\n" + c["text"])) for c in chunks]
+        self.lengths = [sum(tf.values()) for tf in self.term_freqs]
+        self.avg_length = sum(self.lengths) / len(self.lengths) if self.lengths else 0.0
+        doc_freq = Counter()
+        for tf in self.term_freqs:
+            doc_freq.update(tf.keys())
+        n = len(chunks)
+        self.idf = {term: math.log(1 + (n - df + 0.5) / (df + 0.5)) for term, df in doc_freq.items()}
+
+    def score(self, query_terms, i):
+        tf = self.term_freqs[i]
+        norm = self.k1 * (1 - self.b + self.b * self.lengths[i] / (self.avg_length or 1))
+        total = 0.0
+        for term in query_terms:
+            f = tf.get(term)
+            if f:
+                total += self.idf[term] * f * (self.k1 + 1) / (f + norm)
+        return total
+
+    def search(self, query, k=5):
+        """Returns up to `k` `(chunk, score)` pairs with a positive score, best first."""
+        terms = set(tokenize(query))
+        scored = [(self.score(terms, i), i) for i in range(len(self.chunks))]
+        scored = [(s, i) for s, i in scored if s > 0]
+        scored.sort(key=lambda pair: (-pair[0], pair[1]))
+        return [(self.chunks[i], s) for s, i in scored[:k]]
+
+    def retrieve(self, query, k=5):
+        """Returns the top-k chunks in document order, ready to be put in a prompt."""
+        return sorted((chunk for chunk, _ in self.search(query, k)), key=lambda c: c["id"])
+
+
+def format_chunks(chunks):
+    """Renders chunks with page references for the prompt."""
+    parts = []
+    for chunk in chunks:
+        if chunk["page_start"] == chunk["page_end"]:
+            pages = f"Page {chunk['page_start']}"
+        else:
+            pages = f"Pages {chunk['page_start']}-{chunk['page_end']}"
+        parts.append(f"[{pages}]\n{chunk['text']}")
+    return "\n\n".join(parts)
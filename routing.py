@@ -0,0 +1,72 @@
+"""Which model answers each action.
+
+Every model call names its action ("metadata", "summary", "qa", "modify",
+"summary:map", "metadata:repair", ...). A `ModelRouter` maps the action (map
+and repair calls follow their base action) to a tier and each tier to a model.
+Light, well-specified work such as metadata extraction, the jargon list and the
+glossary goes to the small tier; Q&A, Modify and the red-flag review stay on
+the large one.
+
+`models_for(action)` lists the action's own tier first, then every larger one.
+The pipeline asks them in that order and stops at the first answer that passes
+the call's validation (e.g. metadata that parses and is not empty, a Quick
+Action answer with its required title), so a weak small-model answer costs one
+extra call on the large model rather than a wrong result.
+"""
+from llm import DEFAULT_MODEL
+
+# Smallest first; fallbacks only go towards the end of this list
+TIERS = ("small", "large")
+
+DEFAULT_TIER_MODELS = {"small": "gpt-4o-mini", "large": DEFAULT_MODEL}
+
+DEFAULT_ROUTES = {
+    "metadata": "small",
+    "clauses": "small",
+    "jargon": "small",
+    "glossary": "small",
+    "summary": "large",
+    "red_flags": "large",
+    "qa": "large",
+    "modify": "large",
+    "compare": "large",
+}
+
+
+def base_action(action):
+    """Returns the action a map, combine or repair call belongs to ("summary:map" -> "summary")."""
+    return action.split(":", 1)[0]
+
+
+class ModelRouter:
+    """Maps actions to tiers and tiers to models.
+
+    `routes` (action -> tier) and `tier_models` (tier -> model) are merged over
+    the defaults; actions with no route use `default_tier`. With `fallback`
+    off, each action only ever uses its own tier.
+    """
+
+    def __init__(self, routes=None, tier_models=None, default_tier="large", fallback=True):
+        self.routes = {**DEFAULT_ROUTES, **(routes or {})}
+        self.tier_models = {**DEFAULT_TIER_MODELS, **(tier_models or {})}
+        for action, tier in self.routes.items():
+            if tier not in TIERS:
+                raise ValueError(f"Unknown model tier {tier!r} for {action}; use one of {', '.join(TIERS)}")
+        if default_tier not in TIERS:
+            raise ValueError(f"Unknown default model tier {default_tier!r}")
+        self.default_tier = default_tier
+        self.fallback = fallback
+
+    def tier_for(self, action):
+        return self.routes.get(base_action(action), self.default_tier)
+
+    def models_for(self, action):
+        """Returns `[(tier, model), ...]` to try in order: the action's tier, then the larger ones."""
+        start = TIERS.index(self.tier_for(action))
+        tiers = TIERS[start:] if self.fallback else TIERS[start:start + 1]
+        models = []
+        for tier in tiers:
+            # Tiers configured with the same model would just ask it twice
+            if all(model != self.tier_models[tier] for _, model in models):
+                models.append((tier, self.tier_models[tier]))
+        return models
@@ -0,0 +1,497 @@
+"""Async HTTP API for the contract analysis pipeline.
+
+    python service.py [--host 127.0.0.1] [--port 8000] [--threads 40] [--api-token TOKEN]
+
+Serves the app's steps to other systems, without the login or UI:
+
+    POST   /documents                      PDF as the body (or a multipart "file") -> document id
+    GET    /documents/{id}/metadata        contract type, parties, dates and summary
+    GET    /documents/{id}/analysis/{name} a Quick Action: summary, clauses, jargon, red_flags, glossary
+    POST   /documents/{id}/qa              {"question": "..."}
+    POST   /documents/{id}/modify          {"instruction": "...", "text": optional working copy}
+    POST   /compare                        {"document_ids": [...], "names": optional} -> clause comparison
+    GET    /metrics                        Prometheus text for the OpenAI calls and rate limiter
+    GET    /health
+
+A document id is the SHA-256 of the PDF, so uploading the same file again is
+free and its results are shared with the app and batch mode through the caches.
+Modify is stateless: it returns the new text, which the caller sends back as
+`text` with the next instruction. With `?stream=true`, metadata is sent as
+NDJSON (one line per completed field, then the final result) and the analysis
+and Q&A answers as plain text chunks as the model produces them. Compare lines
+up the clauses of 2 to 26 uploaded contracts locally and sends only the ones that
+differ to the model.
+
+Every request is handled on one asyncio event loop. The pipeline, the OpenAI
+client, the caches and the rate limiter are synchronous and thread-safe, so each
+blocking step runs on the loop's worker threads (`--threads` of them) and a slow
+model call never holds up other requests. The OpenAI key is read from
+OPENAI_API_KEY (and OPENAI_BASE_URL, if set); the API token from
+SERVICE_API_TOKEN when `--api-token` is not given.
+"""
+import argparse
+import hmac
+import io
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+
+import anyio.to_thread
+import uvicorn
+from openai import APIError
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.exceptions import HTTPException
+from starlette.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+
+from compare import LABELS, ClauseIndex, clause_diff
+from doc_cache import DocumentCache, document_hash
+from llm_cache import ResponseCache
+from metrics import MetricsRecorder
+from openai_client import create_client
+from pdf_extract import shutdown_pool
+from pipeline import QUICK_ACTIONS, ContractPipeline, answer_validator, build_retrieval_index
+from question_cache import QuestionCache
+from ratelimit import RateLimiter
+from routing import DEFAULT_TIER_MODELS, ModelRouter
+from tokens import count_tokens
+
+logger = logging.getLogger("service")
+
+ACTIONS_BY_NAME = {action["name"]: action for action in QUICK_ACTIONS}
+
+# Allowed on top of max_upload_bytes for the boundaries and headers of a multipart upload
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+AI_UNAVAILABLE = "The AI service is unavailable or over its rate limit right now. Please try again in a minute."
+
+
+class BearerTokenMiddleware:
+    """Rejects requests (other than /health) without `Authorization: Bearer <token>`."""
+
+    def __init__(self, app, token):
+        self.app = app
+        self.expected = f"Bearer {token}".encode()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] != "/health":
+            given = dict(scope["headers"]).get(b"authorization", b"")
+            if not hmac.compare_digest(given, self.expected):
+                response = JSONResponse({"error": "Missing or wrong API token"}, status_code=401)
+                return await response(scope, receive, send)
+        await self.app(scope, receive, send)
+
+
+class ContractService:
+    """The HTTP handlers, bound to a pipeline (which must have a `doc_cache`).
+
+    `question_cache` answers reworded Q&A questions locally, as in the app;
+    `limiter` is only used for /metrics. Retrieval indexes are kept for the
+    `index_cache_size` most recently used documents, and clauses for /compare
+    in `clause_index` (a new `ClauseIndex` if not given).
+    """
+
+    def __init__(self, pipeline, question_cache=None, limiter=None, max_upload_bytes=50 * 1024 * 1024,
+                 index_cache_size=32, clause_index=None):
+        if pipeline.doc_cache is None:
+            raise ValueError("The service keeps uploaded documents in the pipeline's doc_cache; it needs one")
+        self.pipeline = pipeline
+        self.doc_cache = pipeline.doc_cache
+        self.question_cache = question_cache
+        self.limiter = limiter
+        self.max_upload_bytes = max_upload_bytes
+        self.index_cache_size = index_cache_size
+        self._indexes = OrderedDict()
+        self._indexes_lock = threading.Lock()
+        self.clause_index = clause_index or ClauseIndex()
+
+    def routes(self):
+        return [
+            Route("/health", self.health),
+            Route("/metrics", self.metrics),
+            Route("/documents", self.upload, methods=["POST"]),
+            Route("/documents/{document_id}/metadata", self.metadata),
+            Route("/documents/{document_id}/analysis/{name}", self.analysis),
+            Route("/documents/{document_id}/qa", self.qa, methods=["POST"]),
+            Route("/documents/{document_id}/modify", self.modify, methods=["POST"]),
+            Route("/compare", self.compare, methods=["POST"]),
+        ]
+
+    # Helpers
+
+    def _pages(self, document_id):
+        pages = self.doc_cache.get(document_id, "pages")
+        if pages is None:
+            raise HTTPException(404, "Unknown document id; upload the PDF (again) first")
+        return pages
+
+    def _index(self, document_id, pages):
+        # BM25 index for Q&A, built once per document while it is in use
+        with self._indexes_lock:
+            index = self._indexes.get(document_id)
+            if index is not None:
+                self._indexes.move_to_end(document_id)
+                return index
+        index = build_retrieval_index(pages)
+        with self._indexes_lock:
+            self._indexes[document_id] = index
+            while len(self._indexes) > self.index_cache_size:
+                self._indexes.popitem(last=False)
+        return index
+
+    @staticmethod
+    async def _json_body(request, field=None):
+        """Returns the JSON object body; with `field`, it must have that field as a non-empty string."""
+        try:
+            body = await request.json()
+        except ValueError:
+            raise HTTPException(400, "The body must be a JSON object")
+        if not isinstance(body, dict):
+            raise HTTPException(400, "The body must be a JSON object")
+        if field is not None and not (isinstance(body.get(field), str) and body[field].strip()):
+            raise HTTPException(400, f'The body must be a JSON object with a "{field}" string')
+        return body
+
+    @staticmethod
+    def _strings(body, field):
+        """Returns the body's list of strings under `field` (None if it is absent), or raises a 400."""
+        value = body.get(field)
+        if value is not None and not (isinstance(value, list) and all(isinstance(v, str) for v in value)):
+            raise HTTPException(400, f'"{field}" must be a list of strings')
+        return value
+
+    @staticmethod
+    def _streaming(request):
+        return request.query_params.get("stream", "").lower() in ("1", "true", "yes")
+
+    @staticmethod
+    async def _text_stream(chunks):
+        """Returns a plain text streaming response for a generator of text chunks.
+
+        The first chunk is fetched before the response starts, so failing to reach
+        the model is still answered with a 503 rather than an empty 200.
+        """
+        first = await run_in_threadpool(next, chunks, "")
+
+        def body():
+            yield first
+            # Sync iterators are read on the worker threads by StreamingResponse
+            yield from chunks
+
+        return StreamingResponse(body(), media_type="text/plain; charset=utf-8")
+
+    async def _read_upload(self, request):
+        """Returns the uploaded PDF's bytes, rejecting it as soon as it is known to be over the limit."""
+        too_large = HTTPException(413, f"The PDF is over {self.max_upload_bytes // (1024 * 1024)} MB")
+        multipart = request.headers.get("content-type", "").startswith("multipart/form-data")
+        # Room for the multipart boundaries and part headers around the file
+        limit = self.max_upload_bytes + (MULTIPART_OVERHEAD_BYTES if multipart else 0)
+        content_length = request.headers.get("content-length", "")
+        if content_length.isdigit() and int(content_length) > limit:
+            raise too_large
+
+        if multipart:
+            # Files are spooled to disk past 1 MB while the form is parsed
+            form = await request.form()
+            upload = form.get("file")
+            if upload is None or isinstance(upload, str):
+                raise HTTPException(400, 'Send the PDF as the request body or as a multipart "file"')
+            if upload.size is not None and upload.size > self.max_upload_bytes:
+                raise too_large
+            return await upload.read()
+
+        # Without a Content-Length (chunked uploads), stop reading once the body is over the limit
+        chunks, size = [], 0
+        async for chunk in request.stream():
+            size += len(chunk)
+            if size > self.max_upload_bytes:
+                raise too_large
+            chunks.append(chunk)
+        return b"".join(chunks)
+
+    # Endpoints
+
+    async def health(self, request):
+        return JSONResponse({"status": "ok"})
+
+    async def metrics(self, request):
+        text = self.pipeline.metrics.to_prometheus() if self.pipeline.metrics else ""
+        if self.limiter is not None:
+            text += self.limiter.to_prometheus()
+        return PlainTextResponse(text, media_type="text/plain; version=0.0.4")
+
+    async def upload(self, request):
+        data = await self._read_upload(request)
+        if not data.startswith(b"%PDF"):
+            raise HTTPException(400, "The upload is not a PDF")
+
+        document_id = document_hash(data)
+        try:
+            pages = await run_in_threadpool(self.pipeline.load_pages, document_id, io.BytesIO(data))
+        except Exception as e:
+            logger.warning("Could not read uploaded PDF %s: %s", document_id, e)
+            raise HTTPException(400, "The PDF could not be read")
+        report = self.doc_cache.get(document_id, "text_report") or {}
+        return JSONResponse({
+            "document_id": document_id,
+            "pages": len(pages),
+            "tokens": report.get("tokens_after", count_tokens("".join(pages))),
+        }, status_code=201)
+
+    async def metadata(self, request):
+        document_id = request.path_params["document_id"]
+        pages = self._pages(document_id)
+        text = "".join(pages)
+        if not self._streaming(request):
+            metadata, metadata_summary = await run_in_threadpool(self.pipeline.load_metadata, document_id, text, pages)
+            return JSONResponse({"metadata": metadata.to_dict(), "metadata_summary": metadata_summary})
+
+        def events():
+            # load_metadata reports fields from its own thread; they are handed over through a queue
+            pending = queue.Queue()
+
+            def run():
+                try:
+                    metadata, metadata_summary = self.pipeline.load_metadata(
+                        document_id, text, pages,
+                        on_field=lambda partial, done: pending.put({"fields": partial.to_dict(), "done": sorted(done)}),
+                    )
+                    pending.put({"metadata": metadata.to_dict(), "metadata_summary": metadata_summary})
+                except APIError:
+                    logger.exception("Metadata extraction failed after retries")
+                    pending.put({"error": AI_UNAVAILABLE})
+                finally:
+                    pending.put(None)
+
+            threading.Thread(target=run, name="metadata-stream", daemon=True).start()
+            while True:
+                event = pending.get()
+                if event is None:
+                    return
+                yield json.dumps(event) + "\n"
+
+        return StreamingResponse(events(), media_type="application/x-ndjson")
+
+    async def analysis(self, request):
+        document_id = request.path_params["document_id"]
+        action = ACTIONS_BY_NAME.get(request.path_params["name"])
+        if action is None:
+            raise HTTPException(404, f"Unknown analysis; choose one of {', '.join(ACTIONS_BY_NAME)}")
+        pages = self._pages(document_id)
+        text = "".join(pages)
+        _, metadata_summary = await run_in_threadpool(self.pipeline.load_metadata, document_id, text, pages)
+
+        if not self._streaming(request) or action.get("local"):
+            result = await run_in_threadpool(
+                self.pipeline.run_quick_action, action, document_id, metadata_summary, text, pages
+            )
+            if self._streaming(request):
+                return PlainTextResponse(result)
+            return JSONResponse({"name": action["name"], "result": result})
+        # Long contracts are map-reduced first; only the final call is streamed
+        prompt = await run_in_threadpool(
+            self.pipeline.prepare_quick_action_prompt, action, metadata_summary, text, pages
+        )
+        # Streamed text cannot be taken back, so a streamed answer is not asked again on a larger model
+        return await self._text_stream(
+            self.pipeline.stream(prompt, action["name"], validate=answer_validator(action))
+        )
+
+    async def qa(self, request):
+        document_id = request.path_params["document_id"]
+        question = (await self._json_body(request, "question"))["question"].strip()
+        pages = self._pages(document_id)
+        text = "".join(pages)
+        _, metadata_summary = await run_in_threadpool(self.pipeline.load_metadata, document_id, text, pages)
+
+        def lookup():
+            index = self._index(document_id, pages)
+            top = index.search(question, k=1)
+            top_section = top[0][0]["id"] if top else None
+            similar = None
+            if self.question_cache is not None and not self.pipeline.refresh:
+                similar = self.question_cache.lookup(document_id, question, index.idf, top_section)
+            return index, top_section, similar
+
+        index, top_section, similar = await run_in_threadpool(lookup)
+        if similar is not None:
+            if self._streaming(request):
+                return PlainTextResponse(similar["answer"])
+            return JSONResponse({"answer": similar["answer"], "similar_question": similar["question"]})
+
+        started = time.perf_counter()
+        prompt, sent_tokens = await run_in_threadpool(self.pipeline.prepare_qa_prompt, index, metadata_summary, question)
+
+        def remember(answer):
+            if self.question_cache is not None and answer:
+                self.question_cache.put(document_id, question, answer, time.perf_counter() - started,
+                                        index.idf, top_section)
+
+        if not self._streaming(request):
+            answer = await run_in_threadpool(self.pipeline.ask, prompt, "qa")
+            remember(answer)
+            return JSONResponse({
+                "answer": answer,
+                "sent_tokens": sent_tokens,
+                "contract_tokens": count_tokens(text),
+            })
+
+        def answer_chunks():
+            parts = []
+            for chunk in self.pipeline.stream(prompt, "qa"):
+                parts.append(chunk)
+                yield chunk
+            remember("".join(parts))
+
+        return await self._text_stream(answer_chunks())
+
+    async def modify(self, request):
+        document_id = request.path_params["document_id"]
+        body = await self._json_body(request, "instruction")
+        if body.get("text") is not None and not isinstance(body["text"], str):
+            raise HTTPException(400, '"text" must be a string')
+        working_copy = body.get("text") or "".join(self._pages(document_id))
+        result = await run_in_threadpool(self.pipeline.modify, working_copy, body["instruction"].strip())
+        if result is None:
+            raise HTTPException(422, "The modification could not be applied. Try rephrasing the instruction.")
+        new_copy, diff, failed = result
+        return JSONResponse({"text": new_copy, "diff": diff, "failed_edits": len(failed)})
+
+    async def compare(self, request):
+        body = await self._json_body(request)
+        document_ids = self._strings(body, "document_ids")
+        if document_ids is None or not 2 <= len(set(document_ids)) <= len(LABELS):
+            raise HTTPException(400, f'The body must be a JSON object with 2 to {len(LABELS)} "document_ids"')
+        document_ids = list(dict.fromkeys(document_ids))
+        names = self._strings(body, "names") or document_ids
+        if len(names) != len(document_ids):
+            raise HTTPException(400, '"names" must have one name per document id')
+        documents = [(document_id, "".join(self._pages(document_id))) for document_id in document_ids]
+
+        try:
+            rows, answer, sent_tokens = await run_in_threadpool(
+                self.pipeline.compare_contracts, self.clause_index, documents, names
+            )
+        except ValueError as e:
+            raise HTTPException(422, str(e))
+        return JSONResponse({
+            "documents": [{"label": LABELS[i], "document_id": d, "name": n}
+                          for i, (d, n) in enumerate(zip(document_ids, names))],
+            "clauses": [
+                {
+                    "heading": row["heading"],
+                    "category": row["category"],
+                    "status": row["status"],
+                    # Each contract's clause number, or None where it has no such clause
+                    "numbers": [clause and clause["number"] for clause in row["clauses"]],
+                }
+                for row in rows
+            ],
+            "diff": clause_diff(rows, names),
+            "answer": answer,
+            "sent_tokens": sent_tokens,
+            "contract_tokens": sum(count_tokens(text) for _, text in documents),
+        })
+
+
+async def _http_error(request, exc):
+    return JSONResponse({"error": exc.detail}, status_code=exc.status_code)
+
+
+async def _api_error(request, exc):
+    logger.error("%s %s: OpenAI call failed after retries: %s", request.method, request.url.path, exc)
+    return JSONResponse({"error": AI_UNAVAILABLE}, status_code=503)
+
+
+def create_app(pipeline, question_cache=None, limiter=None, api_token=None, threads=40, **service_options):
+    """Returns the Starlette app serving `pipeline`; see `ContractService` for the options.
+
+    `threads` is the number of worker threads blocking steps (model calls, PDF
+    extraction) run on, i.e. how many of them can be in progress at once.
+    """
+    service = ContractService(pipeline, question_cache=question_cache, limiter=limiter, **service_options)
+
+    @asynccontextmanager
+    async def lifespan(app):
+        anyio.to_thread.current_default_thread_limiter().total_tokens = threads
+        yield
+
+    app = Starlette(
+        routes=service.routes(),
+        exception_handlers={HTTPException: _http_error, APIError: _api_error},
+        lifespan=lifespan,
+    )
+    if api_token:
+        app.add_middleware(BearerTokenMiddleware, token=api_token)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--threads", type=int, default=40, help="blocking steps (model calls, extraction) run at once")
+    parser.add_argument("--api-token", default=os.environ.get("SERVICE_API_TOKEN"),
+                        help="require this bearer token on every request but /health")
+    parser.add_argument("--max-upload-mb", type=int, default=50)
+    parser.add_argument("--rpm", type=int, default=500, help="OpenAI requests per minute to stay under")
+    parser.add_argument("--tpm", type=int, default=30000, help="OpenAI tokens per minute to stay under")
+    parser.add_argument("--llm-cache-path", default=".cache/llm_responses.sqlite3")
+    parser.add_argument("--no-cache", action="store_true", help="always call the model")
+    parser.add_argument("--doc-cache-size", type=int, default=128, help="documents kept in memory")
+    parser.add_argument("--doc-cache-max-mb", type=int, default=512, help="memory for extracted text")
+    parser.add_argument("--clause-index-max-mb", type=int, default=64, help="memory for clauses kept for comparison")
+    parser.add_argument("--doc-cache-dir", help="also keep documents on disk here, so they survive restarts")
+    parser.add_argument("--qa-cache-threshold", type=float, default=0.8)
+    parser.add_argument("--metrics-jsonl-path", help="append a record per OpenAI call to this file")
+    parser.add_argument("--context-token-budget", type=int, default=100000)
+    parser.add_argument("--map-workers", type=int, default=4)
+    parser.add_argument("--pdf-workers", type=int)
+    parser.add_argument("--small-model", default=DEFAULT_TIER_MODELS["small"],
+                        help="model for metadata, clause labels, jargon and glossary (see routing.py)")
+    parser.add_argument("--large-model", default=DEFAULT_TIER_MODELS["large"],
+                        help="model for the other actions and for answers the small model got wrong")
+    args = parser.parse_args()
+
+    logging.basicConfig(format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    logger.setLevel(logging.INFO)
+    limiter = RateLimiter(rpm=args.rpm, tpm=args.tpm)
+    pipeline = ContractPipeline(
+        # Retries are handled by the limiter, which backs off for every request at once
+        create_client(max_connections=args.threads),
+        cache=None if args.no_cache else ResponseCache(args.llm_cache_path),
+        doc_cache=DocumentCache(
+            max_items=args.doc_cache_size,
+            disk_dir=args.doc_cache_dir,
+            max_bytes=args.doc_cache_max_mb * 1024 * 1024,
+        ),
+        metrics=MetricsRecorder(jsonl_path=args.metrics_jsonl_path),
+        context_budget=args.context_token_budget,
+        map_workers=args.map_workers,
+        pdf_workers=args.pdf_workers,
+        router=ModelRouter(tier_models={"small": args.small_model, "large": args.large_model}),
+        limiter=limiter,
+    )
+    app = create_app(
+        pipeline,
+        question_cache=QuestionCache(threshold=args.qa_cache_threshold),
+        limiter=limiter,
+        api_token=args.api_token,
+        threads=args.threads,
+        max_upload_bytes=args.max_upload_mb * 1024 * 1024,
+        clause_index=ClauseIndex(max_bytes=args.clause_index_max_mb * 1024 * 1024),
+    )
+    try:
+        uvicorn.run(app, host=args.host, port=args.port)
+    finally:
+        shutdown_pool()
+
+
+if __name__ == "__main__":
+    main()
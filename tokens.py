@@ -0,0 +1,27 @@
+"""Token counting for prompt budgeting and reporting.
+
+Uses tiktoken when it is installed and falls back to the usual ~4 characters
+per token estimate otherwise.
+"""
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+_encoding = None
+
+
+def encode(text):
+    """Returns the text's tokens (4 character slices without tiktoken)."""
+    global _encoding
+    if tiktoken is None:
+        return [text[i:i + 4] for i in range(0, len(text), 4)]
+    if _encoding is None:
+        _encoding = tiktoken.get_encoding("o200k_base")
+    return _encoding.encode(text, disallowed_special=())
+
+
+def count_tokens(text):
+    if tiktoken is None:
+        return (len(text) + 3) // 4
+    return len(encode(text))